@@ -0,0 +1,81 @@
+"""
+融合模式与两次调用模式的端到端延迟对比
+
+用法：
+    export DASHSCOPE_API_KEY="your_api_key"
+    python benchmarks/bench_fused.py --rounds 5 --stream
+    python benchmarks/bench_fused.py --mock   # 使用本地模拟服务，不需要API密钥
+"""
+import argparse
+import statistics
+import time
+
+from ser import GaitGenerator
+from ser.mock_server import MockLLMServer
+
+TEXTS = [
+    "快向左转！",
+    "慢慢向右移动",
+    "好想休息一下",
+    "这个项目很难，但我相信我一定可以的！",
+    "谢谢你的夸奖哦，我都有点不好意思了",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(generator: GaitGenerator, rounds: int, stream: bool):
+    latencies = []
+    results = []
+    for _ in range(rounds):
+        for text in TEXTS:
+            start = time.perf_counter()
+            result = generator.generate(text, stream=stream)
+            latencies.append(time.perf_counter() - start)
+            results.append(result)
+        generator.reset_history()
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GaitGenerator 融合模式延迟对比")
+    parser.add_argument("--rounds", type=int, default=3, help="每种模式跑几轮全部样例")
+    parser.add_argument("--stream", action="store_true", help="使用流式输出")
+    parser.add_argument("--base-url", default="https://dashscope.aliyuncs.com/compatible-mode/v1")
+    parser.add_argument("--model", default="qwen3-omni-flash")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--mock", action="store_true", help="启动本地模拟服务代替真实API")
+    args = parser.parse_args()
+
+    server = None
+    if args.mock:
+        server = MockLLMServer().start()
+        args.base_url = server.base_url
+        args.api_key = args.api_key or "mock"
+
+    print(f"{'mode':<10}{'n':>5}{'mean(s)':>10}{'p50(s)':>10}{'p95(s)':>10}")
+    for fused in (False, True):
+        generator = GaitGenerator(
+            api_key=args.api_key,
+            base_url=args.base_url,
+            model=args.model,
+            fused=fused,
+        )
+        latencies, _ = run(generator, args.rounds, args.stream)
+        mode = "fused" if fused else "two-call"
+        print(
+            f"{mode:<10}{len(latencies):>5}"
+            f"{statistics.mean(latencies):>10.3f}"
+            f"{percentile(latencies, 50):>10.3f}"
+            f"{percentile(latencies, 95):>10.3f}"
+        )
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
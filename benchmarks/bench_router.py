@@ -0,0 +1,91 @@
+"""
+多端点路由测试：启动几个延迟和错误率不同的本地模拟服务，对比单端点与EndpointRouter的延迟
+
+用法：
+    python benchmarks/bench_router.py --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from ser import SessionManager
+from ser.mock_server import MockLLMServer
+from ser.router import Endpoint, EndpointRouter
+
+TEXTS = [
+    "快向左转！",
+    "慢慢向右移动",
+    "好想休息一下",
+    "这个项目很难，但我相信我一定可以的！",
+    "谢谢你的夸奖哦，我都有点不好意思了",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(manager: SessionManager, requests: int, concurrency: int):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await manager.agenerate(f"bench-{i % 20}", TEXTS[i % len(TEXTS)], stream=True)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EndpointRouter 与单端点的延迟对比（本地模拟服务）")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    servers = {
+        "slow": MockLLMServer(ttft=0.4, tokens_per_second=200.0).start(),
+        "fast": MockLLMServer(ttft=0.1, tokens_per_second=200.0).start(),
+        "flaky": MockLLMServer(ttft=0.05, tokens_per_second=200.0, error_rate=0.3).start(),
+    }
+    router = EndpointRouter(
+        [Endpoint(server.base_url, api_key="mock", name=name, max_concurrency=8) for name, server in servers.items()]
+    )
+    setups = [("slow only", dict(base_url=servers["slow"].base_url)), ("router", dict(backend=router))]
+
+    print(f"{'setup':<12}{'n':>5}{'errors':>8}{'mean(s)':>10}{'p50(s)':>10}{'p95(s)':>10}")
+    try:
+        for label, options in setups:
+            manager = SessionManager(api_key="mock", **options)
+            latencies, errors = asyncio.run(run(manager, args.requests, args.concurrency))
+            print(
+                f"{label:<12}{len(latencies):>5}{errors:>8}"
+                f"{statistics.mean(latencies):>10.3f}"
+                f"{percentile(latencies, 50):>10.3f}"
+                f"{percentile(latencies, 95):>10.3f}"
+            )
+        print()
+        for row in router.stats():
+            ttft = f"{row['ttft']:.3f}" if row["ttft"] is not None else "-"
+            latency = f"{row['latency']:.3f}" if row["latency"] is not None else "-"
+            print(
+                f"{row['name']:<8} ttft={ttft} latency={latency} error_rate={row['error_rate']:.2f} "
+                f"requests={row['requests']} errors={row['errors']} fallbacks={row['fallbacks']}"
+            )
+    finally:
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+ser serve 的吞吐与延迟测试：启动本地模拟LLM服务和推理服务，用并发客户端请求 /gait
+
+用法：
+    python benchmarks/bench_server.py --workers 2 --clients 64 --requests 1000
+    python benchmarks/bench_server.py --max-queue 16 --clients 128   # 观察队列满时的503
+    python benchmarks/bench_server.py --check --workers 2            # 检查状态码、队列满时的503和SIGTERM后的排空
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from ser.mock_server import MockLLMServer
+
+TEXTS = [
+    "快向左转！",
+    "慢慢向右移动",
+    "好想休息一下",
+    "这个项目很难，但我相信我一定可以的！",
+    "谢谢你的夸奖哦，我都有点不好意思了",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def drive(url: str, clients: int, requests: int, sessions: int):
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+
+    async def client(http: httpx.AsyncClient):
+        for i in counter:
+            start = time.perf_counter()
+            response = await http.post(
+                f"{url}/gait",
+                json={"session_id": f"bench-{i % sessions}", "text": TEXTS[i % len(TEXTS)]},
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(http) for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def wait_ready(url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while True:
+            try:
+                await http.get(f"{url}/health")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def start_server(port: int, workers: int, concurrency: int, max_queue: int, base_url: str, history_db: str,
+                 fused: bool = False) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "ser.server", "serve",
+        "--port", str(port),
+        "--workers", str(workers),
+        "--concurrency", str(concurrency),
+        "--max-queue", str(max_queue),
+        "--base-url", base_url,
+        "--api-key", "mock",
+        "--history-db", history_db,
+    ]
+    if fused:
+        command.append("--fused")
+    return subprocess.Popen(command)
+
+
+async def check_server(url: str, server: subprocess.Popen, burst: int):
+    """检查服务的行为，不满足时抛出AssertionError"""
+    async with httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=burst)) as http:
+        response = await http.get(f"{url}/health")
+        assert response.status_code == 200 and response.json()["status"] == "ok", response.text
+        response = await http.post(f"{url}/gait", json={"session_id": "check", "text": TEXTS[0]})
+        assert response.status_code == 200, (response.status_code, response.text)
+        assert {"y_vel", "yaw_vel", "freq_offset"} <= set(response.json()), response.text
+        response = await http.post(f"{url}/gait", json={"session_id": "check"})
+        assert response.status_code == 400, response.status_code
+        response = await http.get(f"{url}/gait")
+        assert response.status_code == 405, response.status_code
+        response = await http.get(f"{url}/unknown")
+        assert response.status_code == 404, response.status_code
+
+        # 并发请求超过concurrency+max_queue时，多出的请求立即得到503和Retry-After
+        responses = await asyncio.gather(*[
+            http.post(f"{url}/gait", json={"session_id": f"check-{i}", "text": TEXTS[i % len(TEXTS)]})
+            for i in range(burst)
+        ])
+        statuses = [response.status_code for response in responses]
+        assert set(statuses) <= {200, 503}, statuses
+        rejected = [response for response in responses if response.status_code == 503]
+        assert rejected and 200 in statuses, statuses
+        assert all(response.headers.get("retry-after") for response in rejected), "503 without Retry-After"
+
+    # SIGTERM之后已接受的请求仍然完成，服务正常退出
+    async with httpx.AsyncClient(timeout=30.0) as http:
+        accepted = [
+            asyncio.ensure_future(http.post(f"{url}/gait", json={"session_id": f"drain-{i}", "text": TEXTS[i]}))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0.1)
+        server.send_signal(signal.SIGTERM)
+        statuses = [response.status_code for response in await asyncio.gather(*accepted)]
+        assert statuses == [200, 200], statuses
+    returncode = await asyncio.get_running_loop().run_in_executor(None, server.wait, 30)
+    assert returncode == 0, returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ser serve 吞吐与延迟测试（本地模拟LLM服务）")
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=32, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=500, help="总请求数")
+    parser.add_argument("--sessions", type=int, default=50, help="请求分布到多少个会话")
+    parser.add_argument("--ttft", type=float, default=0.05, help="模拟服务的首token延迟（秒）")
+    parser.add_argument("--fused", action="store_true")
+    parser.add_argument("--check", action="store_true", help="检查状态码、队列满时的503+Retry-After和SIGTERM后的排空，不测吞吐")
+    args = parser.parse_args()
+
+    history_db = os.path.join(tempfile.mkdtemp(), "history.db")
+    url = f"http://127.0.0.1:{args.port}"
+    if args.check:
+        # 每个进程只处理1个请求、排队1个，首token足够慢，保证突发请求中有一部分被拒绝
+        llm = MockLLMServer(ttft=0.3, tokens_per_second=2000.0).start()
+        server = start_server(args.port, args.workers, 1, 1, llm.base_url, history_db, args.fused)
+        try:
+            asyncio.run(wait_ready(url))
+            asyncio.run(check_server(url, server, burst=8 * args.workers))
+        finally:
+            if server.poll() is None:
+                server.kill()
+                server.wait()
+            llm.stop()
+        print("server check passed")
+        return
+
+    llm = MockLLMServer(ttft=args.ttft, tokens_per_second=2000.0).start()
+    server = start_server(
+        args.port, args.workers, args.concurrency, args.max_queue, llm.base_url, history_db, args.fused
+    )
+    try:
+        asyncio.run(wait_ready(url))
+        latencies, statuses, elapsed = asyncio.run(drive(url, args.clients, args.requests, args.sessions))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+        llm.stop()
+
+    print(f"{'workers':>8}{'clients':>9}{'req/s':>9}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}{'503':>6}")
+    ok = len(latencies)
+    print(
+        f"{args.workers:>8}{args.clients:>9}{ok / elapsed:>9.1f}"
+        f"{percentile(latencies, 50) if ok else 0:>9.3f}"
+        f"{percentile(latencies, 95) if ok else 0:>9.3f}"
+        f"{percentile(latencies, 99) if ok else 0:>9.3f}"
+        f"{statuses.get(503, 0):>6}"
+    )
+    other = {status: count for status, count in statuses.items() if status not in (200, 503)}
+    if other:
+        print(f"other status codes: {other}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+基于本地模拟服务的基准测试：在不同并发数和流式/非流式模式下驱动
+LLMClient、TextEmotionRecognizer、MotionGenerator和GaitGenerator，
+报告吞吐量、p50/p95/p99延迟和内存占用，不需要API密钥，也不产生调用费用。
+
+用法：
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --targets gait --concurrency 1,16,64 --requests 200
+    python benchmarks/run_benchmarks.py --mock-ttft 0 --mock-tps 0          # 只测本包自身的开销
+    python benchmarks/run_benchmarks.py --mock-outlier-rate 0.03 --hedge  # 偶发慢请求下对冲请求的效果
+    python benchmarks/run_benchmarks.py --targets emotion,gait --label-mode  # 情感识别只输出标签
+    python benchmarks/run_benchmarks.py --json results.json               # 保存结果便于对比回归
+    python benchmarks/run_benchmarks.py --base-url http://127.0.0.1:8000/v1  # 使用已启动的服务
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+from ser import GaitGenerator, LLMClient, MotionGenerator, TextEmotionRecognizer
+from ser.batch import run_batch
+from ser.hedging import HedgingBackend
+from ser.mock_server import MockLLMServer
+
+TEXTS = [
+    "快向左转！",
+    "慢慢向右移动",
+    "好想休息一下",
+    "这个项目很难，但我相信我一定可以的！",
+    "谢谢你的夸奖哦，我都有点不好意思了",
+]
+
+TARGETS = ("llm", "emotion", "motion", "gait")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def build_call(target: str, base_url: str, api_key: str, stream: bool, backend=None, label_mode: bool = False):
+    """构造一个处理单条文本的函数，每次调用都是无状态请求"""
+    if target == "llm":
+        client = LLMClient(api_key=api_key, base_url=base_url, backend=backend)
+
+        def call(text):
+            completion = client.chat([{"type": "text", "text": text}], stream=stream, history=[])
+            if stream:
+                for _ in completion:
+                    pass
+        return call
+    if target == "emotion":
+        recognizer = TextEmotionRecognizer(api_key=api_key, base_url=base_url, backend=backend, label_mode=label_mode)
+        return lambda text: recognizer.recognize(text, stream=stream, history=[])
+    if target == "motion":
+        motion_generator = MotionGenerator(api_key=api_key, base_url=base_url, backend=backend)
+        return lambda text: motion_generator.generate(text, emotion="normal", stream=stream, history=[])
+    generator = GaitGenerator(api_key=api_key, base_url=base_url, backend=backend, label_mode=label_mode)
+    return lambda text: generator.generate(text, stream=stream, history={})
+
+
+def run_scenario(call, requests: int, concurrency: int, trace_memory: bool):
+    def timed(text):
+        start = time.perf_counter()
+        call(text)
+        return time.perf_counter() - start
+
+    # 预热：建立连接、初始化客户端
+    run_batch(timed, TEXTS[:min(concurrency, len(TEXTS))], max_workers=concurrency)
+
+    items = [TEXTS[i % len(TEXTS)] for i in range(requests)]
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    results = run_batch(timed, items, max_workers=concurrency)
+    elapsed = time.perf_counter() - start
+    heap_peak = None
+    if trace_memory:
+        heap_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    latencies = [result for result in results if not isinstance(result, Exception)]
+    errors = len(results) - len(latencies)
+    if not latencies:
+        return {"requests": requests, "errors": errors}
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+        "heap_peak_mb": heap_peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的基准测试")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="逗号分隔：llm,emotion,motion,gait")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发数")
+    parser.add_argument("--stream", choices=("both", "on", "off"), default="both", help="流式模式")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--mock-ttft", type=float, default=0.2, help="模拟服务的首token延迟（秒）")
+    parser.add_argument("--mock-tps", type=float, default=50.0, help="模拟服务的输出速度（token/秒），0表示不限速")
+    parser.add_argument("--mock-outlier-rate", type=float, default=0.0, help="模拟服务中慢请求的比例")
+    parser.add_argument("--mock-outlier-delay", type=float, default=3.0, help="慢请求额外的首token延迟（秒）")
+    parser.add_argument("--hedge", action="store_true", help="使用HedgingBackend发送对冲请求")
+    parser.add_argument("--label-mode", action="store_true", help="情感识别使用标签模式")
+    parser.add_argument("--base-url", default=None, help="使用已有的服务而不是启动模拟服务")
+    parser.add_argument("--api-key", default="mock")
+    parser.add_argument("--trace-memory", action="store_true", help="用tracemalloc统计Python堆内存峰值（会拖慢运行）")
+    parser.add_argument("--json", default=None, help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    targets = [target for target in args.targets.split(",") if target]
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target: {target}")
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+    streams = {"both": (False, True), "on": (True,), "off": (False,)}[args.stream]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = MockLLMServer(
+            ttft=args.mock_ttft,
+            tokens_per_second=args.mock_tps,
+            outlier_rate=args.mock_outlier_rate,
+            outlier_delay=args.mock_outlier_delay,
+        ).start()
+        base_url = server.base_url
+
+    rows = []
+    print(
+        f"{'target':<9}{'stream':<8}{'conc':>5}{'n':>6}{'err':>5}{'req/s':>9}"
+        f"{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}{'rss(MB)':>9}{'heap(MB)':>10}"
+    )
+    try:
+        for target in targets:
+            for stream in streams:
+                backend = HedgingBackend() if args.hedge else None
+                call = build_call(target, base_url, args.api_key, stream, backend, args.label_mode)
+                for concurrency in concurrencies:
+                    row = run_scenario(call, args.requests, concurrency, args.trace_memory)
+                    row.update({"target": target, "stream": stream, "concurrency": concurrency})
+                    rows.append(row)
+                    if "throughput" not in row:
+                        print(f"{target:<9}{str(stream):<8}{concurrency:>5}{row['requests']:>6}{row['errors']:>5}  all failed")
+                        continue
+                    heap = f"{row['heap_peak_mb']:>10.1f}" if row["heap_peak_mb"] is not None else f"{'-':>10}"
+                    print(
+                        f"{target:<9}{str(stream):<8}{concurrency:>5}{row['requests']:>6}{row['errors']:>5}"
+                        f"{row['throughput']:>9.1f}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}"
+                        f"{row['peak_rss_mb']:>9.1f}{heap}"
+                    )
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
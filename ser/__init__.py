@@ -1,8 +1,12 @@
-from .llm_client import LLMClient
+from .cache import ResponseCache
+from .command_matcher import CommandMatcher
+from .transport import HttpPoolConfig, TransportRegistry
+from .metrics import MetricsRegistry
+from .llm_client import LLMClient, AsyncLLMClient
 from .emotion_recognizer import TextEmotionRecognizer
 from .motion_generator import MotionGenerator
 from .gait_generator import GaitGenerator
+from .session import SessionManager
+from .gait_publisher import GaitPublisher
 
-__all__ = ["LLMClient", "TextEmotionRecognizer", "MotionGenerator", "GaitGenerator"]
-
-
+__all__ = ["LLMClient", "AsyncLLMClient", "TextEmotionRecognizer", "MotionGenerator", "GaitGenerator", "ResponseCache", "CommandMatcher", "HttpPoolConfig", "TransportRegistry", "SessionManager", "MetricsRegistry", "GaitPublisher"]
@@ -0,0 +1,282 @@
+"""
+语音输入：本地能量VAD切分语句，把每段语音编码为qwen3-omni的input_audio消息内容
+
+麦克风每次送来一块PCM数据（NumPy数组），检测到一句话结束（静音超过max_silence_ms）时
+立即得到一个AudioSegment，不需要单独的ASR步骤：
+
+    segmenter = UtteranceSegmenter(sample_rate=16000)
+    for pcm in microphone:
+        for segment in segmenter.feed(pcm):
+            result = recognizer.recognize(audio=segment, stream=True)
+"""
+import base64
+import struct
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+WAV_HEADER_SIZE = 44
+# 没有文本的语音消息写入对话历史时使用的占位文本
+AUDIO_PLACEHOLDER = "（语音输入）"
+
+
+def _to_int16(pcm: np.ndarray) -> np.ndarray:
+    """浮点PCM（-1.0~1.0）转换为int16，int16输入原样返回"""
+    if pcm.dtype == np.int16:
+        return pcm
+    if np.issubdtype(pcm.dtype, np.floating):
+        return (np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16)
+    return pcm.astype(np.int16)
+
+
+class EnergyVAD:
+    """
+    基于帧能量的语音活动检测
+
+    每帧的RMS能量高于 max(min_rms, 噪声基底 * ratio) 时判为语音；噪声基底取静音帧能量的滑动平均。
+    一次调用对整块数据的所有帧一起计算能量，耗时在微秒级。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        ratio: float = 3.0,
+        min_rms: float = 300.0,
+        noise_smoothing: float = 0.05,
+    ):
+        """
+        初始化能量VAD
+
+        Args:
+            sample_rate: 采样率（Hz）
+            frame_ms: 帧长（毫秒）
+            ratio: 语音帧能量相对噪声基底的最小倍数
+            min_rms: 语音帧的最小RMS能量（int16幅度）
+            noise_smoothing: 噪声基底滑动平均的系数，越大适应环境噪声越快
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.noise_smoothing = noise_smoothing
+        self.noise_floor = min_rms / ratio
+
+    def frame_energy(self, frames: np.ndarray) -> np.ndarray:
+        """frames为(帧数, 帧长)的int16数组，返回每帧的RMS能量"""
+        samples = frames.astype(np.float32)
+        return np.sqrt(np.mean(samples * samples, axis=1))
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        """
+        判断每帧是否为语音
+
+        Args:
+            frames: (帧数, 帧长)的int16数组
+
+        Returns:
+            长度为帧数的布尔数组
+        """
+        energy = self.frame_energy(frames)
+        voiced = energy > max(self.min_rms, self.noise_floor * self.ratio)
+        silent = energy[~voiced]
+        if silent.size:
+            self.noise_floor += self.noise_smoothing * (float(silent.mean()) - self.noise_floor)
+        return voiced
+
+
+class AudioSegment:
+    """
+    一段语音，样本直接保存在WAV格式的缓冲区中
+
+    data为完整的WAV文件（bytearray），samples为其中PCM部分的int16视图，二者共用内存。
+    """
+
+    __slots__ = ("data", "samples", "sample_rate", "forced")
+
+    def __init__(self, data: bytearray, sample_rate: int, forced: bool = False):
+        self.data = data
+        self.samples = np.frombuffer(data, dtype="<i2", offset=WAV_HEADER_SIZE)
+        self.sample_rate = sample_rate
+        self.forced = forced
+
+    @property
+    def duration(self) -> float:
+        """时长（秒）"""
+        return len(self.samples) / self.sample_rate
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
+
+    def to_content(self) -> Dict:
+        """编码为OpenAI兼容接口（qwen3-omni）的input_audio消息内容"""
+        return {
+            "type": "input_audio",
+            "input_audio": {"data": f"data:;base64,{self.to_base64()}", "format": "wav"},
+        }
+
+
+def _write_wav_header(buffer: bytearray, num_samples: int, sample_rate: int):
+    data_size = num_samples * 2
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI", buffer, 0,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_size,
+    )
+
+
+class UtteranceSegmenter:
+    """
+    把连续的PCM数据切分成语句
+
+    语音开始后，每帧直接写入预先分配的WAV缓冲区（输入数据只复制这一次），
+    静音超过max_silence_ms时结束语句并去掉末尾的静音，语句长度达到max_utterance_s时强制切分。
+    语音开始前保留pre_roll_ms的音频，避免丢失起始的弱音。非线程安全，每路音频使用一个实例。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        vad: Optional[EnergyVAD] = None,
+        min_speech_ms: int = 200,
+        max_silence_ms: int = 500,
+        pre_roll_ms: int = 200,
+        max_utterance_s: float = 15.0,
+    ):
+        """
+        初始化语句切分器
+
+        Args:
+            sample_rate: 采样率（Hz），单声道
+            vad: 语音活动检测器，None表示使用默认参数的EnergyVAD
+            min_speech_ms: 语音帧累计短于该值的片段视为噪声丢弃
+            max_silence_ms: 语音之后连续静音达到该值时结束语句
+            pre_roll_ms: 语音开始前保留的音频长度
+            max_utterance_s: 单个语句的最大长度（秒）
+        """
+        self.sample_rate = sample_rate
+        self.vad = vad if vad is not None else EnergyVAD(sample_rate)
+        frame_ms = self.vad.frame_size * 1000 / sample_rate
+        self.frame_size = self.vad.frame_size
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.max_silence_frames = max(1, int(max_silence_ms / frame_ms))
+        self.max_samples = int(max_utterance_s * sample_rate) // self.frame_size * self.frame_size
+        self._pre_roll: deque = deque(maxlen=int(pre_roll_ms / frame_ms))
+        self._carry = np.zeros(0, dtype=np.int16)
+        self._buffer: Optional[bytearray] = None
+        self._samples: Optional[np.ndarray] = None
+        self._written = 0
+        self._speech_frames = 0
+        self._silence_frames = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._buffer is not None
+
+    def feed(self, pcm: np.ndarray) -> List[AudioSegment]:
+        """
+        输入一块PCM数据
+
+        Args:
+            pcm: 单声道PCM，int16或-1.0~1.0的浮点数组，长度任意
+
+        Returns:
+            本次输入中结束的语句列表，通常为空或只有一个
+        """
+        pcm = _to_int16(np.asarray(pcm).reshape(-1))
+        if self._carry.size:
+            pcm = np.concatenate((self._carry, pcm))
+        count = len(pcm) // self.frame_size
+        self._carry = pcm[count * self.frame_size:].copy()
+        if not count:
+            return []
+
+        frames = pcm[:count * self.frame_size].reshape(count, self.frame_size)
+        segments = []
+        for frame, voiced in zip(frames, self.vad.is_speech(frames)):
+            if self._buffer is None:
+                if voiced:
+                    self._start()
+                    self._write(frame)
+                    self._speech_frames = 1
+                else:
+                    self._pre_roll.append(frame.copy())
+                continue
+
+            self._write(frame)
+            if voiced:
+                self._speech_frames += 1
+                self._silence_frames = 0
+            else:
+                self._silence_frames += 1
+            if self._silence_frames >= self.max_silence_frames:
+                segment = self._finish(forced=False)
+                if segment is not None:
+                    segments.append(segment)
+            elif self._written >= self.max_samples:
+                segments.append(self._finish(forced=True))
+        return segments
+
+    def flush(self) -> Optional[AudioSegment]:
+        """音频输入结束时调用，返回尚未结束的语句"""
+        if self._buffer is None:
+            return None
+        return self._finish(forced=False)
+
+    def _start(self):
+        capacity = self.max_samples + len(self._pre_roll) * self.frame_size
+        self._buffer = bytearray(WAV_HEADER_SIZE + capacity * 2)
+        self._samples = np.frombuffer(self._buffer, dtype="<i2", offset=WAV_HEADER_SIZE)
+        self._written = 0
+        self._silence_frames = 0
+        for frame in self._pre_roll:
+            self._write(frame)
+        self._pre_roll.clear()
+
+    def _write(self, frame: np.ndarray):
+        self._samples[self._written:self._written + len(frame)] = frame
+        self._written += len(frame)
+
+    def _finish(self, forced: bool) -> Optional[AudioSegment]:
+        buffer, speech_frames = self._buffer, self._speech_frames
+        length = self._written - (0 if forced else self._silence_frames * self.frame_size)
+        self._buffer = None
+        self._samples = None
+        self._speech_frames = 0
+        self._silence_frames = 0
+        if speech_frames < self.min_speech_frames:
+            return None
+        # 截断到实际长度：bytearray缩短不会复制剩余的数据
+        del buffer[WAV_HEADER_SIZE + length * 2:]
+        _write_wav_header(buffer, length, self.sample_rate)
+        return AudioSegment(buffer, self.sample_rate, forced=forced)
+
+
+def audio_content(audio) -> Dict:
+    """
+    把AudioSegment、WAV字节或已经编码好的消息内容统一转换为input_audio消息内容
+
+    Args:
+        audio: AudioSegment、WAV文件的bytes/bytearray，或{"type": "input_audio", ...}字典
+
+    Returns:
+        input_audio消息内容字典
+    """
+    if isinstance(audio, AudioSegment):
+        return audio.to_content()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        data = base64.b64encode(audio).decode("ascii")
+        return {"type": "input_audio", "input_audio": {"data": f"data:;base64,{data}", "format": "wav"}}
+    if isinstance(audio, dict) and audio.get("type") == "input_audio":
+        return audio
+    raise TypeError(f"unsupported audio input: {type(audio).__name__}")
+
+
+def strip_audio(content: List[Dict]) -> List[Dict]:
+    """去掉消息内容中的音频，没有文本时用占位文本代替，用于写入对话历史"""
+    kept = [item for item in content if not (isinstance(item, dict) and item.get("type") == "input_audio")]
+    if len(kept) == len(content):
+        return content
+    return kept or [{"type": "text", "text": AUDIO_PLACEHOLDER}]
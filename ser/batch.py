@@ -0,0 +1,60 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Sequence
+
+from ser.metrics import queued_since
+
+
+def run_batch(func: Callable[[Any], Any], items: Sequence, max_workers: int = 8) -> List:
+    """
+    在有界线程池中对每个条目调用func
+
+    Args:
+        func: 处理单个条目的函数
+        items: 待处理的条目
+        max_workers: 最大并发线程数
+
+    Returns:
+        与items顺序一致的结果列表，抛出异常的条目对应位置为该异常对象
+    """
+    def call(item):
+        # 从提交到开始执行的等待时间计入指标的queue_time
+        with queued_since(submitted):
+            try:
+                return func(item)
+            except Exception as e:
+                return e
+
+    if not items:
+        return []
+    submitted = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="ser-batch") as executor:
+        return list(executor.map(call, items))
+
+
+async def arun_batch(
+    func: Callable[[Any], Awaitable],
+    items: Sequence,
+    concurrency: int = 8,
+) -> List:
+    """
+    run_batch的异步版本，用信号量限制同时进行的协程数
+
+    Args:
+        func: 处理单个条目的协程函数
+        items: 待处理的条目
+        concurrency: 最大并发数
+
+    Returns:
+        与items顺序一致的结果列表，抛出异常的条目对应位置为该异常对象
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(item):
+        submitted = time.perf_counter()
+        async with semaphore:
+            with queued_since(submitted):
+                return await func(item)
+
+    return await asyncio.gather(*(call(item) for item in items), return_exceptions=True)
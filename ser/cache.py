@@ -0,0 +1,221 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+# 影响回复内容的请求参数，参与缓存键计算
+GENERATION_PARAMS = ("max_tokens", "response_format", "temperature", "top_p", "seed")
+
+
+class SQLiteCacheBackend:
+    """ResponseCache的磁盘后端，基于SQLite保存键值与写入时间，进程重启后缓存仍然有效"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, ttl: Optional[float]) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if ttl is not None and time.time() - created > ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    LLM回复缓存，带容量上限的LRU淘汰与TTL过期，可选磁盘后端
+
+    缓存键由模型名、system prompt的哈希、最近的对话历史窗口和本次输入共同决定，
+    同一个实例可以被多个LLMClient共享（不同的system prompt天然对应不同的键），线程安全。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+        history_window: Optional[int] = None,
+        disk_path: Optional[str] = None,
+    ):
+        """
+        初始化回复缓存
+
+        Args:
+            max_size: 内存中最多缓存的条目数，超出后淘汰最久未使用的条目
+            ttl: 条目有效期（秒），None表示永不过期
+            history_window: 参与缓存键计算的历史消息条数，None表示使用全部历史，0表示忽略历史
+            disk_path: SQLite缓存文件路径，不提供则只使用内存缓存
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.history_window = history_window
+        self.disk = SQLiteCacheBackend(disk_path) if disk_path else None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def make_key(
+        self,
+        model: str,
+        system_message: Optional[str],
+        history: List[Dict],
+        content,
+        params: Optional[Dict] = None,
+        partial: bool = False,
+    ) -> str:
+        """
+        计算缓存键
+
+        Args:
+            model: 模型名称
+            system_message: 系统消息
+            history: 本次用户消息之前的对话历史
+            content: 本次用户消息内容
+            params: 请求参数，其中影响回复内容的生成参数（GENERATION_PARAMS）参与计算
+            partial: 回复可能在得到所需结果后被提前截断（见LLMClient.chat的partial），与完整回复使用不同的键
+
+        Returns:
+            十六进制的SHA-256摘要
+        """
+        if self.history_window is not None:
+            history = history[max(len(history) - self.history_window, 0):] if self.history_window else []
+        system_hash = hashlib.sha256((system_message or "").encode("utf-8")).hexdigest()
+        key = [model, system_hash, history, content]
+        generation = {name: params[name] for name in GENERATION_PARAMS if params and params.get(name) is not None}
+        # 没有设置生成参数时键与之前相同，已有的磁盘缓存继续有效
+        if generation:
+            key.append(generation)
+        if partial:
+            key.append({"partial": True})
+        payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl is not None and time.time() - created > self.ttl:
+                    del self._entries[key]
+                    self._stats["expirations"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+
+        if self.disk is not None:
+            value = self.disk.get(key, self.ttl)
+            if value is not None:
+                with self._lock:
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    self._insert(key, value)
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._insert(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _insert(self, key: str, value: str):
+        self._entries[key] = (value, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            包含hits、disk_hits、misses、evictions、expirations、size、hit_rate的字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def build_completion(content: str, model: str) -> ChatCompletion:
+    """用缓存的回复文本构造与真实调用相同类型的非流式响应"""
+    return ChatCompletion(
+        id="cached",
+        object="chat.completion",
+        created=int(time.time()),
+        model=model,
+        choices=[{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+    )
+
+
+def build_chunks(content: str, model: str) -> List[ChatCompletionChunk]:
+    """用缓存的回复文本构造与真实调用相同类型的流式响应块"""
+    return [ChatCompletionChunk(
+        id="cached",
+        object="chat.completion.chunk",
+        created=int(time.time()),
+        model=model,
+        choices=[{
+            "index": 0,
+            "finish_reason": "stop",
+            "delta": {"role": "assistant", "content": content},
+        }],
+    )]
@@ -0,0 +1,90 @@
+import re
+from typing import Dict, Optional
+
+# 与GAIT_PROMPT_CN示例保持一致："快向左转！" → 0.2，"慢慢向右移动" → 0.1
+SPEED_SLOW = 0.1
+SPEED_NORMAL = 0.15
+SPEED_FAST = 0.2
+SPEED_VERY_FAST = 0.3
+
+_LEFT = re.compile(r"左|\bleft\b", re.IGNORECASE)
+_RIGHT = re.compile(r"右|\bright\b", re.IGNORECASE)
+_TURN = re.compile(r"转|掉头|\b(turn|rotate|spin)\b", re.IGNORECASE)
+_MOVE = re.compile(r"移|跨|走|挪|靠|\b(move|step|walk|strafe|shift|go)\b", re.IGNORECASE)
+_FAST = re.compile(r"快|赶紧|迅速|马上|立刻|立即|\b(fast|quick|quickly|hurry|now|immediately)\b", re.IGNORECASE)
+_SLOW = re.compile(r"慢|轻轻|稍微|\b(slow|slowly|gently|slightly|a bit|a little)\b", re.IGNORECASE)
+_NEGATION = re.compile(r"不要|别|不用|停|\b(don't|do not|not|stop|never)\b", re.IGNORECASE)
+_QUESTION = re.compile(r"[?？]|吗|呢|怎么|为什么|能不能|可以.*吗|\b(can|could|should|why|how)\b", re.IGNORECASE)
+_FILLER = re.compile(r"[\s,，.。!！~～、]|请|你|向|往|朝|边|一下|吧|啊|呀|\b(please|to|the|a)\b", re.IGNORECASE)
+
+
+class CommandMatcher:
+    """
+    本地规则匹配器，识别"向左转 / 向右移动 / 快 / 慢慢"一类明确的方向指令
+
+    能直接给出y_vel/yaw_vel及置信度，匹配耗时在微秒级，用于在调用LLM之前拦截简单指令。
+    """
+
+    def __init__(self, max_extra_chars: int = 6):
+        """
+        初始化规则匹配器
+
+        Args:
+            max_extra_chars: 去掉指令词和语气词后允许剩余的字符数，超过后认为句子还有其他内容，置信度降低
+        """
+        self.max_extra_chars = max_extra_chars
+
+    def match(self, text: str) -> Optional[Dict[str, float]]:
+        """
+        匹配方向指令
+
+        Args:
+            text: 用户输入的文本
+
+        Returns:
+            无法识别为明确指令时返回None，否则返回包含以下字段的字典：
+            - y_vel: 平移速度 (-0.3 ~ 0.3)
+            - yaw_vel: 转向速度 (-0.3 ~ 0.3)
+            - confidence: 置信度 (0 ~ 1)
+        """
+        if not text:
+            return None
+
+        left = bool(_LEFT.search(text))
+        right = bool(_RIGHT.search(text))
+        turn = bool(_TURN.search(text))
+        move = bool(_MOVE.search(text))
+        # 方向或动作有歧义、或者是否定句时交给LLM判断
+        if left == right or (not turn and not move) or _NEGATION.search(text):
+            return None
+        if turn and move:
+            return None
+
+        fast_count = len(_FAST.findall(text))
+        slow = bool(_SLOW.search(text))
+        if fast_count and slow:
+            return None
+        if fast_count >= 2:
+            speed = SPEED_VERY_FAST
+        elif fast_count == 1:
+            speed = SPEED_FAST
+        elif slow:
+            speed = SPEED_SLOW
+        else:
+            speed = SPEED_NORMAL
+        value = speed if left else -speed
+
+        confidence = 0.95
+        remainder = text
+        for pattern in (_LEFT, _RIGHT, _TURN, _MOVE, _FAST, _SLOW, _FILLER):
+            remainder = pattern.sub("", remainder)
+        if len(remainder) > self.max_extra_chars:
+            confidence = 0.6
+        if _QUESTION.search(text):
+            confidence = 0.3
+
+        return {
+            "y_vel": value if move else 0.0,
+            "yaw_vel": value if turn else 0.0,
+            "confidence": confidence,
+        }
@@ -1,7 +1,18 @@
+import json
 import re
-from typing import Dict, Optional, List, Tuple
+import threading
+import time
+from typing import Dict, Optional, List, Tuple, Union, AsyncIterator, Iterator, Callable
 
-from ser.llm_client import LLMClient
+from ser.audio import audio_content
+from ser.batch import run_batch, arun_batch
+from ser.cache import ResponseCache
+from ser.history_store import HistoryStore
+from ser.llm_client import LLMClient, AsyncLLMClient
+from ser.local_classifier import LabelLog, LocalEmotionClassifier
+from ser.metrics import MetricsRegistry, stage, timed_parse
+from ser.resilience import DeadlineExceeded
+from ser.transport import HttpPoolConfig
 
 # 情绪编号到名称的映射
 EMOTION_MAP = {
@@ -12,8 +23,55 @@ EMOTION_MAP = {
     4: "afraid",
     5: "shy",
 }
-from ser.src.prompts import EMOTION_PROMPT_CN
+from ser.src.prompts import EMOTION_PROMPT_CN, EMOTION_LABEL_PROMPT_CN, EMOTION_LABEL_JSON_PROMPT_CN
 
+EMOTION_PATTERN = r'\[EMOTION:(\d+)\]'
+_EMOTION_RE = re.compile(EMOTION_PATTERN)
+# 标签模式JSON输出中的情绪编号，如{"emotion": 3}
+EMOTION_JSON_PATTERN = r'"emotion"\s*:\s*(\d+)'
+_EMOTION_JSON_RE = re.compile(EMOTION_JSON_PATTERN)
+# 标签模式的默认max_tokens，足够输出"[EMOTION:n]"或{"emotion": n}
+LABEL_MAX_TOKENS = 16
+
+
+def _to_emotion(emotion_id: int) -> Tuple[int, str]:
+    if emotion_id >= 6 or emotion_id < 0: 
+        print(f"error emotion id {emotion_id}, set to 0")
+        emotion_id = 0
+    return (emotion_id, EMOTION_MAP.get(emotion_id, "normal"))
+
+
+class EmotionTagScanner:
+    """增量扫描流式输出中的[EMOTION:n]标签，标签跨多个chunk时同样可以识别"""
+
+    # 尚未闭合的标签最多占用的尾部长度，如"[EMOTION:123"
+    _MAX_PARTIAL_TAG = 16
+
+    def __init__(self, pattern: re.Pattern = _EMOTION_RE):
+        self.buffer = ""
+        self.emotion: Optional[Tuple[int, str]] = None
+        self.pattern = pattern
+        self._search_from = 0
+
+    def feed(self, delta: str) -> Optional[Tuple[int, str]]:
+        """
+        追加一段增量文本
+
+        Args:
+            delta: 模型输出的增量文本
+
+        Returns:
+            首次检测到标签时返回情绪标签元组 (编号, 名称)，其余情况返回None
+        """
+        self.buffer += delta
+        if self.emotion is not None:
+            return None
+        match = self.pattern.search(self.buffer, self._search_from)
+        if match is None:
+            self._search_from = max(self._search_from, len(self.buffer) - self._MAX_PARTIAL_TAG)
+            return None
+        self.emotion = _to_emotion(int(match.group(1)))
+        return self.emotion
 
 
 class TextEmotionRecognizer:
@@ -27,6 +85,21 @@ class TextEmotionRecognizer:
         audio_config: Optional[Dict] = None,
         max_history: Optional[int] = 4,
         prompt: Optional[str] = EMOTION_PROMPT_CN,
+        cache: Optional[ResponseCache] = None,
+        http_config: Optional[HttpPoolConfig] = None,
+        max_history_tokens: Optional[int] = None,
+        compaction: str = "drop_oldest",
+        compile_prompt: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+        backend=None,
+        local_classifier: Optional[LocalEmotionClassifier] = None,
+        local_threshold: float = 0.9,
+        label_log: Optional[str] = None,
+        label_mode: bool = False,
+        max_tokens: Optional[int] = None,
+        json_output: bool = False,
+        history_store: Optional[HistoryStore] = None,
+        session_id: Optional[str] = None,
     ):
         """
         初始化文本情感识别器
@@ -38,7 +111,29 @@ class TextEmotionRecognizer:
             modalities: 输出模态
             audio_config: 音频配置
             max_history: 最大历史消息条数
+            cache: 回复缓存，相同的输入和历史直接返回缓存的回复
+            http_config: HTTP连接池配置，相同base_url与配置的客户端在进程内共用一个连接池
+            max_history_tokens: 每次请求的prompt token预算，None表示只按条数限制
+            compaction: 历史超出token预算时的压缩策略，"drop_oldest"、"labels_only"或"summarize"
+            compile_prompt: 是否编译prompt（去掉缩进和Markdown装饰），减少每次请求的token数
+            metrics: 指标注册表，记录排队时间、首token延迟、总耗时、解析耗时和token用量，None表示不记录
+            backend: 替代chat.completions.create的后端，如ser.replay.RecordingBackend/ReplayBackend
+            local_classifier: 本地情感分类器，置信度不低于local_threshold的纯文本输入直接使用本地结果，不调用LLM
+            local_threshold: 本地分类器的最低置信度，低于该值时仍调用LLM
+            label_log: 记录（文本, LLM情绪标签）的JSON Lines文件路径，用于训练本地分类器，None表示不记录
+            label_mode: 标签模式，模型只输出情绪标签而不回复对话，prompt为默认值时换成EMOTION_LABEL_PROMPT_CN；
+                        返回的response为空字符串，对话历史中的助手消息只保留标签
+            max_tokens: 每次回复的最大token数，None表示标签模式下使用LABEL_MAX_TOKENS，否则不限制
+            json_output: 标签模式下使用JSON结构化输出（response_format为json_object），标签格式为{"emotion": 编号}
+            history_store: 对话历史存储（见ser.history_store），None表示历史只保存在内存中
+            session_id: 会话在history_store中的标识
         """
+        if json_output and not label_mode:
+            raise ValueError("json_output requires label_mode")
+        if label_mode and prompt == EMOTION_PROMPT_CN:
+            prompt = EMOTION_LABEL_JSON_PROMPT_CN if json_output else EMOTION_LABEL_PROMPT_CN
+        if label_mode and max_tokens is None:
+            max_tokens = LABEL_MAX_TOKENS
         self.llm_client = LLMClient(
             api_key=api_key,
             base_url=base_url,
@@ -47,74 +142,452 @@ class TextEmotionRecognizer:
             audio_config=audio_config,
             max_history=max_history,
             system_message=prompt,
+            cache=cache,
+            http_config=http_config,
+            max_history_tokens=max_history_tokens,
+            compaction=compaction,
+            compile_prompt=compile_prompt,
+            metrics=metrics,
+            backend=backend,
+            metrics_stage="emotion",
+            keep_audio_history=False,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"} if json_output else None,
+            history_store=history_store,
+            session_id=session_id,
         )
+        self._async_llm_client: Optional[AsyncLLMClient] = None
+        self.metrics = metrics
+        self.local_classifier = local_classifier
+        self.local_threshold = local_threshold
+        self.label_log: Optional[LabelLog] = LabelLog(label_log) if label_log is not None else None
+        self._local_lock = threading.Lock()
+        self._local_stats = {"local": 0, "escalated": 0, "agreed": 0}
+        self.label_mode = label_mode
+        self.json_output = json_output
+    
+    @property
+    def async_llm_client(self) -> AsyncLLMClient:
+        """与同步客户端共享对话历史的异步客户端，首次使用时创建"""
+        if self._async_llm_client is None:
+            self._async_llm_client = AsyncLLMClient.from_client(self.llm_client)
+        return self._async_llm_client
+    
+    def _build_content(self, text: Optional[str], audio=None) -> List[Dict]:
+        content = []
+        
+        if audio is not None:
+            content.append(audio_content(audio))
+        if text:
+            content.append({
+                "type": "text",
+                "text": text,
+            })
+        elif audio is None:
+            raise ValueError("not text provided")
+        return content
+    
+    def _local_answer(
+        self,
+        text: Optional[str],
+        audio=None,
+        history: Optional[List[Dict]] = None,
+    ) -> Optional[Dict[str, any]]:
+        """
+        用本地分类器识别纯文本输入，置信度足够时直接返回结果
+
+        标签模式下按LLM调用的格式把用户消息和情绪标签写入对话历史；普通模式的prompt要求
+        先回复再给标签，本地没有回复内容，只有标签的助手消息会让模型学着不再回复，所以不写入历史
+        
+        Returns:
+            置信度足够时返回识别结果（response为空字符串），否则返回None
+        """
+        if self.local_classifier is None or audio is not None or not text:
+            return None
+        emotion_id, confidence = self.local_classifier.predict(text)
+        if confidence < self.local_threshold:
+            with self._local_lock:
+                self._local_stats["escalated"] += 1
+            return None
+        
+        emotion = _to_emotion(emotion_id)
+        if self.label_mode:
+            messages = self.llm_client.messages if history is None else history
+            messages.extend([
+                {"role": "user", "content": self._build_content(text)},
+                {"role": "assistant", "content": self._format_label(emotion[0])},
+            ])
+        with self._local_lock:
+            self._local_stats["local"] += 1
+        return {"emotion": emotion, "response": ""}
+    
+    def _observe_label(self, content: List[Dict], emotion: Tuple[int, str]):
+        """记录LLM给出的情绪标签，并统计本地分类器与LLM的一致情况；含音频的输入不记录"""
+        if self.label_log is None and self.local_classifier is None:
+            return
+        if any(item.get("type") != "text" for item in content):
+            return
+        text = "".join(item["text"] for item in content)
+        if self.label_log is not None:
+            self.label_log.write(text, emotion[0])
+        if self.local_classifier is not None:
+            agreed = self.local_classifier.predict(text)[0] == emotion[0]
+            with self._local_lock:
+                self._local_stats["agreed"] += agreed
+    
+    def local_stats(self) -> Dict[str, float]:
+        """
+        获取本地分类器统计
+        
+        Returns:
+            包含local（本地直接回答次数）、escalated（置信度不足转交LLM的次数）、
+            agreed（转交LLM的输入中本地预测与LLM一致的次数）、agreement（agreed占escalated的比例）的字典
+        """
+        with self._local_lock:
+            stats = dict(self._local_stats)
+        stats["agreement"] = stats["agreed"] / stats["escalated"] if stats["escalated"] else 0.0
+        return stats
+    
+    def _format_label(self, emotion_id: int) -> str:
+        if self.json_output:
+            return json.dumps({"emotion": emotion_id})
+        return f"[EMOTION:{emotion_id}]"
+    
+    def _store_label(self, history: Optional[List[Dict]], emotion: Tuple[int, str]):
+        """标签模式下把本轮写入历史的助手回复替换为规范的情绪标签"""
+        if not self.label_mode:
+            return
+        messages = self.llm_client.messages if history is None else history
+        if messages and messages[-1].get("role") == "assistant":
+            messages[-1] = {"role": "assistant", "content": self._format_label(emotion[0])}
     
     def recognize(
         self,
         text: Optional[str] = None,
         stream: bool = False,
+        on_emotion: Optional[Callable[[Tuple[int, str]], None]] = None,
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        audio=None,
     ) -> Dict[str, any]:
         """
-        识别文本和/或音频的情感
+        识别文本的情感
         
         Args:
             text: 用户输入的文本
-            audio_url: 音频文件的URL或base64编码的音频数据
-            audio_format: 音频格式，默认为"wav"
             stream: 是否使用流式输出，默认为False
+            on_emotion: 识别到情绪后的回调，参数为情绪标签元组；流式输出时在标签出现的瞬间触发
+            label_only: 是否只需要情绪标签，为True时强制流式输出，并在标签出现后立即关闭HTTP流。
+                        默认prompt要求标签在回复的最后一行，标签出现时回复已基本结束，几乎不能缩短耗时；
+                        配合label_mode=True或把标签放在回复开头的自定义prompt使用才有效果
+            history: 外部对话历史列表，提供时使用并更新该列表而非识别器自身的历史
+            timeout: 本次识别的时间预算（秒），流式输出时超过预算仍未出现情绪标签则关闭HTTP流并抛出DeadlineExceeded，
+                     已出现标签则返回已收到的部分回复
+            audio: 语音输入，ser.audio.AudioSegment、WAV字节或input_audio消息内容；可以与text同时提供，
+                   qwen3-omni的音频输入需要stream=True。对话历史中只保留文本
         
         Returns:
             包含以下字段的字典：
             - emotion: 情绪标签元组 (编号, 名称)，格式如 (1, "happy")，如果未找到标签则为 (0, "normal")
             - response: 模型的回复内容（不包含情绪标签）
         """
-        content = []
+        with stage(self.metrics, "emotion"):
+            result = self._local_answer(text, audio, history)
+            if result is not None:
+                if on_emotion is not None:
+                    on_emotion(result["emotion"])
+                return result
+            
+            content = self._build_content(text, audio)
+    
+            if stream or label_only:
+                result = None
+                for event in self._iter_events(content, label_only=label_only, history=history, timeout=timeout):
+                    if event["type"] == "emotion" and on_emotion is not None:
+                        on_emotion(event["emotion"])
+                    elif event["type"] == "done":
+                        result = event["result"]
+                return result
         
-        if text:
-            content.append({
-                "type": "text",
-                "text": text,
-            })
-        else:
-            raise ValueError("not text provided")
+            response = self.llm_client.chat(content, stream=False, history=history, timeout=timeout)
+            if hasattr(response, 'choices') and response.choices:
+                full_response = response.choices[0].message.content
+            else:
+                full_response = ""
+        
+            result = self._parse_response(full_response)
+            self._store_label(history, result["emotion"])
+            if self._find_label(full_response) is not None:
+                self._observe_label(content, result["emotion"])
+            if on_emotion is not None:
+                on_emotion(result["emotion"])
+            return result
+    
+    def recognize_events(
+        self,
+        text: Optional[str] = None,
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        audio=None,
+    ) -> Iterator[Dict[str, any]]:
+        """
+        以事件流的形式流式识别情感，情绪标签一出现就产生emotion事件
+        
+        Args:
+            text: 用户输入的文本
+            label_only: 是否在情绪标签出现后立即关闭HTTP流（默认prompt下标签在最后，效果见recognize）
+            history: 外部对话历史列表，提供时使用并更新该列表而非识别器自身的历史
+            timeout: 时间预算（秒），含义同recognize
+            audio: 语音输入，含义同recognize
+        
+        Yields:
+            事件字典：
+            - {"type": "delta", "delta": str}: 模型回复的增量文本
+            - {"type": "emotion", "emotion": (编号, 名称)}: 情绪标签，每次调用恰好产生一次
+            - {"type": "done", "result": dict}: 最终结果，格式同recognize
+        """
+        result = self._local_answer(text, audio, history)
+        if result is not None:
+            yield {"type": "emotion", "emotion": result["emotion"]}
+            yield {"type": "done", "result": result}
+            return
+        
+        content = self._build_content(text, audio)
+        yield from self._iter_events(content, label_only=label_only, history=history, timeout=timeout)
     
-        if stream:
-            completion = self.llm_client.chat(content, stream=True)
-            full_response = ""
-            for chunk in completion:
-                if hasattr(chunk, 'choices') and chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content:
-                        full_response += delta.content
+    def _iter_events(
+        self,
+        content: List[Dict],
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, any]]:
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        completion = self.llm_client.chat(content, stream=True, history=history, timeout=timeout, partial=label_only)
+        scanner = EmotionTagScanner(_EMOTION_JSON_RE if self.json_output else _EMOTION_RE)
+        for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    yield {"type": "delta", "delta": delta.content}
+                    emotion = scanner.feed(delta.content)
+                    if emotion is not None:
+                        yield {"type": "emotion", "emotion": emotion}
+                        if label_only:
+                            completion.mark_complete()
+                            completion.close()
+                            break
+            if deadline_at is not None and time.perf_counter() > deadline_at:
+                completion.close()
+                if scanner.emotion is None:
+                    raise DeadlineExceeded("emotion recognition deadline exceeded")
+                break
+        
+        result = self._parse_response(scanner.buffer)
+        self._store_label(history, result["emotion"])
+        if scanner.emotion is None:
+            yield {"type": "emotion", "emotion": result["emotion"]}
         else:
-            response = self.llm_client.chat(content, stream=False)
+            self._observe_label(content, scanner.emotion)
+        yield {"type": "done", "result": result}
+    
+    async def arecognize(
+        self,
+        text: Optional[str] = None,
+        stream: bool = False,
+        on_emotion: Optional[Callable[[Tuple[int, str]], None]] = None,
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        audio=None,
+    ) -> Dict[str, any]:
+        """
+        recognize的异步版本，参数与返回值相同
+        """
+        with stage(self.metrics, "emotion"):
+            result = self._local_answer(text, audio, history)
+            if result is not None:
+                if on_emotion is not None:
+                    on_emotion(result["emotion"])
+                return result
+            
+            content = self._build_content(text, audio)
+        
+            if stream or label_only:
+                result = None
+                async for event in self._aiter_events(content, label_only=label_only, history=history, timeout=timeout):
+                    if event["type"] == "emotion" and on_emotion is not None:
+                        on_emotion(event["emotion"])
+                    elif event["type"] == "done":
+                        result = event["result"]
+                return result
+        
+            response = await self.async_llm_client.chat(content, stream=False, history=history, timeout=timeout)
             if hasattr(response, 'choices') and response.choices:
                 full_response = response.choices[0].message.content
             else:
                 full_response = ""
         
-        return self._parse_response(full_response)
+            result = self._parse_response(full_response)
+            self._store_label(history, result["emotion"])
+            if self._find_label(full_response) is not None:
+                self._observe_label(content, result["emotion"])
+            if on_emotion is not None:
+                on_emotion(result["emotion"])
+            return result
     
-    def _parse_response(self, raw_response: str) -> Dict[str, any]:
-        emotion_pattern = r'\[EMOTION:(\d+)\]'
-        match = re.search(emotion_pattern, raw_response)
-        
-        if match:
-            emotion_id = int(match.group(1))
-            if emotion_id >= 6 or emotion_id < 0: 
-                print(f"error emotion id {emotion_id}, set to 0")
-                emotion_id = 0
-            emotion_name = EMOTION_MAP.get(emotion_id, "normal")
-            emotion = (emotion_id, emotion_name)
-            response = re.sub(emotion_pattern, '', raw_response).strip()
+    async def arecognize_events(
+        self,
+        text: Optional[str] = None,
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        audio=None,
+    ) -> AsyncIterator[Dict[str, any]]:
+        """
+        recognize_events的异步版本，参数与事件格式相同
+        """
+        result = self._local_answer(text, audio, history)
+        if result is not None:
+            yield {"type": "emotion", "emotion": result["emotion"]}
+            yield {"type": "done", "result": result}
+            return
+        
+        content = self._build_content(text, audio)
+        async for event in self._aiter_events(content, label_only=label_only, history=history, timeout=timeout):
+            yield event
+    
+    async def _aiter_events(
+        self,
+        content: List[Dict],
+        label_only: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, any]]:
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        completion = await self.async_llm_client.chat(
+            content, stream=True, history=history, timeout=timeout, partial=label_only
+        )
+        scanner = EmotionTagScanner(_EMOTION_JSON_RE if self.json_output else _EMOTION_RE)
+        async for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    yield {"type": "delta", "delta": delta.content}
+                    emotion = scanner.feed(delta.content)
+                    if emotion is not None:
+                        yield {"type": "emotion", "emotion": emotion}
+                        if label_only:
+                            completion.mark_complete()
+                            await completion.aclose()
+                            break
+            if deadline_at is not None and time.perf_counter() > deadline_at:
+                await completion.aclose()
+                if scanner.emotion is None:
+                    raise DeadlineExceeded("emotion recognition deadline exceeded")
+                break
+        
+        result = self._parse_response(scanner.buffer)
+        self._store_label(history, result["emotion"])
+        if scanner.emotion is None:
+            yield {"type": "emotion", "emotion": result["emotion"]}
         else:
-            response = raw_response.strip()
-            emotion = (0, "normal")
+            self._observe_label(content, scanner.emotion)
+        yield {"type": "done", "result": result}
+    
+    def recognize_batch(
+        self,
+        texts: List[str],
+        stream: bool = False,
+        max_workers: int = 8,
+        histories: Optional[List[List[Dict]]] = None,
+    ) -> List[Union[Dict[str, any], Exception]]:
+        """
+        在有界线程池中批量识别情感，各条输入互不共享对话历史
+        
+        Args:
+            texts: 用户输入的文本列表
+            stream: 是否使用流式输出，默认为False
+            max_workers: 最大并发请求数
+            histories: 每条输入各自的对话历史列表；不提供则每条输入都是无状态请求
+        
+        Returns:
+            与texts顺序一致的结果列表，成功的条目为recognize的返回值，失败的条目为对应的异常对象
+        """
+        if histories is None:
+            histories = [[] for _ in texts]
+        return run_batch(
+            lambda args: self.recognize(args[0], stream=stream, history=args[1]),
+            list(zip(texts, histories)),
+            max_workers=max_workers,
+        )
+    
+    async def arecognize_batch(
+        self,
+        texts: List[str],
+        stream: bool = False,
+        concurrency: int = 8,
+        histories: Optional[List[List[Dict]]] = None,
+    ) -> List[Union[Dict[str, any], Exception]]:
+        """
+        recognize_batch的异步版本，用信号量限制同时进行的请求数，返回值相同
+        """
+        if histories is None:
+            histories = [[] for _ in texts]
+        return await arun_batch(
+            lambda args: self.arecognize(args[0], stream=stream, history=args[1]),
+            list(zip(texts, histories)),
+            concurrency=concurrency,
+        )
+    
+    async def astream(self, text: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        以异步迭代器形式流式输出模型回复的文本片段（包含情绪标签）
+        
+        Args:
+            text: 用户输入的文本
+        
+        Yields:
+            模型回复的增量文本
+        """
+        content = self._build_content(text)
+        async for delta in self._astream_content(content):
+            yield delta
+    
+    async def _astream_content(self, content: List[Dict]) -> AsyncIterator[str]:
+        completion = await self.async_llm_client.chat(content, stream=True)
+        async for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    yield delta.content
+    
+    def _find_label(self, raw_response: str) -> Optional[re.Match]:
+        """查找情绪标签，JSON输出时也接受{"emotion": n}的形式"""
+        match = _EMOTION_RE.search(raw_response)
+        if match is None and self.json_output:
+            match = _EMOTION_JSON_RE.search(raw_response)
+        return match
+    
+    def _parse_response(self, raw_response: str) -> Dict[str, any]:
+        with timed_parse():
+            match = self._find_label(raw_response)
+        
+            if match:
+                emotion = _to_emotion(int(match.group(1)))
+                response = re.sub(EMOTION_PATTERN, '', raw_response).strip()
+            else:
+                response = raw_response.strip()
+                emotion = (0, "normal")
+            if self.label_mode:
+                response = ""
         
-        return {
-            "emotion": emotion,
-            "response": response,
-        } 
+            return {
+                "emotion": emotion,
+                "response": response,
+            } 
     
     def reset_history(self):
         self.llm_client.reset_history()
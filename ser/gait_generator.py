@@ -1,8 +1,50 @@
-from typing import Dict, Optional
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Union, AsyncIterator
 
-from ser.emotion_recognizer import TextEmotionRecognizer
-from ser.motion_generator import MotionGenerator
+from ser.batch import run_batch, arun_batch
+from ser.cache import ResponseCache
+from ser.command_matcher import CommandMatcher
+from ser.emotion_recognizer import EmotionTagScanner, TextEmotionRecognizer
+from ser.history_store import HistoryStore
+from ser.llm_client import LLMClient, AsyncLLMClient
+from ser.local_classifier import LocalEmotionClassifier
+from ser.metrics import MetricsRegistry, stage
+from ser.motion_generator import GAIT_KEYS, GaitJsonScanner, MotionGenerator, EMOTION_FREQ_OFFSET
+from ser.resilience import DeadlineExceeded
+from ser.transport import HttpPoolConfig
+from ser.src.prompts import GAIT_EMOTION_PROMPT_CN
 X_VEL = 0.8
+# 两次调用模式下情感识别最多使用的截止时间比例，其余留给运动生成
+EMOTION_DEADLINE_SHARE = 0.5
+
+
+def _stage_history(history: Optional[Dict[str, List[Dict]]], stage: str) -> Optional[List[Dict]]:
+    if history is None:
+        return None
+    return history.setdefault(stage, [])
+
+
+def _restore_history(messages, snapshot: List[Dict]):
+    """调用失败或超时时撤销本轮写入历史的用户消息和不完整的回复"""
+    messages.clear()
+    messages.extend(snapshot)
+
+
+def _remaining(deadline_at: float) -> float:
+    remaining = deadline_at - time.perf_counter()
+    if remaining <= 0:
+        raise DeadlineExceeded("deadline exceeded before the call")
+    return remaining
+
+
+def _report_degraded(stage: str, error: Exception):
+    print(f"{stage} call failed, degrading: {error!r}")
+
 
 class GaitGenerator:
     def __init__(
@@ -13,6 +55,25 @@ class GaitGenerator:
         modalities: list = ["text"],
         audio_config: Optional[Dict] = None,
         max_history: Optional[int] = 4,
+        fused: bool = False,
+        fused_prompt: Optional[str] = GAIT_EMOTION_PROMPT_CN,
+        speculative: bool = False,
+        speculative_policy: str = "redo",
+        cache: Optional[ResponseCache] = None,
+        fast_path: bool = False,
+        fast_path_threshold: float = 0.8,
+        http_config: Optional[HttpPoolConfig] = None,
+        max_history_tokens: Optional[int] = None,
+        compaction: str = "drop_oldest",
+        compile_prompt: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+        backend=None,
+        deadline: Optional[float] = None,
+        local_classifier: Optional[LocalEmotionClassifier] = None,
+        local_threshold: float = 0.9,
+        label_mode: bool = False,
+        history_store: Optional[HistoryStore] = None,
+        session_id: Optional[str] = None,
     ):
         """
         初始化步态生成器
@@ -24,7 +85,36 @@ class GaitGenerator:
             modalities: 输出模态
             audio_config: 音频配置
             max_history: 最大历史消息条数
+            fused: 是否启用融合模式，一次LLM调用同时输出情感标签和步态参数
+            fused_prompt: 融合模式使用的prompt，默认使用GAIT_EMOTION_PROMPT_CN
+            speculative: 是否启用推测模式，用上一轮的情感标签（首轮为normal）与情感识别并行生成运动参数
+            speculative_policy: 推测失败时的处理方式，"redo"重新生成运动参数，"correct"只修正freq_offset
+            cache: 回复缓存，情感识别、运动生成和融合模式共用同一个缓存实例
+            fast_path: 运动生成是否启用本地规则快速通道（融合模式下不生效）
+            fast_path_threshold: 快速通道的最低置信度
+            http_config: HTTP连接池配置，情感识别、运动生成和融合模式的客户端共用同一个连接池
+            max_history_tokens: 每个阶段每次请求的prompt token预算，None表示只按条数限制
+            compaction: 历史超出token预算时的压缩策略，"drop_oldest"、"labels_only"或"summarize"
+            compile_prompt: 是否编译prompt（去掉缩进和Markdown装饰），减少每次请求的token数
+            metrics: 指标注册表，分阶段（emotion、motion、gait）记录耗时与token用量，None表示不记录
+            backend: 替代chat.completions.create的后端，如ser.replay.RecordingBackend/ReplayBackend，
+                     或ser.resilience.ResilientBackend（重试与熔断）
+            deadline: 每次generate的默认截止时间（秒），None表示不限时；设置后调用超时或失败时返回降级结果而不抛出异常
+            local_classifier: 情感识别使用的本地分类器（融合模式下不生效），见ser.local_classifier
+            local_threshold: 本地分类器的最低置信度
+            label_mode: 情感识别是否使用标签模式（融合模式下不生效），模型只输出情绪标签，
+                        减少输出token数和解码时间，见TextEmotionRecognizer
+            history_store: 对话历史存储（见ser.history_store），None表示历史只保存在内存中
+            session_id: 会话标识，各阶段的历史分别保存为"<session_id>/emotion"、"<session_id>/motion"和"<session_id>/fused"
         """
+        if fused and speculative:
+            raise ValueError("fused and speculative modes are mutually exclusive")
+        if speculative_policy not in ("redo", "correct"):
+            raise ValueError(f"unknown speculative_policy: {speculative_policy}")
+
+        def stage_session(stage: str) -> Optional[str]:
+            return f"{session_id}/{stage}" if session_id is not None else None
+        
         self.emotion_recognizer = TextEmotionRecognizer(
             api_key=api_key,
             base_url=base_url,
@@ -32,6 +122,18 @@ class GaitGenerator:
             modalities=modalities,
             audio_config=audio_config,
             max_history=max_history,
+            cache=cache,
+            http_config=http_config,
+            max_history_tokens=max_history_tokens,
+            compaction=compaction,
+            compile_prompt=compile_prompt,
+            metrics=metrics,
+            backend=backend,
+            local_classifier=local_classifier,
+            local_threshold=local_threshold,
+            label_mode=label_mode,
+            history_store=history_store,
+            session_id=stage_session("emotion"),
         )
         self.motion_generator = MotionGenerator(
             api_key=api_key,
@@ -40,12 +142,66 @@ class GaitGenerator:
             modalities=modalities,
             audio_config=audio_config,
             max_history=max_history,
+            cache=cache,
+            fast_path=fast_path,
+            fast_path_threshold=fast_path_threshold,
+            http_config=http_config,
+            max_history_tokens=max_history_tokens,
+            compaction=compaction,
+            compile_prompt=compile_prompt,
+            metrics=metrics,
+            backend=backend,
+            history_store=history_store,
+            session_id=stage_session("motion"),
         )
+        self.fused = fused
+        self.fused_client: Optional[LLMClient] = None
+        self._async_fused_client: Optional[AsyncLLMClient] = None
+        if fused:
+            self.fused_client = LLMClient(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                modalities=modalities,
+                audio_config=audio_config,
+                max_history=max_history,
+                system_message=fused_prompt,
+                cache=cache,
+                http_config=http_config,
+                max_history_tokens=max_history_tokens,
+                compaction=compaction,
+                compile_prompt=compile_prompt,
+                metrics=metrics,
+                backend=backend,
+                metrics_stage="gait",
+                history_store=history_store,
+                session_id=stage_session("fused"),
+            )
+        self.speculative = speculative
+        self.speculative_policy = speculative_policy
+        # 推测模式的后台线程在第一次推测时创建，close()时关闭
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 批量处理和服务中多个线程共用同一个生成器，推测统计的更新需要加锁
+        self._speculation_lock = threading.Lock()
+        self._last_emotion_label = "normal"
+        self.deadline = deadline
+        self._last_motion: Optional[Dict[str, float]] = None
+        self._command_matcher: Optional[CommandMatcher] = None
+        self.metrics = metrics
+        self._speculation_stats = {
+            "attempts": 0,
+            "hits": 0,
+            "misses": 0,
+            "saved_seconds": 0.0,
+        }
     
     def generate(
         self,
         text: str,
         stream: bool = False,
+        history: Optional[Dict[str, List[Dict]]] = None,
+        deadline: Optional[float] = None,
     ) -> Dict[str, any]:
         """
         根据用户输入生成步态参数
@@ -53,6 +209,11 @@ class GaitGenerator:
         Args:
             text: 用户输入的文本
             stream: 是否使用流式输出，默认False
+            history: 外部对话历史，格式同get_history的返回值（缺少的键会自动补上空列表），
+                     提供时使用并更新该历史而非生成器自身的历史，此时不使用推测模式
+            deadline: 本次调用的截止时间（秒），None表示使用初始化时的deadline；
+                      截止时间内按顺序进行两次调用（推测模式不生效），超时或失败时依次使用流式输出中已解析的字段、
+                      本地规则匹配的方向指令、最近一次按时完成的步态作为降级结果
         
         Returns:
             包含以下字段的字典：
@@ -60,17 +221,547 @@ class GaitGenerator:
             - yaw_vel: 转向速度 (-0.3 ~ 0.3)
             - freq_offset: 步频变化 (-0.1 ~ 0.1)
             - emo_label: 情感标签名称 (normal, happy, tired, confident, afraid, shy)
+            - degraded: 是否为降级结果，只在设置了截止时间时出现
+        """
+        deadline = self.deadline if deadline is None else deadline
+        with stage(self.metrics, "gait"):
+            if deadline is not None:
+                return self._generate_within(text, stream, history, time.perf_counter() + deadline)
+            if self.fused:
+                return self._generate_fused(text, stream=stream, history=_stage_history(history, "fused"))
+            if self.speculative and history is None:
+                return self._generate_speculative(text, stream=stream)
+
+            emotion_result = self.emotion_recognizer.recognize(
+                text,
+                stream=stream,
+                history=_stage_history(history, "emotion"),
+            )
+            emotion_tuple = emotion_result["emotion"]
+            emotion_id, emotion_label = emotion_tuple
+            if history is None:
+                self._last_emotion_label = emotion_label
+
+            motion_result = self.motion_generator.generate(
+                text=text,
+                emotion=emotion_label,  
+                stream=stream,
+                history=_stage_history(history, "motion"),
+            )
+        
+            return self._build_result(motion_result, emotion_label)
+    
+    async def agenerate(
+        self,
+        text: str,
+        stream: bool = False,
+        history: Optional[Dict[str, List[Dict]]] = None,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, any]:
         """
-        emotion_result = self.emotion_recognizer.recognize(text, stream=stream)
-        emotion_tuple = emotion_result["emotion"]
-        emotion_id, emotion_label = emotion_tuple
+        generate的异步版本，参数与返回值相同
+        """
+        deadline = self.deadline if deadline is None else deadline
+        with stage(self.metrics, "gait"):
+            if deadline is not None:
+                return await self._agenerate_within(text, stream, history, time.perf_counter() + deadline)
+            if self.fused:
+                return await self._agenerate_fused(text, stream=stream, history=_stage_history(history, "fused"))
+            if self.speculative and history is None:
+                return await self._agenerate_speculative(text, stream=stream)
+
+            emotion_result = await self.emotion_recognizer.arecognize(
+                text,
+                stream=stream,
+                history=_stage_history(history, "emotion"),
+            )
+            emotion_id, emotion_label = emotion_result["emotion"]
+            if history is None:
+                self._last_emotion_label = emotion_label
 
-        motion_result = self.motion_generator.generate(
-            text=text,
-            emotion=emotion_label,  
-            stream=stream,
+            motion_result = await self.motion_generator.agenerate(
+                text=text,
+                emotion=emotion_label,
+                stream=stream,
+                history=_stage_history(history, "motion"),
+            )
+        
+            return self._build_result(motion_result, emotion_label)
+    
+    def generate_batch(
+        self,
+        texts: List[str],
+        stream: bool = False,
+        max_workers: int = 8,
+        histories: Optional[List[Dict[str, List[Dict]]]] = None,
+    ) -> List[Union[Dict[str, any], Exception]]:
+        """
+        在有界线程池中批量生成步态参数，各条输入互不共享对话历史
+        
+        Args:
+            texts: 用户输入的文本列表
+            stream: 是否使用流式输出，默认False
+            max_workers: 最大并发请求数
+            histories: 每条输入各自的对话历史，格式同generate的history参数；不提供则每条输入都是无状态请求
+        
+        Returns:
+            与texts顺序一致的结果列表，成功的条目为generate的返回值，失败的条目为对应的异常对象
+        """
+        if histories is None:
+            histories = [{} for _ in texts]
+        return run_batch(
+            lambda args: self.generate(args[0], stream=stream, history=args[1]),
+            list(zip(texts, histories)),
+            max_workers=max_workers,
         )
+    
+    async def agenerate_batch(
+        self,
+        texts: List[str],
+        stream: bool = False,
+        concurrency: int = 8,
+        histories: Optional[List[Dict[str, List[Dict]]]] = None,
+    ) -> List[Union[Dict[str, any], Exception]]:
+        """
+        generate_batch的异步版本，用信号量限制同时进行的请求数，返回值相同
+        """
+        if histories is None:
+            histories = [{} for _ in texts]
+        return await arun_batch(
+            lambda args: self.agenerate(args[0], stream=stream, history=args[1]),
+            list(zip(texts, histories)),
+            concurrency=concurrency,
+        )
+    
+    async def astream(self, text: str) -> AsyncIterator[Dict[str, any]]:
+        """
+        以异步迭代器形式流式输出步态生成过程
+        
+        Args:
+            text: 用户输入的文本
         
+        Yields:
+            事件字典：
+            - {"stage": "emotion", "delta": str}: 情感识别阶段的增量文本
+            - {"stage": "motion", "delta": str}: 运动生成阶段的增量文本
+            - {"stage": "fused", "delta": str}: 融合模式下单次调用的增量文本
+            - {"stage": "result", "result": dict}: 最终步态参数，格式同generate
+        """
+        if self.fused:
+            content = [{"type": "text", "text": text}]
+            completion = await self.async_fused_client.chat(content, stream=True)
+            raw_fused = ""
+            async for chunk in completion:
+                if hasattr(chunk, 'choices') and chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if hasattr(delta, 'content') and delta.content:
+                        raw_fused += delta.content
+                        yield {"stage": "fused", "delta": delta.content}
+            yield {"stage": "result", "result": self._parse_fused_response(raw_fused)}
+            return
+
+        raw_emotion = ""
+        async for delta in self.emotion_recognizer.astream(text):
+            raw_emotion += delta
+            yield {"stage": "emotion", "delta": delta}
+        emotion_id, emotion_label = self.emotion_recognizer._parse_response(raw_emotion)["emotion"]
+        self._last_emotion_label = emotion_label
+        
+        raw_motion = ""
+        async for delta in self.motion_generator.astream(text, emotion=emotion_label):
+            raw_motion += delta
+            yield {"stage": "motion", "delta": delta}
+        motion_result = self.motion_generator._parse_response(raw_motion)
+        
+        yield {"stage": "result", "result": self._build_result(motion_result, emotion_label)}
+    
+    def _generate_within(
+        self,
+        text: str,
+        stream: bool,
+        history: Optional[Dict[str, List[Dict]]],
+        deadline_at: float,
+    ) -> Dict[str, any]:
+        if self.fused:
+            fused_history = _stage_history(history, "fused")
+            fused_messages = self.fused_client.messages if fused_history is None else fused_history
+            fused_snapshot = list(fused_messages)
+            try:
+                result = self._generate_fused(
+                    text, stream=stream, history=fused_history, timeout=_remaining(deadline_at),
+                )
+            except Exception as e:
+                _restore_history(fused_messages, fused_snapshot)
+                return self._degraded_fused(text, history, e)
+            return self._on_time(result, history)
+
+        degraded = False
+        emotion_label = self._last_emotion_label if history is None else "normal"
+        emotion_history = _stage_history(history, "emotion")
+        emotion_messages = self.emotion_recognizer.llm_client.messages if emotion_history is None else emotion_history
+        emotion_snapshot = list(emotion_messages)
+        try:
+            emotion_result = self.emotion_recognizer.recognize(
+                text,
+                stream=stream,
+                history=emotion_history,
+                timeout=_remaining(deadline_at) * EMOTION_DEADLINE_SHARE,
+            )
+            emotion_label = emotion_result["emotion"][1]
+            if history is None:
+                self._last_emotion_label = emotion_label
+        except Exception as e:
+            degraded = True
+            _report_degraded("emotion", e)
+            _restore_history(emotion_messages, emotion_snapshot)
+
+        motion_history = _stage_history(history, "motion")
+        motion_messages = self.motion_generator.llm_client.messages if motion_history is None else motion_history
+        motion_snapshot = list(motion_messages)
+        try:
+            motion_result = self.motion_generator.generate(
+                text=text,
+                emotion=emotion_label,
+                stream=stream,
+                history=motion_history,
+                timeout=_remaining(deadline_at),
+            )
+        except Exception as e:
+            _report_degraded("motion", e)
+            _restore_history(motion_messages, motion_snapshot)
+            motion_result = self._fallback_motion(text, emotion_label, history, getattr(e, "partial", None))
+            return dict(self._build_result(motion_result, emotion_label), degraded=True)
+        if degraded:
+            return dict(self._build_result(motion_result, emotion_label), degraded=True)
+        return self._on_time(self._build_result(motion_result, emotion_label), history)
+    
+    async def _agenerate_within(
+        self,
+        text: str,
+        stream: bool,
+        history: Optional[Dict[str, List[Dict]]],
+        deadline_at: float,
+    ) -> Dict[str, any]:
+        if self.fused:
+            fused_history = _stage_history(history, "fused")
+            fused_messages = self.fused_client.messages if fused_history is None else fused_history
+            fused_snapshot = list(fused_messages)
+            try:
+                result = await self._agenerate_fused(
+                    text, stream=stream, history=fused_history, timeout=_remaining(deadline_at),
+                )
+            except Exception as e:
+                _restore_history(fused_messages, fused_snapshot)
+                return self._degraded_fused(text, history, e)
+            return self._on_time(result, history)
+
+        degraded = False
+        emotion_label = self._last_emotion_label if history is None else "normal"
+        emotion_history = _stage_history(history, "emotion")
+        emotion_messages = self.emotion_recognizer.llm_client.messages if emotion_history is None else emotion_history
+        emotion_snapshot = list(emotion_messages)
+        try:
+            emotion_result = await self.emotion_recognizer.arecognize(
+                text,
+                stream=stream,
+                history=emotion_history,
+                timeout=_remaining(deadline_at) * EMOTION_DEADLINE_SHARE,
+            )
+            emotion_label = emotion_result["emotion"][1]
+            if history is None:
+                self._last_emotion_label = emotion_label
+        except Exception as e:
+            degraded = True
+            _report_degraded("emotion", e)
+            _restore_history(emotion_messages, emotion_snapshot)
+
+        motion_history = _stage_history(history, "motion")
+        motion_messages = self.motion_generator.llm_client.messages if motion_history is None else motion_history
+        motion_snapshot = list(motion_messages)
+        try:
+            motion_result = await self.motion_generator.agenerate(
+                text=text,
+                emotion=emotion_label,
+                stream=stream,
+                history=motion_history,
+                timeout=_remaining(deadline_at),
+            )
+        except Exception as e:
+            _report_degraded("motion", e)
+            _restore_history(motion_messages, motion_snapshot)
+            motion_result = self._fallback_motion(text, emotion_label, history, getattr(e, "partial", None))
+            return dict(self._build_result(motion_result, emotion_label), degraded=True)
+        if degraded:
+            return dict(self._build_result(motion_result, emotion_label), degraded=True)
+        return self._on_time(self._build_result(motion_result, emotion_label), history)
+    
+    def _on_time(self, result: Dict[str, any], history: Optional[Dict[str, List[Dict]]]) -> Dict[str, any]:
+        """记录按时完成的步态，供之后的降级结果使用"""
+        if history is None:
+            self._last_motion = {key: result[key] for key in GAIT_KEYS}
+            self._last_emotion_label = result["emo_label"]
+        return dict(result, degraded=False)
+    
+    def _degraded_fused(self, text: str, history: Optional[Dict[str, List[Dict]]], error: Exception) -> Dict[str, any]:
+        """融合模式的降级结果：从已收到的部分输出中取情绪标签和已写完的步态字段"""
+        _report_degraded("fused", error)
+        partial = getattr(error, "partial", None) or ""
+        emotion = EmotionTagScanner().feed(partial)
+        if emotion is not None:
+            emotion_label = emotion[1]
+        else:
+            emotion_label = self._last_emotion_label if history is None else "normal"
+        scanner = GaitJsonScanner()
+        scanner.feed(partial)
+        motion_result = self._fallback_motion(text, emotion_label, history, scanner.values)
+        return dict(self._build_result(motion_result, emotion_label), degraded=True)
+    
+    def _fallback_motion(
+        self,
+        text: str,
+        emotion_label: str,
+        history: Optional[Dict[str, List[Dict]]],
+        partial: Optional[Dict[str, float]],
+    ) -> Dict[str, float]:
+        """
+        依次使用流式输出中已解析的字段、本地规则匹配的方向指令、最近一次按时完成的步态，
+        freq_offset缺失时按情感取典型值
+        """
+        if self._command_matcher is None:
+            self._command_matcher = CommandMatcher()
+        motion = {"y_vel": 0.0, "yaw_vel": 0.0}
+        if history is None and self._last_motion is not None:
+            motion.update(y_vel=self._last_motion["y_vel"], yaw_vel=self._last_motion["yaw_vel"])
+        match = self._command_matcher.match(text)
+        if match is not None:
+            motion.update(y_vel=match["y_vel"], yaw_vel=match["yaw_vel"])
+        motion["freq_offset"] = EMOTION_FREQ_OFFSET.get(emotion_label, 0.0)
+        motion.update(partial or {})
+        return {key: motion[key] for key in GAIT_KEYS}
+    
+    def _generate_fused(
+        self,
+        text: str,
+        stream: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, any]:
+        content = [{"type": "text", "text": text}]
+        
+        if stream:
+            deadline_at = time.perf_counter() + timeout if timeout is not None else None
+            completion = self.fused_client.chat(content, stream=True, history=history, timeout=timeout)
+            full_response = ""
+            for chunk in completion:
+                if hasattr(chunk, 'choices') and chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if hasattr(delta, 'content') and delta.content:
+                        full_response += delta.content
+                if deadline_at is not None and time.perf_counter() > deadline_at:
+                    completion.close()
+                    raise DeadlineExceeded("fused generation deadline exceeded", partial=full_response)
+        else:
+            response = self.fused_client.chat(content, stream=False, history=history, timeout=timeout)
+            if hasattr(response, 'choices') and response.choices:
+                full_response = response.choices[0].message.content
+            else:
+                full_response = ""
+        
+        return self._parse_fused_response(full_response)
+    
+    def _generate_speculative(self, text: str, stream: bool = False) -> Dict[str, any]:
+        guess = self._last_emotion_label
+        start = time.perf_counter()
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ser-speculative")
+            executor = self._executor
+        tail = self._motion_history_tail()
+        # 在当前上下文的副本中运行，运动生成的指标计入本次gait记录
+        motion_future = executor.submit(contextvars.copy_context().run, self._timed_motion, text, guess, stream)
+        try:
+            emotion_result = self.emotion_recognizer.recognize(text, stream=stream)
+        except BaseException:
+            # 情感识别失败：等推测的运动生成结束，撤销它写入历史的一轮再抛出
+            try:
+                motion_future.result()
+            except BaseException:
+                pass
+            self._discard_motion_since(tail)
+            raise
+        emotion_time = time.perf_counter() - start
+        emotion_id, emotion_label = emotion_result["emotion"]
+        motion_result, motion_time = motion_future.result()
+
+        if emotion_label != guess:
+            if self.speculative_policy == "redo":
+                self._rollback_motion_turn()
+                motion_result, motion_time = self._timed_motion(text, emotion_label, stream)
+            else:
+                motion_result = self._correct_speculation(text, motion_result, emotion_label)
+
+        self._record_speculation(guess, emotion_label, emotion_time, motion_time, start)
+        return self._build_result(motion_result, emotion_label)
+    
+    async def _agenerate_speculative(self, text: str, stream: bool = False) -> Dict[str, any]:
+        guess = self._last_emotion_label
+        start = time.perf_counter()
+        tail = self._motion_history_tail()
+        motion_task = asyncio.ensure_future(self._atimed_motion(text, guess, stream))
+        try:
+            emotion_result = await self.emotion_recognizer.arecognize(text, stream=stream)
+        except BaseException:
+            # 情感识别失败或被取消：取消推测的运动生成并取回其结果，撤销它写入历史的一轮再抛出
+            motion_task.cancel()
+            await asyncio.gather(motion_task, return_exceptions=True)
+            self._discard_motion_since(tail)
+            raise
+        emotion_time = time.perf_counter() - start
+        emotion_id, emotion_label = emotion_result["emotion"]
+        motion_result, motion_time = await motion_task
+
+        if emotion_label != guess:
+            if self.speculative_policy == "redo":
+                self._rollback_motion_turn()
+                motion_result, motion_time = await self._atimed_motion(text, emotion_label, stream)
+            else:
+                motion_result = self._correct_speculation(text, motion_result, emotion_label)
+
+        self._record_speculation(guess, emotion_label, emotion_time, motion_time, start)
+        return self._build_result(motion_result, emotion_label)
+    
+    def _timed_motion(self, text: str, emotion: str, stream: bool):
+        start = time.perf_counter()
+        result = self.motion_generator.generate(text=text, emotion=emotion, stream=stream)
+        return result, time.perf_counter() - start
+    
+    async def _atimed_motion(self, text: str, emotion: str, stream: bool):
+        start = time.perf_counter()
+        result = await self.motion_generator.agenerate(text=text, emotion=emotion, stream=stream)
+        return result, time.perf_counter() - start
+    
+    def _correct_speculation(
+        self,
+        text: str,
+        motion_result: Dict[str, float],
+        emotion_label: str,
+    ) -> Dict[str, float]:
+        """推测失败时保留方向参数，按实际情感修正freq_offset，并同步改写运动生成的历史"""
+        corrected = dict(motion_result)
+        corrected["freq_offset"] = EMOTION_FREQ_OFFSET.get(emotion_label, 0.0)
+        self._rollback_motion_turn()
+        self.motion_generator.llm_client.extend_history([
+            {"role": "user", "content": self.motion_generator._build_content(text, emotion_label)},
+            {"role": "assistant", "content": json.dumps(corrected)},
+        ])
+        return corrected
+    
+    def _motion_history_tail(self) -> Optional[Dict]:
+        messages = self.motion_generator.llm_client.messages
+        return messages[-1] if messages else None
+
+    def _discard_motion_since(self, tail: Optional[Dict]):
+        """推测的运动生成已经写入历史（最后一条消息不再是tail）时撤销这一轮"""
+        messages = self.motion_generator.llm_client.messages
+        if messages and messages[-1] is not tail:
+            self._rollback_motion_turn()
+
+    def _rollback_motion_turn(self):
+        """撤销运动生成历史中最近一轮（用户消息及其回复）"""
+        llm_client = self.motion_generator.llm_client
+        while llm_client.messages:
+            if llm_client.pop_history(1)[0]["role"] == "user":
+                break
+    
+    def _record_speculation(
+        self,
+        guess: str,
+        emotion_label: str,
+        emotion_time: float,
+        motion_time: float,
+        start: float,
+    ):
+        # 相对串行执行（先情感识别、再运动生成）节省的时间，推测失败并重做时可能为负
+        saved = emotion_time + motion_time - (time.perf_counter() - start)
+        with self._speculation_lock:
+            stats = self._speculation_stats
+            stats["attempts"] += 1
+            if emotion_label == guess:
+                stats["hits"] += 1
+            else:
+                stats["misses"] += 1
+            stats["saved_seconds"] += saved
+            self._last_emotion_label = emotion_label
+    
+    def get_speculation_stats(self) -> Dict[str, float]:
+        """
+        获取推测模式的统计信息
+        
+        Returns:
+            包含attempts、hits、misses、hit_rate、saved_seconds（相对串行执行累计节省的秒数）的字典
+        """
+        with self._speculation_lock:
+            stats = dict(self._speculation_stats)
+        stats["hit_rate"] = stats["hits"] / stats["attempts"] if stats["attempts"] else 0.0
+        return stats
+    
+    def reset_speculation_stats(self):
+        with self._speculation_lock:
+            for key in self._speculation_stats:
+                self._speculation_stats[key] = 0 if key != "saved_seconds" else 0.0
+    
+    @property
+    def async_fused_client(self) -> AsyncLLMClient:
+        """与融合模式同步客户端共享对话历史的异步客户端，首次使用时创建"""
+        if self._async_fused_client is None:
+            self._async_fused_client = AsyncLLMClient.from_client(self.fused_client)
+        return self._async_fused_client
+    
+    async def _agenerate_fused(
+        self,
+        text: str,
+        stream: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, any]:
+        content = [{"type": "text", "text": text}]
+        
+        if stream:
+            deadline_at = time.perf_counter() + timeout if timeout is not None else None
+            completion = await self.async_fused_client.chat(content, stream=True, history=history, timeout=timeout)
+            full_response = ""
+            async for chunk in completion:
+                if hasattr(chunk, 'choices') and chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if hasattr(delta, 'content') and delta.content:
+                        full_response += delta.content
+                if deadline_at is not None and time.perf_counter() > deadline_at:
+                    await completion.aclose()
+                    raise DeadlineExceeded("fused generation deadline exceeded", partial=full_response)
+        else:
+            response = await self.async_fused_client.chat(content, stream=False, history=history, timeout=timeout)
+            if hasattr(response, 'choices') and response.choices:
+                full_response = response.choices[0].message.content
+            else:
+                full_response = ""
+        
+        return self._parse_fused_response(full_response)
+    
+    def _parse_fused_response(self, raw_response: str) -> Dict[str, any]:
+        """
+        解析融合模式的响应，同时提取情绪标签和JSON格式的步态参数
+        
+        Args:
+            raw_response: 原始响应文本
+        
+        Returns:
+            与generate相同格式的步态参数字典
+        """
+        emotion_id, emotion_label = self.emotion_recognizer._parse_response(raw_response)["emotion"]
+        motion_result = self.motion_generator._parse_response(raw_response)
+        return self._build_result(motion_result, emotion_label)
+    
+    def _build_result(self, motion_result: Dict[str, float], emotion_label: str) -> Dict[str, any]:
         return {
             "x_vel": X_VEL,
             "y_vel": motion_result["y_vel"],
@@ -79,15 +770,39 @@ class GaitGenerator:
             "emo_label": emotion_label,
         }
     
+    @property
+    def stages(self) -> tuple:
+        """generate(history=...)使用的历史阶段，融合模式多一个"fused"阶段"""
+        return ("emotion", "motion", "fused") if self.fused_client is not None else ("emotion", "motion")
+    
     def reset_history(self):
         self.emotion_recognizer.reset_history()
         self.motion_generator.reset_history()
+        self._last_emotion_label = "normal"
+        if self.fused_client is not None:
+            self.fused_client.reset_history()
     
     def get_history(self):
-        return {
+        history = {
             "emotion": self.emotion_recognizer.get_history(),
             "motion": self.motion_generator.get_history(),
         }
+        if self.fused_client is not None:
+            history["fused"] = self.fused_client.get_history()
+        return history
+    
+    def close(self):
+        """关闭推测模式的后台线程，之后再推测时会重新创建"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+    
+    def __enter__(self) -> "GaitGenerator":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
 
 
 if __name__ == "__main__":
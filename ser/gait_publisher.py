@@ -0,0 +1,217 @@
+"""
+固定频率的步态指令发布器，把逐句生成的步态参数变成运动控制器需要的连续指令流
+
+LLM只改变目标步态，后台线程按固定频率（通常50~200Hz）向目标平滑插值并限制变化率，
+控制器从不等待LLM调用：
+
+    publisher = GaitPublisher(controller.send, rate_hz=100).start()
+    publisher.submit(generator, "快向左转！")   # 后台生成，完成后更新目标
+    ...
+    publisher.stop()
+"""
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+# 指令向量中各字段的顺序
+GAIT_FIELDS = ("x_vel", "y_vel", "yaw_vel", "freq_offset")
+
+# 各字段每秒允许的最大变化量
+DEFAULT_MAX_RATE = {
+    "x_vel": 1.0,
+    "y_vel": 0.6,
+    "yaw_vel": 0.6,
+    "freq_offset": 0.2,
+}
+
+
+class GaitPublisher:
+    """
+    后台线程按固定频率发布平滑后的步态指令
+
+    目标步态保存在双缓冲中：写入方在锁内写后台缓冲区再切换下标，发布线程每次只读取当前下标指向的缓冲区，
+    不与写入方争用锁。每个周期的平滑和限速对所有字段一次完成（numpy向量运算）。
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[Dict[str, float]], None]] = None,
+        rate_hz: float = 100.0,
+        time_constant: float = 0.3,
+        max_rate: Optional[Dict[str, float]] = None,
+        initial: Optional[Dict[str, float]] = None,
+    ):
+        """
+        初始化步态指令发布器
+
+        Args:
+            callback: 每个周期调用一次，参数为指令字典（GAIT_FIELDS中的字段加emo_label），None表示只通过current()读取
+            rate_hz: 发布频率（Hz）
+            time_constant: 平滑的时间常数（秒），约经过这么长时间完成到新目标63%的变化，0表示不平滑
+            max_rate: 各字段每秒允许的最大变化量，缺少的字段使用DEFAULT_MAX_RATE，None表示全部使用默认值
+            initial: 初始步态，缺少的字段为0
+        """
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        self.callback = callback
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.time_constant = time_constant
+        rates = dict(DEFAULT_MAX_RATE, **(max_rate or {}))
+        self._max_step = np.array([rates[field] for field in GAIT_FIELDS]) * self.period
+        self._alpha = 1.0 - math.exp(-self.period / time_constant) if time_constant > 0 else 1.0
+
+        start = self._vector(initial or {})
+        self._buffers = [start.copy(), start.copy()]
+        self._labels = ["normal", "normal"]
+        self._front = 0
+        self._write_lock = threading.Lock()
+        self._current = start.copy()
+        self._command = self._to_command(self._current, "normal")
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 发布线程和调用set_target的线程都会更新统计
+        self._stats_lock = threading.Lock()
+        self._stats = {"ticks": 0, "overruns": 0, "updates": 0, "max_lag": 0.0}
+
+    @staticmethod
+    def _vector(gait: Dict[str, float], base: Optional[np.ndarray] = None) -> np.ndarray:
+        vector = np.zeros(len(GAIT_FIELDS)) if base is None else base.copy()
+        for index, field in enumerate(GAIT_FIELDS):
+            if field in gait:
+                vector[index] = gait[field]
+        return vector
+
+    @staticmethod
+    def _to_command(vector: np.ndarray, emo_label: str) -> Dict[str, float]:
+        command = dict(zip(GAIT_FIELDS, vector.tolist()))
+        command["emo_label"] = emo_label
+        return command
+
+    def set_target(self, gait: Dict[str, float]):
+        """
+        更新目标步态，可在任意线程中调用，不等待发布线程
+
+        Args:
+            gait: GaitGenerator.generate的返回值或其中部分字段，缺少的字段保持原目标
+        """
+        with self._write_lock:
+            front = self._front
+            back = 1 - front
+            self._buffers[back] = self._vector(gait, self._buffers[front])
+            self._labels[back] = gait.get("emo_label", self._labels[front])
+            # 下标赋值是原子的，发布线程要么看到旧目标，要么看到完整的新目标
+            self._front = back
+        with self._stats_lock:
+            self._stats["updates"] += 1
+
+    def target(self) -> Dict[str, float]:
+        """当前的目标步态"""
+        front = self._front
+        return self._to_command(self._buffers[front], self._labels[front])
+
+    def current(self) -> Dict[str, float]:
+        """最近一次发布的指令，可用于控制器主动拉取"""
+        return self._command
+
+    def step(self) -> Dict[str, float]:
+        """
+        向目标前进一个周期并返回新的指令，发布线程每个周期调用一次，也可以由外部控制循环直接驱动
+
+        Returns:
+            指令字典，字段同callback的参数
+        """
+        front = self._front
+        target, emo_label = self._buffers[front], self._labels[front]
+        gap = target - self._current
+        delta = np.clip(gap * self._alpha, -self._max_step, self._max_step)
+        # 指数逼近不会精确到达目标，差距足够小时直接取目标值
+        self._current = np.where(np.abs(gap) < 1e-6, target, self._current + delta)
+        self._command = self._to_command(self._current, emo_label)
+        return self._command
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            command = self.step()
+            if self.callback is not None:
+                try:
+                    self.callback(command)
+                except Exception as e:
+                    print(f"gait publisher callback failed: {e!r}")
+
+            next_tick += self.period
+            now = time.perf_counter()
+            lag = now - next_tick
+            with self._stats_lock:
+                self._stats["ticks"] += 1
+                if lag > 0:
+                    self._stats["overruns"] += 1
+                    self._stats["max_lag"] = max(self._stats["max_lag"], lag)
+            if lag > 0:
+                # 回调或调度耗时超过一个周期：丢弃错过的周期，从当前时刻重新计时，不补发
+                next_tick = now
+            else:
+                self._stop.wait(-lag)
+
+    def start(self) -> "GaitPublisher":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ser-gait-publisher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __enter__(self) -> "GaitPublisher":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, generator, text: str, **kwargs) -> Future:
+        """
+        在后台线程中生成步态参数，完成后更新目标步态
+
+        Args:
+            generator: GaitGenerator实例
+            text: 用户输入的文本
+            **kwargs: 传给generator.generate的其他参数，如stream、deadline
+
+        Returns:
+            结果为generate返回值的Future；生成失败时目标保持不变，异常保存在Future中
+        """
+        def run():
+            result = generator.generate(text, **kwargs)
+            self.set_target(result)
+            return result
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ser-gait-submit")
+            return self._executor.submit(run)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        获取发布统计
+
+        Returns:
+            包含ticks（已发布周期数）、overruns（超时的周期数）、max_lag（最大超时秒数）、updates（目标更新次数）的字典
+        """
+        with self._stats_lock:
+            return dict(self._stats)
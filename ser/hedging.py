@@ -0,0 +1,380 @@
+"""
+对冲请求：首token迟迟不到时再发一个相同的请求，先返回首token的一方胜出，另一方被取消
+
+阈值按最近的首token延迟分位数自适应调整，对冲比例有上限，额外的调用成本可控。
+作为LLMClient的后端使用：
+
+    client = LLMClient(backend=HedgingBackend(percentile=95, max_hedge_rate=0.1))
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+
+def _has_content(chunk) -> bool:
+    if getattr(chunk, 'usage', None) is not None:
+        return True
+    if not getattr(chunk, 'choices', None):
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, 'content', None))
+
+
+class _Attempt:
+    """一次请求尝试：流式时保存已读到首token为止的块，非流式时保存完整响应"""
+
+    __slots__ = ("key", "index", "started", "first_at", "stream", "iterator", "buffered", "response", "error",
+                 "cancelled", "lock")
+
+    def __init__(self, key: tuple, index: int):
+        self.key = key
+        self.index = index
+        self.started = time.perf_counter()
+        self.first_at: Optional[float] = None
+        self.stream = None
+        self.iterator = None
+        self.buffered: List = []
+        self.response = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+
+class HedgingBackend:
+    """
+    LLMClient的对冲请求后端
+
+    流式调用以收到第一个带内容的块为准，非流式调用以收到完整响应为准。
+    同步调用的每次尝试在有界线程池中进行。落后的一方继续运行到首token（非流式为完整响应）为止，
+    记入延迟样本后关闭HTTP流、丢弃响应，这样分位数阈值不会只由胜出的一方决定。线程安全。
+    """
+
+    def __init__(
+        self,
+        inner=None,
+        percentile: float = 95.0,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        max_delay: float = 5.0,
+        window: int = 200,
+        min_samples: int = 20,
+        max_hedge_rate: float = 0.1,
+        max_threads: int = 64,
+    ):
+        """
+        初始化对冲请求后端
+
+        Args:
+            inner: 实际发起请求的后端，None表示直接使用LLMClient的OpenAI客户端
+            percentile: 对冲阈值取最近首token延迟的哪个分位数
+            initial_delay: 样本不足min_samples时使用的阈值（秒）
+            min_delay: 阈值下限（秒）
+            max_delay: 阈值上限（秒）
+            window: 计算分位数和对冲比例时保留的最近请求数
+            min_samples: 开始使用自适应阈值所需的样本数
+            max_hedge_rate: 最近window次请求中发出对冲请求的比例上限
+            max_threads: 同步调用的线程池大小，进行中的尝试达到上限时不再发出对冲请求
+        """
+        self.inner = inner
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self._lock = threading.Lock()
+        self._samples: Dict[tuple, deque] = {}
+        self._recent: deque = deque(maxlen=window)
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+        self.max_threads = max_threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+        # 落后的异步尝试在后台运行到首token，保留引用以免任务被回收
+        self._background = set()
+
+    def _key(self, params: Dict) -> tuple:
+        # 不同的系统消息（情感识别、运动生成等）首token延迟差别很大，分开统计
+        messages = params.get("messages") or [{}]
+        system = messages[0].get("content") if messages[0].get("role") == "system" else None
+        return (params.get("model"), bool(params.get("stream")), hash(system))
+
+    def threshold(self, key: tuple) -> float:
+        """当前的对冲阈值（秒）"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(round(self.percentile / 100 * (len(samples) - 1))))
+        return min(max(samples[index], self.min_delay), self.max_delay)
+
+    def close(self):
+        """关闭同步调用使用的线程池，之后的调用会重新创建"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _allow_hedge(self, threaded: bool = False) -> bool:
+        # 决定对冲时立即记入最近请求，避免并发请求同时通过比例检查
+        with self._lock:
+            if threaded and self._running >= self.max_threads:
+                return False
+            if sum(self._recent) + 1 > self.max_hedge_rate * max(len(self._recent), self.min_samples):
+                return False
+            self._recent.append(True)
+            return True
+
+    def _sample(self, attempt: _Attempt):
+        """记录一次尝试的首token延迟，胜出和落后的尝试都记录"""
+        with self._lock:
+            if attempt.key not in self._samples:
+                self._samples[attempt.key] = deque(maxlen=self.window)
+            self._samples[attempt.key].append(attempt.first_at - attempt.started)
+
+    def _finish(self, winner: _Attempt, hedged: bool):
+        with self._lock:
+            if not hedged:
+                self._recent.append(False)
+            self._stats["requests"] += 1
+            if hedged:
+                self._stats["hedged"] += 1
+                if winner.index > 0:
+                    self._stats["hedge_wins"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        获取对冲统计
+
+        Returns:
+            包含requests、hedged（发出对冲的请求数）、hedge_wins（对冲请求胜出次数）、hedge_rate的字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def _create(self, client, params: Dict):
+        if self.inner is not None:
+            return self.inner.create(client, **params)
+        return client.chat.completions.create(**params)
+
+    def _run(self, client, params: Dict, attempt: _Attempt, results: queue.Queue):
+        try:
+            response = self._create(client, params)
+            if params.get("stream"):
+                attempt.stream = response
+                attempt.iterator = iter(response)
+                for chunk in attempt.iterator:
+                    attempt.buffered.append(chunk)
+                    if _has_content(chunk):
+                        break
+            else:
+                attempt.response = response
+            # 与_cancel在同一把锁下交接，二者恰好有一方负责释放
+            with attempt.lock:
+                attempt.first_at = time.perf_counter()
+                cancelled = attempt.cancelled
+            self._sample(attempt)
+            if cancelled:
+                self._discard(attempt)
+        except Exception as e:
+            with attempt.lock:
+                attempt.error = e
+                cancelled = attempt.cancelled
+            if cancelled:
+                self._discard(attempt)
+        finally:
+            with self._lock:
+                self._running -= 1
+        results.put(attempt)
+
+    def _launch(self, client, params: Dict, key: tuple, index: int, results: queue.Queue) -> _Attempt:
+        attempt = _Attempt(key, index)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="ser-hedge")
+            self._running += 1
+        self._executor.submit(self._run, client, params, attempt, results)
+        return attempt
+
+    def create(self, client, **params):
+        key = self._key(params)
+        results: queue.Queue = queue.Queue()
+        attempts = [self._launch(client, params, key, 0, results)]
+        try:
+            finished = results.get(timeout=self.threshold(key))
+        except queue.Empty:
+            if self._allow_hedge(threaded=True):
+                attempts.append(self._launch(client, params, key, 1, results))
+            finished = results.get()
+
+        # 主请求在阈值内就失败时不发对冲请求，重试不属于对冲的职责
+        winner, errors = None, []
+        while True:
+            if finished.error is None:
+                winner = finished
+                break
+            errors.append(finished.error)
+            if len(errors) == len(attempts):
+                break
+            finished = results.get()
+
+        for attempt in attempts:
+            if attempt is not winner:
+                self._cancel(attempt)
+        if winner is None:
+            raise errors[0]
+        self._finish(winner, len(attempts) > 1)
+        if params.get("stream"):
+            return _HedgedStream(winner)
+        return winner.response
+
+    def _cancel(self, attempt: _Attempt):
+        """取消落后的尝试：已经结束的立即释放，还在进行的在首token（非流式为完整响应）到达、记入延迟样本后释放"""
+        with attempt.lock:
+            attempt.cancelled = True
+            finished = attempt.first_at is not None or attempt.error is not None
+        if finished:
+            self._discard(attempt)
+
+    @staticmethod
+    def _discard(attempt: _Attempt):
+        if attempt.stream is not None:
+            _close(attempt.stream)
+        attempt.stream = attempt.iterator = attempt.response = None
+        attempt.buffered = []
+
+    async def _arun(self, client, params: Dict, attempt: _Attempt) -> _Attempt:
+        if self.inner is not None:
+            response = await self.inner.acreate(client, **params)
+        else:
+            response = await client.chat.completions.create(**params)
+        if params.get("stream"):
+            attempt.stream = response
+            try:
+                attempt.iterator = response.__aiter__()
+                async for chunk in attempt.iterator:
+                    attempt.buffered.append(chunk)
+                    if _has_content(chunk):
+                        break
+            except asyncio.CancelledError:
+                await _aclose(response)
+                raise
+        else:
+            attempt.response = response
+        attempt.first_at = time.perf_counter()
+        self._sample(attempt)
+        if attempt.cancelled:
+            await _adiscard(attempt)
+        return attempt
+
+    def _abandon(self, task: "asyncio.Task", attempt: _Attempt):
+        """落后的异步尝试继续在后台运行到首token，记入延迟样本后释放"""
+        attempt.cancelled = True
+        if task.done():
+            if not task.cancelled() and task.exception() is None:
+                self._background.add(asyncio.ensure_future(_adiscard(attempt)))
+            return
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(_retrieve)
+
+    async def acreate(self, client, **params):
+        key = self._key(params)
+        attempts = [_Attempt(key, 0)]
+        tasks = [asyncio.ensure_future(self._arun(client, params, attempts[0]))]
+        done, pending = await asyncio.wait(tasks, timeout=self.threshold(key))
+        if not done and self._allow_hedge():
+            attempts.append(_Attempt(key, 1))
+            tasks.append(asyncio.ensure_future(self._arun(client, params, attempts[1])))
+            pending = set(tasks)
+
+        winner, errors = None, []
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                if winner is not None or not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task, attempt in zip(tasks, attempts):
+                if attempt is winner:
+                    continue
+                if winner is None and not task.done():
+                    # 全部失败或调用方取消：没有胜出者，直接取消剩余的尝试
+                    task.cancel()
+                else:
+                    self._abandon(task, attempt)
+        if winner is None:
+            raise errors[0]
+        self._finish(winner, len(tasks) > 1)
+        if params.get("stream"):
+            return _AsyncHedgedStream(winner)
+        return winner.response
+
+
+def _close(stream):
+    try:
+        if hasattr(stream, 'close'):
+            stream.close()
+    except Exception:
+        pass
+
+
+async def _aclose(stream):
+    try:
+        if hasattr(stream, 'close'):
+            await stream.close()
+    except Exception:
+        pass
+
+
+def _retrieve(task: "asyncio.Task"):
+    """取走被放弃的尝试的异常，避免事件循环报告exception was never retrieved"""
+    if not task.cancelled():
+        task.exception()
+
+
+async def _adiscard(attempt: _Attempt):
+    if attempt.stream is not None:
+        await _aclose(attempt.stream)
+    attempt.stream = attempt.iterator = attempt.response = None
+    attempt.buffered = []
+
+
+class _HedgedStream:
+    """胜出请求的流：先产出已缓冲到首token为止的块，再继续读取剩余部分"""
+
+    def __init__(self, attempt: _Attempt):
+        self.attempt = attempt
+
+    def __iter__(self):
+        yield from self.attempt.buffered
+        yield from self.attempt.iterator
+
+    def close(self):
+        _close(self.attempt.stream)
+
+
+class _AsyncHedgedStream:
+
+    def __init__(self, attempt: _Attempt):
+        self.attempt = attempt
+
+    async def __aiter__(self):
+        for chunk in self.attempt.buffered:
+            yield chunk
+        async for chunk in self.attempt.iterator:
+            yield chunk
+
+    async def close(self):
+        await _aclose(self.attempt.stream)
@@ -0,0 +1,148 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+# 每条消息在chat模板中的固定开销（角色标记、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = "（之前的对话摘要）"
+SUMMARY_PREFIX = "之前的对话摘要："
+SUMMARY_MAX_ITEMS = 5
+SUMMARY_ITEM_CHARS = 16
+
+_CJK = re.compile("[　-〿㐀-鿿가-힯＀-￯]")
+_EMOTION_TAG = re.compile(r"\[EMOTION:\d+\]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数：中日韩字符约1个token，其余字符约4个字符1个token
+
+    Args:
+        text: 待估算的文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_text(message: Dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(
+            item.get("text", "") for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return content or ""
+
+
+def count_message_tokens(message: Dict, tokenizer: Callable[[str], int] = estimate_tokens) -> int:
+    return tokenizer(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_messages_tokens(messages: List[Dict], tokenizer: Callable[[str], int] = estimate_tokens) -> int:
+    return sum(count_message_tokens(message, tokenizer) for message in messages)
+
+
+def _pop_turn(history: List[Dict]) -> List[Dict]:
+    """从最早处移除一整轮对话（一条用户消息及其后的回复）"""
+    turn = [history.pop(0)]
+    while history and history[0].get("role") != "user":
+        turn.append(history.pop(0))
+    return turn
+
+
+def drop_oldest(
+    history: List[Dict],
+    budget: int,
+    tokenizer: Callable[[str], int] = estimate_tokens,
+) -> List[Dict]:
+    """按轮丢弃最早的对话，直到历史不超过预算"""
+    history = list(history)
+    while history and count_messages_tokens(history, tokenizer) > budget:
+        _pop_turn(history)
+    return history
+
+
+def labels_only(
+    history: List[Dict],
+    budget: int,
+    tokenizer: Callable[[str], int] = estimate_tokens,
+) -> List[Dict]:
+    """把过去助手回复中的对话内容去掉、只保留情绪标签，仍超出预算时再丢弃最早的对话"""
+    compacted = []
+    for message in history:
+        if message.get("role") == "assistant":
+            tags = _EMOTION_TAG.findall(message_text(message))
+            if tags:
+                message = {"role": "assistant", "content": tags[-1]}
+        compacted.append(message)
+    return drop_oldest(compacted, budget, tokenizer)
+
+
+def summarize(
+    history: List[Dict],
+    budget: int,
+    tokenizer: Callable[[str], int] = estimate_tokens,
+) -> List[Dict]:
+    """
+    把最早的若干轮对话折叠成一段本地生成的摘要（不调用LLM），仍超出预算时再丢弃最早的对话
+
+    摘要以一问一答的形式放在历史最前面，保持用户/助手消息交替。
+    """
+    history = list(history)
+    items = []
+    if len(history) >= 2 and message_text(history[0]) == SUMMARY_PROMPT:
+        previous = message_text(history[1])[len(SUMMARY_PREFIX):]
+        items = [item for item in previous.split("；") if item]
+        history = history[2:]
+
+    def with_summary(rest: List[Dict]) -> List[Dict]:
+        if not items:
+            return rest
+        return [
+            {"role": "user", "content": [{"type": "text", "text": SUMMARY_PROMPT}]},
+            {"role": "assistant", "content": SUMMARY_PREFIX + "；".join(items[-SUMMARY_MAX_ITEMS:])},
+        ] + rest
+
+    while history and count_messages_tokens(with_summary(history), tokenizer) > budget:
+        turn = _pop_turn(history)
+        user_text = message_text(turn[0]).strip()
+        if len(user_text) > SUMMARY_ITEM_CHARS:
+            user_text = user_text[:SUMMARY_ITEM_CHARS] + "…"
+        tags = [tag for message in turn[1:] for tag in _EMOTION_TAG.findall(message_text(message))]
+        items.append(f"用户说「{user_text}」{tags[-1] if tags else ''}")
+    return drop_oldest(with_summary(history), budget, tokenizer)
+
+
+COMPACTION_STRATEGIES: Dict[str, Callable[..., List[Dict]]] = {
+    "drop_oldest": drop_oldest,
+    "labels_only": labels_only,
+    "summarize": summarize,
+}
+
+
+def compact_history(
+    history: List[Dict],
+    budget: Optional[int],
+    strategy: str = "drop_oldest",
+    tokenizer: Callable[[str], int] = estimate_tokens,
+) -> List[Dict]:
+    """
+    在历史超出token预算时按指定策略压缩
+
+    Args:
+        history: 对话历史（不含本次用户消息）
+        budget: 历史允许占用的token数，None表示不限制
+        strategy: 压缩策略，"drop_oldest"、"labels_only"或"summarize"
+        tokenizer: 计算文本token数的函数
+
+    Returns:
+        压缩后的历史；未超出预算时原样返回
+    """
+    if budget is None or count_messages_tokens(history, tokenizer) <= budget:
+        return history
+    return COMPACTION_STRATEGIES[strategy](history, max(budget, 0), tokenizer)
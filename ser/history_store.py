@@ -0,0 +1,430 @@
+"""
+可持久化、可在进程间共享的对话历史存储
+
+LLMClient默认把对话历史保存在进程内存中，进程重启或会话迁移到其他进程后上下文全部丢失。
+提供history_store和session_id后，历史在首次使用时从存储中加载，之后的每次修改都会批量写回：
+
+    store = SQLiteHistoryStore("history.db")
+    generator = GaitGenerator(history_store=store, session_id="robot-1")
+
+三种后端：MemoryHistoryStore（进程内，与默认行为相同）、FileHistoryStore（每个会话一个只追加的JSON Lines文件）、
+SQLiteHistoryStore（单个数据库文件，WAL模式，适合多个进程同时读写）。
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class HistoryStore:
+    """
+    历史存储的基类：修改先进入内存中的待写队列，攒够batch_size条或每隔flush_interval秒由后台线程一次写入
+
+    子类实现_write(ops)和_read(session_id)。ops为按顺序排列的(session_id, 操作, 编码后的消息列表)，
+    操作为"append"（追加）或"replace"（整体替换，清空即替换为空列表）。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        flush_interval: Optional[float] = 0.5,
+        max_messages: Optional[int] = 200,
+        shared: bool = False,
+    ):
+        """
+        初始化历史存储
+
+        Args:
+            batch_size: 待写队列达到该长度时立即写入
+            flush_interval: 后台线程写入的间隔（秒），None表示只在队列满、加载、flush或close时写入
+            max_messages: 每个会话最多保留的消息条数，None表示不限制
+            shared: 是否有多个进程同时服务同一个会话；为True时每次修改立即写入，LLMClient每轮对话前都重新加载历史
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_messages = max_messages
+        self.shared = shared
+        self._pending: List[Tuple[str, str, List[str]]] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"writes": 0, "flushes": 0, "loads": 0}
+        atexit.register(self.close)
+
+    def append(self, session_id: str, messages: List[Dict]):
+        """在会话历史末尾追加消息"""
+        self._enqueue(session_id, "append", messages)
+
+    def replace(self, session_id: str, messages: List[Dict]):
+        """用messages整体替换会话历史"""
+        self._enqueue(session_id, "replace", messages)
+
+    def clear(self, session_id: str):
+        self._enqueue(session_id, "replace", [])
+
+    def _enqueue(self, session_id: str, op: str, messages: List[Dict]):
+        # 入队时就编码，之后调用方修改消息对象不会影响写入的内容
+        encoded = [json.dumps(message, ensure_ascii=False) for message in messages]
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("history store is closed")
+            self._pending.append((session_id, op, encoded))
+            self._stats["writes"] += 1
+            # 共享存储时其他进程随时可能接手会话，修改不能停留在本进程的队列中
+            full = self.shared or len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+        elif self.flush_interval is not None and self._thread is None:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="ser-history-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"history store flush failed: {e!r}")
+
+    def flush(self):
+        """把待写队列中的修改全部写入存储"""
+        with self._io_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+            if ops:
+                self._write(ops)
+                self._stats["flushes"] += 1
+
+    def load(self, session_id: str) -> List[Dict]:
+        """
+        读取会话历史，包括本进程尚未写入的修改
+
+        Returns:
+            消息列表，最多max_messages条；会话不存在时为空列表
+        """
+        self.flush()
+        self._stats["loads"] += 1
+        return self._read(session_id)
+
+    def close(self):
+        """写入剩余的修改并停止后台线程，可以重复调用"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        self._close()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取存储统计
+
+        Returns:
+            包含writes（修改次数）、flushes（实际写入次数）、loads（加载次数）、pending（待写修改数）的字典
+        """
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+    def _write(self, ops: List[Tuple[str, str, List[str]]]):
+        raise NotImplementedError
+
+    def _read(self, session_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _tail(self, messages: List) -> List:
+        if self.max_messages is None or len(messages) <= self.max_messages:
+            return messages
+        return messages[len(messages) - self.max_messages:]
+
+
+class MemoryHistoryStore(HistoryStore):
+    """进程内的历史存储，与不使用存储时的行为相同，可以在同一进程的多个客户端之间共享会话"""
+
+    def __init__(self, max_messages: Optional[int] = 200):
+        super().__init__(batch_size=1, flush_interval=None, max_messages=max_messages)
+        self._sessions: Dict[str, List[str]] = {}
+
+    def _write(self, ops):
+        for session_id, op, encoded in ops:
+            if op == "replace":
+                self._sessions[session_id] = list(encoded)
+            else:
+                self._sessions[session_id] = self._tail(self._sessions.get(session_id, []) + encoded)
+
+    def _read(self, session_id: str) -> List[Dict]:
+        return [json.loads(line) for line in self._sessions.get(session_id, [])]
+
+    def sessions(self) -> List[str]:
+        self.flush()
+        return list(self._sessions)
+
+
+class FileHistoryStore(HistoryStore):
+    """
+    每个会话一个只追加的JSON Lines文件，每行是一次append或replace操作
+
+    加载时从最后一次replace开始重放；文件中的操作数超过compact_after时改写为一次replace。
+    shared为True时追加和改写都在会话的锁文件（"<会话文件>.lock"）上加排他锁，改写不会丢失其他进程的追加；
+    没有fcntl的平台上共享模式不改写，多个进程共享会话时建议使用SQLiteHistoryStore。
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        batch_size: int = 64,
+        flush_interval: Optional[float] = 0.5,
+        max_messages: Optional[int] = 200,
+        shared: bool = False,
+        compact_after: int = 256,
+    ):
+        """
+        初始化文件历史存储
+
+        Args:
+            directory: 存放会话文件的目录，不存在时自动创建
+            batch_size: 同HistoryStore
+            flush_interval: 同HistoryStore
+            max_messages: 同HistoryStore
+            shared: 同HistoryStore
+            compact_after: 会话文件中的操作数超过该值时改写文件
+        """
+        super().__init__(batch_size, flush_interval, max_messages, shared)
+        self.directory = directory
+        self.compact_after = compact_after
+        os.makedirs(directory, exist_ok=True)
+        # 本进程已知的各会话文件中的操作数，用于决定何时改写
+        self._records: Dict[str, int] = {}
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, quote(session_id, safe="") + ".jsonl")
+
+    def _write(self, ops):
+        lines: Dict[str, List[str]] = {}
+        for session_id, op, encoded in ops:
+            lines.setdefault(session_id, []).append(f'{{"op": "{op}", "messages": [{", ".join(encoded)}]}}\n')
+        for session_id, session_lines in lines.items():
+            if self.shared and fcntl is not None:
+                with open(self._path(session_id) + ".lock", "a") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self._append(session_id, session_lines, compact=True)
+            else:
+                self._append(session_id, session_lines, compact=not self.shared)
+
+    def _append(self, session_id: str, session_lines: List[str], compact: bool):
+        # 一次write追加整批操作，O_APPEND保证多个进程的追加不会相互覆盖
+        with open(self._path(session_id), "a", encoding="utf-8") as f:
+            f.write("".join(session_lines))
+        records = self._records.get(session_id, 0) + len(session_lines)
+        self._records[session_id] = records
+        if compact and records > self.compact_after:
+            self._compact(session_id)
+
+    def _compact(self, session_id: str):
+        path = self._path(session_id)
+        messages = self._read(session_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "replace", "messages": messages}, ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+        self._records[session_id] = 1
+
+    def _read(self, session_id: str) -> List[Dict]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return []
+        messages: deque = deque(maxlen=self.max_messages)
+        records = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程在写入中途退出留下的不完整行
+                    continue
+                records += 1
+                if record["op"] == "replace":
+                    messages.clear()
+                messages.extend(record["messages"])
+        self._records[session_id] = records
+        return list(messages)
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    SQLite历史存储，所有会话保存在一个数据库文件中
+
+    使用WAL模式，多个进程可以同时读写；每次写入在一个事务中完成整批操作，并删除超出max_messages的旧消息。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64,
+        flush_interval: Optional[float] = 0.5,
+        max_messages: Optional[int] = 200,
+        shared: bool = False,
+        busy_timeout: float = 5.0,
+    ):
+        """
+        初始化SQLite历史存储
+
+        Args:
+            path: 数据库文件路径
+            batch_size: 同HistoryStore
+            flush_interval: 同HistoryStore
+            max_messages: 同HistoryStore
+            shared: 同HistoryStore
+            busy_timeout: 数据库被其他进程锁定时的最长等待时间（秒）
+        """
+        super().__init__(batch_size, flush_interval, max_messages, shared)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)")
+        self._conn_lock = threading.Lock()
+
+    def _write(self, ops):
+        touched = set()
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for session_id, op, encoded in ops:
+                    if op == "replace":
+                        self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    self._conn.executemany(
+                        "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                        [(session_id, line) for line in encoded],
+                    )
+                    touched.add(session_id)
+                if self.max_messages is not None:
+                    self._conn.executemany(
+                        "DELETE FROM messages WHERE session_id = ? AND seq < ("
+                        "SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                        [(session_id, session_id, self.max_messages - 1) for session_id in touched],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, session_id: str) -> List[Dict]:
+        limit = -1 if self.max_messages is None else self.max_messages
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT message FROM (SELECT seq, message FROM messages WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT ?) ORDER BY seq",
+                (session_id, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def sessions(self) -> List[str]:
+        self.flush()
+        with self._conn_lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT session_id FROM messages")]
+
+    def _close(self):
+        with self._conn_lock:
+            self._conn.close()
+
+
+class StoredHistory(deque):
+    """
+    与历史存储同步的对话历史，LLMClient.messages在使用存储时的类型
+
+    行为与deque(maxlen=max_history)相同，每次修改都会转换为存储的append/replace操作。
+    """
+
+    def __init__(self, store: HistoryStore, session_id: str, maxlen: Optional[int] = None):
+        super().__init__(store.load(session_id), maxlen)
+        self.store = store
+        self.session_id = session_id
+
+    def refresh(self):
+        """共享存储时重新加载历史，获取其他进程写入的消息"""
+        if self.store.shared:
+            deque.clear(self)
+            deque.extend(self, self.store.load(self.session_id))
+
+    def with_maxlen(self, maxlen: Optional[int]) -> "StoredHistory":
+        """返回保留最近maxlen条消息的新对象，不写入存储"""
+        history = StoredHistory.__new__(StoredHistory)
+        deque.__init__(history, self, maxlen)
+        history.store = self.store
+        history.session_id = self.session_id
+        return history
+
+    def _sync(self):
+        self.store.replace(self.session_id, list(self))
+
+    def append(self, message: Dict):
+        super().append(message)
+        self.store.append(self.session_id, [message])
+
+    def extend(self, messages):
+        messages = list(messages)
+        super().extend(messages)
+        self.store.append(self.session_id, messages)
+
+    def clear(self):
+        super().clear()
+        self.store.clear(self.session_id)
+
+    def pop(self) -> Dict:
+        message = super().pop()
+        self._sync()
+        return message
+
+    def popleft(self) -> Dict:
+        message = super().popleft()
+        self._sync()
+        return message
+
+    def appendleft(self, message: Dict):
+        super().appendleft(message)
+        self._sync()
+
+    def remove(self, message: Dict):
+        super().remove(message)
+        self._sync()
+
+    def __setitem__(self, index, message: Dict):
+        super().__setitem__(index, message)
+        self._sync()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._sync()
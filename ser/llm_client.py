@@ -1,33 +1,165 @@
+import asyncio
 import os
 from collections import deque
-from typing import List, Dict, Optional, Iterator
-from openai import OpenAI
-import httpx
+from typing import List, Dict, Optional, Iterator, AsyncIterator, Callable
+from openai import OpenAI, AsyncOpenAI
+
+from ser.audio import strip_audio
+from ser.cache import ResponseCache, build_completion, build_chunks
+from ser.metrics import LLMCallTimer, MetricsRegistry
+from ser.history_budget import COMPACTION_STRATEGIES, compact_history, count_messages_tokens, estimate_tokens
+from ser.history_store import HistoryStore, StoredHistory
+from ser.singleflight import CoalescingBackend
+from ser.transport import HttpPoolConfig, TransportRegistry, default_registry
 
 
 class StreamResponseWrapper:
-    def __init__(self, stream: Iterator, messages: deque):
+    def __init__(
+        self,
+        stream: Iterator,
+        messages: deque,
+        on_complete: Optional[Callable[[str], None]] = None,
+        timer: Optional[LLMCallTimer] = None,
+        partial: bool = False,
+    ):
         self.stream = stream
         self.messages = messages
+        self.on_complete = on_complete
+        self.timer = timer
+        self.partial = partial
         self.full_content = ""
         self._consumed = False
+        self._complete = False
+    
+    def mark_complete(self):
+        """
+        调用方已从流中得到完整结果（如完整的运动参数JSON或情绪标签），之后提前关闭流时
+        已收到的内容同样交给on_complete（例如写入缓存）；只对partial的流生效，
+        其缓存键与完整读取的调用不同，截断的回复不会被完整调用命中
+        """
+        if self.partial:
+            self._complete = True
+    
+    def _commit(self):
+        if self._complete and self.on_complete is not None and self.full_content:
+            self.on_complete(self.full_content)
+            self.on_complete = None
     
     def __iter__(self):
+        error = False
         try:
             for chunk in self.stream:
-                if hasattr(chunk, 'choices') and chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content:
-                        self.full_content += delta.content
+                self._observe(chunk)
+                yield chunk
+            # 只有完整读完或调用方标记为完整的回复才交给on_complete（例如写入缓存），其他提前关闭的流不算
+            self._complete = True
+            self._commit()
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record()
+            if self.timer is not None:
+                self.timer.finish(error)
+    
+    def _observe(self, chunk):
+        if hasattr(chunk, 'choices') and chunk.choices:
+            delta = chunk.choices[0].delta
+            if hasattr(delta, 'content') and delta.content:
+                if self.timer is not None and not self.full_content:
+                    self.timer.first_token()
+                self.full_content += delta.content
+        # 开启include_usage时，最后一个块不含choices，只带本次请求的token用量
+        if self.timer is not None and getattr(chunk, 'usage', None) is not None:
+            self.timer.usage(chunk.usage)
+    
+    def _record(self):
+        if self.full_content and not self._consumed:
+            assistant_message = {
+                "role": "assistant",
+                "content": self.full_content,
+            }
+            self.messages.append(assistant_message)
+            self._consumed = True
+    
+    def close(self):
+        """提前结束流式输出：关闭底层HTTP流并把已收到的内容写入对话历史"""
+        if hasattr(self.stream, 'close'):
+            self.stream.close()
+        self._commit()
+        self._record()
+        if self.timer is not None:
+            self.timer.finish()
+
+
+class AsyncStreamResponseWrapper:
+    """StreamResponseWrapper的异步版本，流结束后同样把完整回复写入对话历史"""
+
+    def __init__(
+        self,
+        stream: AsyncIterator,
+        messages: deque,
+        on_complete: Optional[Callable[[str], None]] = None,
+        timer: Optional[LLMCallTimer] = None,
+        partial: bool = False,
+    ):
+        self.stream = stream
+        self.messages = messages
+        self.on_complete = on_complete
+        self.timer = timer
+        self.partial = partial
+        self.full_content = ""
+        self._consumed = False
+        self._complete = False
+
+    mark_complete = StreamResponseWrapper.mark_complete
+    _commit = StreamResponseWrapper._commit
+
+    async def __aiter__(self):
+        error = False
+        try:
+            async for chunk in self.stream:
+                self._observe(chunk)
                 yield chunk
+            self._complete = True
+            self._commit()
+        except Exception:
+            error = True
+            raise
         finally:
-            if self.full_content and not self._consumed:
-                assistant_message = {
-                    "role": "assistant",
-                    "content": self.full_content,
-                }
-                self.messages.append(assistant_message)
-                self._consumed = True
+            self._record()
+            if self.timer is not None:
+                self.timer.finish(error)
+
+    _observe = StreamResponseWrapper._observe
+
+    def _record(self):
+        if self.full_content and not self._consumed:
+            assistant_message = {
+                "role": "assistant",
+                "content": self.full_content,
+            }
+            self.messages.append(assistant_message)
+            self._consumed = True
+
+    async def aclose(self):
+        """提前结束流式输出：关闭底层HTTP流并把已收到的内容写入对话历史"""
+        if hasattr(self.stream, 'close'):
+            await self.stream.close()
+        self._commit()
+        self._record()
+        if self.timer is not None:
+            self.timer.finish()
+
+
+class _SharedHistory:
+    """对话历史及其长度上限，from_client创建的异步客户端与原客户端共用同一个实例"""
+
+    __slots__ = ("messages", "max_history")
+
+    def __init__(self, max_history: Optional[int]):
+        self.messages: Optional[deque] = None
+        self.max_history = max_history
 
 
 class LLMClient:
@@ -40,6 +172,22 @@ class LLMClient:
         audio_config: Optional[Dict] = {"voice": "Cherry", "format": "wav"},
         max_history: Optional[int] = 4,
         system_message: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        http_config: Optional[HttpPoolConfig] = None,
+        share_http_pool: bool = True,
+        max_history_tokens: Optional[int] = None,
+        compaction: str = "drop_oldest",
+        tokenizer: Optional[Callable[[str], int]] = None,
+        compile_prompt: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+        metrics_stage: str = "llm",
+        backend=None,
+        keep_audio_history: bool = True,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict] = None,
+        history_store: Optional[HistoryStore] = None,
+        session_id: Optional[str] = None,
+        coalesce: bool = False,
     ):
         """
         初始化LLM客户端
@@ -52,59 +200,120 @@ class LLMClient:
             audio_config: 音频配置，默认为{"voice": "Cherry", "format": "wav"}
             max_history: 最大历史消息条数，None表示无限制，默认为None
             system_message: 系统消息（System Message），如果不提供则使用默认的情感识别prompt
+            cache: 回复缓存，命中时不发起请求，但对话历史的更新与真实调用完全一致
+            http_config: HTTP连接池配置（连接数上限、连接/读取超时、HTTP/2等），默认使用HttpPoolConfig()
+            share_http_pool: 是否与进程内其他客户端按base_url共享连接池，默认为True
+            max_history_tokens: 每次请求的prompt（含系统消息、历史和本次输入）的token预算，None表示只按条数限制
+            compaction: 历史超出token预算时的压缩策略，"drop_oldest"（丢弃最早的对话）、
+                        "labels_only"（助手回复只保留情绪标签）或"summarize"（早期对话折叠为本地摘要）
+            tokenizer: 计算文本token数的函数，默认使用本地估算estimate_tokens
+            compile_prompt: 是否编译系统消息（去掉缩进和Markdown装饰），编译结果对相同输入字节一致
+            metrics: 指标注册表，记录首token延迟、总耗时和token用量，None表示不记录
+            metrics_stage: 不在外层阶段内调用时，本客户端的记录使用的阶段名称
+            backend: 替代chat.completions.create的后端（如ser.replay中的录制/回放后端），
+                     需提供create(client, **params)与acreate(client, **params)，client为本客户端的OpenAI客户端
+            keep_audio_history: 是否在对话历史中保留用户消息里的音频，为False时只保留文本（没有文本时写入占位文本），
+                                避免之后的每次请求都重复上传音频
+            max_tokens: 每次回复的最大token数，None表示不限制
+            response_format: 结构化输出格式，如{"type": "json_object"}，None表示普通文本
+            history_store: 对话历史存储（见ser.history_store），提供时历史在首次使用时从存储加载，之后的修改批量写回，
+                           None表示只保存在内存中
+            session_id: 会话在history_store中的标识，使用history_store时必须提供
+            coalesce: 是否合并同时在途的相同请求（见ser.singleflight），为True时用CoalescingBackend包装backend；
+                      需要在多个客户端之间合并时，让它们共用同一个CoalescingBackend作为backend
         """
+        if history_store is not None and session_id is None:
+            raise ValueError("history_store requires session_id")
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         assert self.api_key is not None, "API key is not set"
         self.base_url = base_url
         self.model = model
         self.modalities = modalities
         self.audio_config = audio_config
-        self.max_history = max_history
+        self._history = _SharedHistory(max_history)
         
-        self.system_message = system_message
+        self.compile_prompt = compile_prompt
+        self.system_message = self._compile(system_message)
+        self.cache = cache
+        self.http_config = http_config
+        self.share_http_pool = share_http_pool
+        self.transport = default_registry if share_http_pool else TransportRegistry()
         
-        http_client = httpx.Client(
-            trust_env=False,
-            timeout=60.0,
-        )
+        if compaction not in COMPACTION_STRATEGIES:
+            raise ValueError(f"unknown compaction strategy: {compaction}")
+        self.max_history_tokens = max_history_tokens
+        self.compaction = compaction
+        self.tokenizer = tokenizer or estimate_tokens
+        # 最近一次请求的prompt token数（本地估算）
+        self.last_prompt_tokens = 0
+        self.metrics = metrics
+        self.metrics_stage = metrics_stage
+        self.backend = CoalescingBackend(inner=backend) if coalesce else backend
+        self.keep_audio_history = keep_audio_history
+        self.max_tokens = max_tokens
+        self.response_format = response_format
+        self._no_retry_client = None
+        self.history_store = history_store
+        self.session_id = session_id
+        
+        self.client = self._build_client()
+        
+        # 使用存储时在首次访问messages时才加载历史
+        if history_store is None:
+            self._history.messages = deque(maxlen=max_history)
+    
+    @property
+    def messages(self) -> deque:
+        """对话历史，使用history_store时为StoredHistory"""
+        if self._history.messages is None:
+            self._history.messages = StoredHistory(self.history_store, self.session_id, self.max_history)
+        return self._history.messages
+    
+    @messages.setter
+    def messages(self, messages: deque):
+        self._history.messages = messages
+    
+    @property
+    def max_history(self) -> Optional[int]:
+        return self._history.max_history
+    
+    @max_history.setter
+    def max_history(self, max_history: Optional[int]):
+        self._history.max_history = max_history
+    
+    def _build_client(self):
+        http_client = self.transport.get_client(self.base_url, self.http_config)
         
-        self.client = OpenAI(
+        return OpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
             http_client=http_client,
         )
-        
-        self.messages: deque = deque(maxlen=max_history)
     
-    def chat(
+    def _prepare_call(
         self,
         content: List[Dict],
-        role: str = "user",
-        stream: bool = True,
-        stream_options: Optional[Dict] = None,
-        reset_history: bool = False,
-    ) -> Iterator:
-        """
-        调用大语言模型进行对话
-        
-        Args:
-            content: 消息内容，可以是文本或多媒体内容列表
-            role: 消息角色，默认为"user"
-            stream: 是否使用流式输出，默认为True
-            stream_options: 流式输出选项
-            reset_history: 是否重置对话历史，默认为False
-        
-        Returns:
-            流式输出时返回迭代器，非流式输出时返回完整响应
-        """
+        role: str,
+        stream: bool,
+        stream_options: Optional[Dict],
+        reset_history: bool,
+        messages,
+        timeout: Optional[float] = None,
+    ) -> Dict:
+        """记录用户消息并构造请求参数，同步与异步客户端共用"""
+        if isinstance(messages, StoredHistory):
+            messages.refresh()
         if reset_history:
-            self.messages.clear()
+            messages.clear()
         
         user_message = {
             "role": role,
             "content": content,
         }
-        self.messages.append(user_message)
+        history_message = user_message
+        if not self.keep_audio_history and isinstance(content, list):
+            history_message = {"role": role, "content": strip_audio(content)}
+        messages.append(history_message)
         
         messages_with_system = []
         if self.system_message:
@@ -112,7 +321,13 @@ class LLMClient:
                 "role": "system",
                 "content": self.system_message,
             })
-        messages_with_system.extend(list(self.messages))
+        messages_with_system.extend(self._apply_budget(messages, messages_with_system, history_message))
+        # 历史中的用户消息可能去掉了音频，本次请求仍发送完整内容；max_history=0时历史为空，直接追加
+        if len(messages_with_system) > bool(self.system_message) and messages_with_system[-1] is history_message:
+            messages_with_system[-1] = user_message
+        else:
+            messages_with_system.append(user_message)
+        self.last_prompt_tokens = count_messages_tokens(messages_with_system, self.tokenizer)
         call_params = {
             "model": self.model,
             "messages": messages_with_system,
@@ -125,29 +340,168 @@ class LLMClient:
             call_params["stream_options"] = stream_options
         elif stream:
             call_params["stream_options"] = {"include_usage": True}
+        if self.max_tokens is not None:
+            call_params["max_tokens"] = self.max_tokens
+        if self.response_format is not None:
+            call_params["response_format"] = self.response_format
+        if timeout is not None:
+            call_params["timeout"] = timeout
+        return call_params
+    
+    def _recent(self, messages) -> List[Dict]:
+        """外部传入的历史列表没有长度上限，发送时同样只取最近max_history条"""
+        recent = list(messages)
+        if self.max_history is not None:
+            recent = recent[max(len(recent) - self.max_history, 0):] if self.max_history else []
+        return recent
+    
+    def _apply_budget(self, messages, system_messages: List[Dict], user_message: Dict) -> List[Dict]:
+        """按token预算压缩历史，压缩结果写回messages，使之后的请求保持相同的前缀"""
+        recent = self._recent(messages)
+        if self.max_history_tokens is None:
+            return recent
+        budget = self.max_history_tokens - count_messages_tokens(system_messages + [user_message], self.tokenizer)
+        history = recent[:-1]
+        compacted = compact_history(history, budget, self.compaction, self.tokenizer)
+        if compacted is history:
+            return recent
+        messages.clear()
+        messages.extend(compacted)
+        messages.append(user_message)
+        return compacted + [user_message]
+    
+    def _without_retries(self, client):
+        """带timeout的请求由调用方决定是否重试，SDK内置的重试会让实际耗时成倍超出timeout"""
+        if self._no_retry_client is None or self._no_retry_client[0] is not client:
+            self._no_retry_client = (client, client.with_options(max_retries=0))
+        return self._no_retry_client[1]
+    
+    def _create(self, call_params: Dict):
+        client = self.client if "timeout" not in call_params else self._without_retries(self.client)
+        if self.backend is not None:
+            return self.backend.create(client, **call_params)
+        return client.chat.completions.create(**call_params)
+    
+    def _start_timer(self) -> Optional[LLMCallTimer]:
+        if self.metrics is None:
+            return None
+        return LLMCallTimer(self.metrics, self.metrics_stage)
+    
+    def _finish_timer(self, timer: Optional[LLMCallTimer], response=None, cached: bool = False):
+        """结束非流式调用的计时，流式调用由响应包装器在流结束时结束计时"""
+        if timer is None:
+            return
+        if cached:
+            timer.hit_cache()
+        if response is not None:
+            timer.usage(getattr(response, 'usage', None))
+        timer.finish(error=response is None and not cached)
+    
+    def _record_response(self, response, messages):
+        if hasattr(response, 'choices') and response.choices:
+            assistant_message = {
+                "role": "assistant",
+                "content": response.choices[0].message.content,
+            }
+            messages.append(assistant_message)
+    
+    def _lookup_cache(self, content: List[Dict], messages, call_params: Dict, partial: bool = False):
+        """返回(缓存键, 缓存的回复)，未配置缓存时均为None"""
+        if self.cache is None:
+            return None, None
+        history = self._recent(messages)[:-1]
+        key = self.cache.make_key(self.model, self.system_message, history, content, call_params, partial=partial)
+        return key, self.cache.get(key)
+    
+    def _cache_writer(self, key: Optional[str]) -> Optional[Callable[[str], None]]:
+        if key is None:
+            return None
+        return lambda full_content: self.cache.set(key, full_content)
+    
+    def _store_cache(self, key: Optional[str], response):
+        if key is not None and hasattr(response, 'choices') and response.choices:
+            full_content = response.choices[0].message.content
+            if full_content:
+                self.cache.set(key, full_content)
+    
+    def chat(
+        self,
+        content: List[Dict],
+        role: str = "user",
+        stream: bool = True,
+        stream_options: Optional[Dict] = None,
+        reset_history: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        partial: bool = False,
+    ) -> Iterator:
+        """
+        调用大语言模型进行对话
+        
+        Args:
+            content: 消息内容，可以是文本或多媒体内容列表
+            role: 消息角色，默认为"user"
+            stream: 是否使用流式输出，默认为True
+            stream_options: 流式输出选项
+            reset_history: 是否重置对话历史，默认为False
+            history: 外部对话历史列表，提供时使用并更新该列表而非客户端自身的历史，
+                     传入空列表即为无状态调用，可在多个线程中并发使用同一个客户端
+            timeout: 本次请求的超时（秒），None表示使用HTTP连接池的默认超时；
+                     设置后不使用SDK内置的重试，流式输出时为每次读取的超时
+            partial: 调用方可能在得到所需结果后调用mark_complete并提前关闭流（如只取情绪标签），
+                     这样的回复使用单独的缓存键，只在partial的调用之间复用
+        
+        Returns:
+            流式输出时返回迭代器，非流式输出时返回完整响应
+        """
+        messages = self.messages if history is None else history
+        call_params = self._prepare_call(content, role, stream, stream_options, reset_history, messages, timeout)
         
-        completion = self.client.chat.completions.create(**call_params)
+        timer = self._start_timer()
+        cache_key, cached = self._lookup_cache(content, messages, call_params, partial)
+        if cached is not None:
+            if stream:
+                if timer is not None:
+                    timer.hit_cache()
+                return StreamResponseWrapper(iter(build_chunks(cached, self.model)), messages, timer=timer)
+            response = build_completion(cached, self.model)
+            self._record_response(response, messages)
+            self._finish_timer(timer, cached=True)
+            return response
+        
+        try:
+            completion = self._create(call_params)
+        except Exception:
+            self._finish_timer(timer)
+            raise
         
         if stream:
-            return StreamResponseWrapper(completion, self.messages)
+            return StreamResponseWrapper(completion, messages, self._cache_writer(cache_key), timer, partial)
         else:
             response = completion
-            if hasattr(response, 'choices') and response.choices:
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response.choices[0].message.content,
-                }
-                self.messages.append(assistant_message)
+            self._record_response(response, messages)
+            self._store_cache(cache_key, response)
+            self._finish_timer(timer, response)
             return response
     
+    def _compile(self, system_message: Optional[str]) -> Optional[str]:
+        if self.compile_prompt and system_message:
+            # 延迟导入，避免python -m ser.prompt_compiler时模块被提前导入
+            from ser.prompt_compiler import compile_prompt
+            return compile_prompt(system_message)
+        return system_message
+    
     def set_system_message(self, system_message: str):
-        self.system_message = system_message
+        self.system_message = self._compile(system_message)
     
     def get_system_message(self) -> str:
         return self.system_message
     
     def set_max_history(self, max_history: Optional[int]):
         self.max_history = max_history
+        if isinstance(self.messages, StoredHistory):
+            self.messages = self.messages.with_maxlen(max_history)
+            return
         current_messages = list(self.messages)
         self.messages = deque(current_messages, maxlen=max_history)
     
@@ -156,6 +510,142 @@ class LLMClient:
     
     def get_history(self) -> List[Dict]:
         return list(self.messages)
+    
+    def pop_history(self, count: int = 1) -> List[Dict]:
+        """从历史末尾移除count条消息，按原顺序返回被移除的消息"""
+        removed = []
+        for _ in range(min(count, len(self.messages))):
+            removed.append(self.messages.pop())
+        return removed[::-1]
+    
+    def extend_history(self, messages: List[Dict]):
+        """在历史末尾追加消息，不发起请求"""
+        self.messages.extend(messages)
+
+
+class AsyncLLMClient(LLMClient):
+    """
+    基于httpx.AsyncClient/AsyncOpenAI的异步LLM客户端
+
+    对话历史的维护方式与LLMClient完全一致，一个事件循环即可同时驱动大量会话。
+    底层AsyncOpenAI客户端按事件循环惰性创建，避免跨事件循环复用连接。
+    """
+
+    def _build_client(self):
+        self._loop = None
+        return None
+
+    def _get_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._loop is not loop:
+            http_client = self.transport.get_async_client(self.base_url, self.http_config)
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+            )
+            self._loop = loop
+        return self.client
+
+    async def _acreate(self, call_params: Dict):
+        client = self._get_client()
+        if "timeout" in call_params:
+            client = self._without_retries(client)
+        if self.backend is not None:
+            return await self.backend.acreate(client, **call_params)
+        return await client.chat.completions.create(**call_params)
+
+    @classmethod
+    def from_client(cls, llm_client: LLMClient) -> "AsyncLLMClient":
+        """
+        基于已有的同步客户端创建异步客户端，二者共享同一份对话历史
+
+        Args:
+            llm_client: 同步LLMClient实例
+
+        Returns:
+            与llm_client配置相同、共享messages的AsyncLLMClient
+        """
+        async_client = cls(
+            api_key=llm_client.api_key,
+            base_url=llm_client.base_url,
+            model=llm_client.model,
+            modalities=llm_client.modalities,
+            audio_config=llm_client.audio_config,
+            max_history=llm_client.max_history,
+            system_message=llm_client.system_message,
+            cache=llm_client.cache,
+            http_config=llm_client.http_config,
+            share_http_pool=llm_client.share_http_pool,
+            max_history_tokens=llm_client.max_history_tokens,
+            compaction=llm_client.compaction,
+            tokenizer=llm_client.tokenizer,
+            compile_prompt=llm_client.compile_prompt,
+            metrics=llm_client.metrics,
+            metrics_stage=llm_client.metrics_stage,
+            backend=llm_client.backend,
+            keep_audio_history=llm_client.keep_audio_history,
+            max_tokens=llm_client.max_tokens,
+            response_format=llm_client.response_format,
+            history_store=llm_client.history_store,
+            session_id=llm_client.session_id,
+        )
+        async_client.transport = llm_client.transport
+        # 共用历史的容器而不是deque本身，任一方调用set_max_history替换deque后双方仍然一致
+        async_client._history = llm_client._history
+        return async_client
+
+    async def chat(
+        self,
+        content: List[Dict],
+        role: str = "user",
+        stream: bool = True,
+        stream_options: Optional[Dict] = None,
+        reset_history: bool = False,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+        partial: bool = False,
+    ):
+        """
+        异步调用大语言模型进行对话，参数含义与LLMClient.chat相同
+
+        Returns:
+            流式输出时返回异步迭代器，非流式输出时返回完整响应
+        """
+        messages = self.messages if history is None else history
+        call_params = self._prepare_call(content, role, stream, stream_options, reset_history, messages, timeout)
+
+        timer = self._start_timer()
+        cache_key, cached = self._lookup_cache(content, messages, call_params, partial)
+        if cached is not None:
+            if stream:
+                if timer is not None:
+                    timer.hit_cache()
+                return AsyncStreamResponseWrapper(_aiter(build_chunks(cached, self.model)), messages, timer=timer)
+            response = build_completion(cached, self.model)
+            self._record_response(response, messages)
+            self._finish_timer(timer, cached=True)
+            return response
+
+        try:
+            completion = await self._acreate(call_params)
+        except Exception:
+            self._finish_timer(timer)
+            raise
+
+        if stream:
+            return AsyncStreamResponseWrapper(completion, messages, self._cache_writer(cache_key), timer, partial)
+        else:
+            response = completion
+            self._record_response(response, messages)
+            self._store_cache(cache_key, response)
+            self._finish_timer(timer, response)
+            return response
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
 
 
 if __name__ == "__main__":
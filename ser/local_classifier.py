@@ -0,0 +1,272 @@
+"""
+本地情感分类器：用记录下来的（文本, LLM给出的情绪标签）训练的小模型，作为情感识别的第一层
+
+特征为哈希后的字符n-gram，模型为NumPy实现的多分类逻辑回归，单条预测耗时远小于1毫秒。
+TextEmotionRecognizer在置信度足够高时直接使用本地结果，否则再调用LLM。
+
+用法：
+    recognizer = TextEmotionRecognizer(label_log="labels.jsonl")   # 正常使用，同时记录LLM的标签
+    python -m ser.local_classifier train labels.jsonl --out emotion.npz
+    python -m ser.local_classifier evaluate labels.jsonl --model emotion.npz
+    recognizer = TextEmotionRecognizer(local_classifier=LocalEmotionClassifier.load("emotion.npz"),
+                                       local_threshold=0.9)
+"""
+import argparse
+import json
+import threading
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+NUM_CLASSES = 6
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+def hash_features(text: str, n_features: int, ngram_range: Tuple[int, int] = (1, 3)) -> np.ndarray:
+    """
+    把文本转换为哈希后的字符n-gram特征下标
+
+    使用crc32而不是内置hash，保证不同进程中的结果一致。
+
+    Returns:
+        特征下标数组，同一个n-gram出现多次时下标重复
+    """
+    text = text.strip().lower()
+    low, high = ngram_range
+    indices = [
+        zlib.crc32(text[start:start + n].encode("utf-8")) % n_features
+        for n in range(low, high + 1)
+        for start in range(len(text) - n + 1)
+    ]
+    return np.array(indices, dtype=np.int64)
+
+
+class LocalEmotionClassifier:
+    """
+    哈希字符n-gram + 多分类逻辑回归的情感分类器
+
+    每条文本的特征按出现次数计数并做L2归一化，类别编号与EMOTION_MAP一致。
+    """
+
+    def __init__(self, n_features: int = 2 ** 16, ngram_range: Tuple[int, int] = (1, 3)):
+        """
+        初始化分类器
+
+        Args:
+            n_features: 哈希空间大小
+            ngram_range: 字符n-gram的长度范围（含两端）
+        """
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.weights = np.zeros((n_features, NUM_CLASSES), dtype=np.float32)
+        self.bias = np.zeros(NUM_CLASSES, dtype=np.float32)
+
+    def _batch(self, texts: Sequence[str]):
+        """把一批文本展开成(特征下标, 特征值, 每条文本的起始位置)"""
+        features = [hash_features(text, self.n_features, self.ngram_range) for text in texts]
+        lengths = np.array([len(f) for f in features])
+        indices = np.concatenate(features) if features else np.zeros(0, dtype=np.int64)
+        values = np.repeat(1.0 / np.sqrt(np.maximum(lengths, 1)), lengths).astype(np.float32)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        return indices, values, offsets, lengths
+
+    def _logits(self, indices, values, offsets, lengths) -> np.ndarray:
+        logits = np.zeros((len(lengths), NUM_CLASSES), dtype=np.float32)
+        nonempty = lengths > 0
+        if indices.size:
+            contributions = self.weights[indices] * values[:, None]
+            logits[nonempty] = np.add.reduceat(contributions, offsets[nonempty], axis=0)
+        return logits + self.bias
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def fit(
+        self,
+        texts: Sequence[str],
+        labels: Sequence[int],
+        epochs: int = 200,
+        learning_rate: float = 10.0,
+        l2: float = 1e-4,
+    ) -> "LocalEmotionClassifier":
+        """
+        用全量梯度下降训练
+
+        Args:
+            texts: 文本列表
+            labels: 对应的情绪编号（0~5）
+            epochs: 迭代次数
+            learning_rate: 学习率
+            l2: L2正则系数
+
+        Returns:
+            分类器自身
+        """
+        indices, values, offsets, lengths = self._batch(texts)
+        targets = np.eye(NUM_CLASSES, dtype=np.float32)[np.asarray(labels)]
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        count = max(len(lengths), 1)
+        for _ in range(epochs):
+            grad = (self._softmax(self._logits(indices, values, offsets, lengths)) - targets) / count
+            # 按特征下标累加梯度，bincount比np.add.at快一个数量级
+            sample_grad = grad[rows] * values[:, None]
+            grad_weights = np.stack(
+                [np.bincount(indices, weights=sample_grad[:, k], minlength=self.n_features) for k in range(NUM_CLASSES)],
+                axis=1,
+            )
+            self.weights -= learning_rate * (grad_weights + self.weights * l2).astype(np.float32)
+            self.bias -= learning_rate * grad.sum(axis=0)
+        return self
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """返回(文本数, 6)的各类别概率"""
+        return self._softmax(self._logits(*self._batch(texts)))
+
+    def predict(self, text: str) -> Tuple[int, float]:
+        """
+        预测单条文本
+
+        Returns:
+            (情绪编号, 置信度)
+        """
+        indices = hash_features(text, self.n_features, self.ngram_range)
+        logits = self.bias.copy()
+        if indices.size:
+            logits += self.weights[indices].sum(axis=0) / np.sqrt(indices.size)
+        exp = np.exp(logits - logits.max())
+        probs = exp / exp.sum()
+        label = int(probs.argmax())
+        return label, float(probs[label])
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            ngram_range=np.array(self.ngram_range),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalEmotionClassifier":
+        data = np.load(path)
+        classifier = cls(n_features=data["weights"].shape[0], ngram_range=tuple(int(n) for n in data["ngram_range"]))
+        classifier.weights = data["weights"].astype(np.float32)
+        classifier.bias = data["bias"].astype(np.float32)
+        return classifier
+
+
+class LabelLog:
+    """追加写入（文本, 情绪编号）的JSON Lines日志，线程安全"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, text: str, label: int):
+        line = json.dumps({"text": text, "label": label}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def load_pairs(path: str) -> Tuple[List[str], List[int]]:
+    """读取LabelLog写入的日志，相同文本只保留最后一次的标签"""
+    pairs: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                pairs[record["text"]] = int(record["label"])
+    return list(pairs), list(pairs.values())
+
+
+def agreement_report(
+    classifier: LocalEmotionClassifier,
+    texts: Sequence[str],
+    labels: Sequence[int],
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+) -> List[Dict[str, float]]:
+    """
+    计算不同置信度阈值下本地分类器与LLM标签的一致率
+
+    Returns:
+        每个阈值一项：threshold、coverage（本地直接回答的比例）、agreement（其中与LLM一致的比例）、
+        overall（本地回答与LLM回答合并后与LLM一致的比例）
+    """
+    probs = classifier.predict_proba(texts)
+    predicted = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+    correct = predicted == np.asarray(labels)
+    rows = []
+    for threshold in thresholds:
+        answered = confidence >= threshold
+        coverage = float(answered.mean()) if len(texts) else 0.0
+        agreement = float(correct[answered].mean()) if answered.any() else 1.0
+        rows.append({
+            "threshold": threshold,
+            "coverage": coverage,
+            "agreement": agreement,
+            "overall": 1.0 - coverage * (1.0 - agreement),
+        })
+    return rows
+
+
+def _print_report(rows: List[Dict[str, float]]):
+    print(f"{'threshold':>10}{'coverage':>10}{'agreement':>11}{'overall':>9}")
+    for row in rows:
+        print(
+            f"{row['threshold']:>10.2f}{row['coverage']:>10.1%}"
+            f"{row['agreement']:>11.1%}{row['overall']:>9.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练/评估本地情感分类器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="用LabelLog日志训练模型")
+    train.add_argument("log", help="LabelLog写入的JSON Lines日志")
+    train.add_argument("--out", required=True, help="模型保存路径（.npz）")
+    train.add_argument("--holdout", type=float, default=0.2, help="留出评估的比例")
+    train.add_argument("--epochs", type=int, default=200)
+    train.add_argument("--learning-rate", type=float, default=10.0)
+    train.add_argument("--l2", type=float, default=1e-4)
+    train.add_argument("--n-features", type=int, default=2 ** 16)
+    train.add_argument("--seed", type=int, default=0)
+    evaluate = subparsers.add_parser("evaluate", help="评估已训练的模型与日志中LLM标签的一致率")
+    evaluate.add_argument("log")
+    evaluate.add_argument("--model", required=True)
+    args = parser.parse_args()
+
+    texts, labels = load_pairs(args.log)
+    if args.command == "evaluate":
+        classifier = LocalEmotionClassifier.load(args.model)
+        print(f"{len(texts)} samples")
+        _print_report(agreement_report(classifier, texts, labels))
+        return
+
+    order = np.random.default_rng(args.seed).permutation(len(texts))
+    split = int(len(texts) * (1 - args.holdout))
+    train_ids, test_ids = order[:split], order[split:]
+    classifier = LocalEmotionClassifier(n_features=args.n_features).fit(
+        [texts[i] for i in train_ids],
+        [labels[i] for i in train_ids],
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        l2=args.l2,
+    )
+    print(f"trained on {len(train_ids)} samples, evaluating on {len(test_ids)} held-out samples")
+    if len(test_ids):
+        _print_report(agreement_report(classifier, [texts[i] for i in test_ids], [labels[i] for i in test_ids]))
+    # 评估之后用全部数据重新训练再保存
+    classifier = LocalEmotionClassifier(n_features=args.n_features).fit(
+        texts, labels, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2,
+    )
+    classifier.save(args.out)
+    print(f"saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
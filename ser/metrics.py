@@ -0,0 +1,315 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+# 当前正在进行的阶段记录，以及请求开始排队的时间（批量处理、会话锁等）
+_current_call: ContextVar[Optional["CallMetrics"]] = ContextVar("ser_current_call", default=None)
+_queued_at: ContextVar[Optional[float]] = ContextVar("ser_queued_at", default=None)
+
+_TIMINGS = ("queue_time", "ttft", "latency", "parse_time")
+
+
+class CallMetrics:
+    """
+    一次调用的指标记录
+
+    时间单位均为秒，未测量到的字段为None：非流式调用没有ttft，缓存命中没有token数。
+    """
+
+    __slots__ = (
+        "stage", "started", "queue_time", "ttft", "latency", "parse_time",
+        "prompt_tokens", "completion_tokens", "llm_calls", "cached", "error",
+    )
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.started = time.perf_counter()
+        self.queue_time: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.parse_time: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        self.cached = False
+        self.error = False
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__ if name != "started"}
+
+
+class Histogram:
+    """Prometheus风格的累积直方图，非线程安全，由MetricsRegistry加锁"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class MetricsRegistry:
+    """
+    按阶段（emotion、motion、gait等）汇总调用指标，提供回调钩子和Prometheus文本格式导出
+
+    阶段记录通过contextvars在调用链中传递：外层阶段（如gait）汇总内层阶段的token数，
+    内层的LLM调用把首token延迟和token用量写入最近的阶段记录。线程安全。
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, namespace: str = "ser"):
+        """
+        初始化指标注册表
+
+        Args:
+            buckets: 各时间直方图的桶上界（秒）
+            namespace: 导出的指标名前缀
+        """
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._hooks: List[Callable[[CallMetrics], None]] = []
+        self._histograms: Dict[tuple, Histogram] = {}
+        self._counters: Dict[tuple, float] = {}
+
+    def add_hook(self, hook: Callable[[CallMetrics], None]):
+        """注册回调，每条阶段记录完成时以CallMetrics为参数调用"""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[CallMetrics], None]):
+        self._hooks.remove(hook)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        测量一个阶段，退出时记录总耗时并提交记录
+
+        Args:
+            name: 阶段名称
+
+        Yields:
+            本阶段的CallMetrics
+        """
+        record = CallMetrics(name)
+        parent = _current_call.get()
+        if parent is None:
+            queued_at = _queued_at.get()
+            if queued_at is not None:
+                record.queue_time = max(record.started - queued_at, 0.0)
+        token = _current_call.set(record)
+        try:
+            yield record
+        except BaseException:
+            record.error = True
+            raise
+        finally:
+            _current_call.reset(token)
+            record.latency = time.perf_counter() - record.started
+            if parent is not None:
+                _merge_into(parent, record)
+            self.observe(record)
+
+    def observe(self, record: CallMetrics):
+        """提交一条记录：更新直方图与计数器，然后调用钩子"""
+        stage = record.stage
+        with self._lock:
+            for name in _TIMINGS:
+                value = getattr(record, name)
+                if value is not None:
+                    key = (name, stage)
+                    if key not in self._histograms:
+                        self._histograms[key] = Histogram(self.buckets)
+                    self._histograms[key].observe(value)
+            for name, value in (
+                ("calls", 1),
+                ("errors", int(record.error)),
+                ("cache_hits", int(record.cached)),
+                ("llm_calls", record.llm_calls),
+                ("prompt_tokens", record.prompt_tokens),
+                ("completion_tokens", record.completion_tokens),
+            ):
+                key = (name, stage)
+                self._counters[key] = self._counters.get(key, 0) + value
+        for hook in list(self._hooks):
+            try:
+                hook(record)
+            except Exception as e:
+                print(f"metrics hook failed: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        获取各阶段的汇总统计
+
+        Returns:
+            以阶段为键的字典，每项包含calls、errors、cache_hits、llm_calls、prompt_tokens、
+            completion_tokens，以及各时间指标的平均值（如ttft_mean）
+        """
+        with self._lock:
+            result: Dict[str, Dict[str, float]] = {}
+            for (name, stage), value in self._counters.items():
+                result.setdefault(stage, {})[name] = value
+            for (name, stage), histogram in self._histograms.items():
+                result.setdefault(stage, {})[f"{name}_mean"] = histogram.sum / histogram.count
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def export_prometheus(self) -> str:
+        """导出Prometheus文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            for metric in _TIMINGS:
+                name = f"{self.namespace}_{metric.replace('_time', '')}_seconds"
+                series = sorted(
+                    ((stage, histogram) for (key, stage), histogram in self._histograms.items() if key == metric),
+                    key=lambda item: item[0],
+                )
+                if not series:
+                    continue
+                lines.append(f"# TYPE {name} histogram")
+                for stage, histogram in series:
+                    for bound, count in zip(self.buckets + ("+Inf",), histogram.cumulative()):
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            for metric in ("calls", "errors", "cache_hits", "llm_calls", "prompt_tokens", "completion_tokens"):
+                name = f"{self.namespace}_{metric}_total"
+                series = sorted((stage, value) for (key, stage), value in self._counters.items() if key == metric)
+                if not series:
+                    continue
+                lines.append(f"# TYPE {name} counter")
+                for stage, value in series:
+                    lines.append(f'{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int = 9464, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        在后台线程中启动HTTP服务，GET任意路径返回export_prometheus()的内容
+
+        Returns:
+            HTTP服务对象，调用shutdown()停止
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.export_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="ser-metrics", daemon=True).start()
+        return server
+
+
+def _merge_into(parent: CallMetrics, child: CallMetrics):
+    parent.prompt_tokens += child.prompt_tokens
+    parent.completion_tokens += child.completion_tokens
+    parent.llm_calls += child.llm_calls
+    if child.parse_time is not None:
+        parent.parse_time = (parent.parse_time or 0.0) + child.parse_time
+    if parent.ttft is None and child.ttft is not None:
+        parent.ttft = child.started - parent.started + child.ttft
+
+
+def stage(metrics: Optional[MetricsRegistry], name: str):
+    """metrics为None时返回空的上下文管理器，便于在未启用指标时直接使用with语句"""
+    if metrics is None:
+        return nullcontext()
+    return metrics.stage(name)
+
+
+def current_call() -> Optional[CallMetrics]:
+    return _current_call.get()
+
+
+@contextmanager
+def queued_since(timestamp: float):
+    """标记请求开始排队的时间，其中第一个阶段记录从该时间起计算queue_time；嵌套时保留更早的时间"""
+    outer = _queued_at.get()
+    token = _queued_at.set(timestamp if outer is None else min(outer, timestamp))
+    try:
+        yield
+    finally:
+        _queued_at.reset(token)
+
+
+@contextmanager
+def timed_parse():
+    """把with块的耗时累加到当前阶段记录的parse_time"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _current_call.get()
+        if record is not None:
+            record.parse_time = (record.parse_time or 0.0) + time.perf_counter() - start
+
+
+class LLMCallTimer:
+    """
+    单次LLM请求的计时器，由LLMClient创建
+
+    在阶段内调用时把数据写入当前阶段记录；没有外层阶段时自己作为一个阶段（以客户端的stage命名）提交。
+    """
+
+    __slots__ = ("metrics", "record", "owned", "started")
+
+    def __init__(self, metrics: MetricsRegistry, stage_name: str):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.record = _current_call.get()
+        self.owned = self.record is None
+        if self.owned:
+            self.record = CallMetrics(stage_name)
+            queued_at = _queued_at.get()
+            if queued_at is not None:
+                self.record.queue_time = max(self.started - queued_at, 0.0)
+        self.record.llm_calls += 1
+
+    def hit_cache(self):
+        self.record.cached = True
+
+    def first_token(self):
+        if self.record.ttft is None:
+            self.record.ttft = time.perf_counter() - self.record.started
+
+    def usage(self, usage):
+        if usage is not None:
+            self.record.prompt_tokens += usage.prompt_tokens or 0
+            self.record.completion_tokens += usage.completion_tokens or 0
+
+    def finish(self, error: bool = False):
+        if not self.owned:
+            return
+        self.owned = False
+        self.record.error = self.record.error or error
+        self.record.latency = time.perf_counter() - self.record.started
+        self.metrics.observe(self.record)
+
@@ -0,0 +1,294 @@
+"""
+本地模拟的OpenAI兼容服务，只实现 POST /chat/completions，用于离线测试与基准测试
+
+回复内容按系统消息判断：融合模式返回情绪标签加步态JSON，运动生成返回步态JSON，标签模式只返回情绪标签，
+其余返回带情绪标签的对话。请求带max_tokens时回复按token数截断。
+方向参数由CommandMatcher根据用户输入给出，情绪编号由输入文本决定，同一输入的回复总是相同。
+
+用法：
+    python -m ser.mock_server --port 8000 --ttft 0.2 --tokens-per-second 50
+    # 然后把base_url设为 http://127.0.0.1:8000/v1
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from ser.command_matcher import CommandMatcher
+from ser.history_budget import estimate_tokens, message_text
+
+EMOTION_REPLIES = [
+    "好的，我明白了。",
+    "太棒了！恭喜你！",
+    "辛苦了，好好休息一下吧。",
+    "相信你一定可以的！",
+    "别担心，我会陪着你。",
+    "哈哈，不用不好意思啦。",
+]
+# 与EMOTION_FREQ_OFFSET一致：normal, happy, tired, confident, afraid, shy
+FREQ_OFFSETS = [0.0, 0.05, -0.05, 0.05, -0.05, 0.0]
+EMOTION_NAMES = ["normal", "happy", "tired", "confident", "afraid", "shy"]
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的监听队列只有5，高并发压测时会出现连接被重置
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭空闲的keep-alive连接是正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockLLMServer:
+    """
+    模拟的OpenAI兼容服务，在后台线程中运行
+
+    首token延迟和输出速度可配置，流式输出按token速度逐块发送，最后附带usage块。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ttft: float = 0.2,
+        tokens_per_second: float = 50.0,
+        chunk_tokens: int = 4,
+        outlier_rate: float = 0.0,
+        outlier_delay: float = 3.0,
+        error_rate: float = 0.0,
+    ):
+        """
+        初始化模拟服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            ttft: 收到请求到发出第一个内容块的延迟（秒）
+            tokens_per_second: 输出速度，0或None表示不限速
+            chunk_tokens: 流式输出时每个块包含的token数（按字符估算）
+            outlier_rate: 慢请求的比例，用于模拟偶发的长尾延迟
+            outlier_delay: 慢请求额外增加的首token延迟（秒）
+            error_rate: 返回500错误的请求比例，用于模拟服务故障
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.outlier_rate = outlier_rate
+        self.outlier_delay = outlier_delay
+        self.error_rate = error_rate
+        self.command_matcher = CommandMatcher()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ser-mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行，直到KeyboardInterrupt"""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply(self, messages: List[Dict], response_format: Optional[Dict] = None) -> str:
+        """根据请求消息生成回复文本"""
+        system = message_text(messages[0]) if messages and messages[0].get("role") == "system" else ""
+        text = message_text(messages[-1]) if messages else ""
+        emotion_id = zlib.crc32(text.encode("utf-8")) % len(EMOTION_REPLIES)
+        for emotion_name in EMOTION_NAMES:
+            if f"[EMOTION:{emotion_name}]" in text:
+                emotion_id = EMOTION_NAMES.index(emotion_name)
+
+        match = self.command_matcher.match(text) or {"y_vel": 0.0, "yaw_vel": 0.0}
+        gait = json.dumps({
+            "y_vel": match["y_vel"],
+            "yaw_vel": match["yaw_vel"],
+            "freq_offset": FREQ_OFFSETS[emotion_id],
+        })
+        if "y_vel" in system and ("情感识别" in system or "emotion recognition" in system.lower()):
+            return f"[EMOTION:{emotion_id}]\n{gait}"
+        if "y_vel" in system:
+            return gait
+        if (response_format or {}).get("type") == "json_object":
+            return json.dumps({"emotion": emotion_id})
+        if "只输出情绪标签" in system:
+            return f"[EMOTION:{emotion_id}]"
+        return f"{EMOTION_REPLIES[emotion_id]}\n[EMOTION:{emotion_id}]"
+
+    def _delay(self, tokens: int):
+        if self.tokens_per_second:
+            time.sleep(tokens / self.tokens_per_second)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，不关闭Nagle算法时与客户端的延迟ACK叠加，每个请求固定多出约40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with server._lock:
+                    server.requests += 1
+                if server.error_rate and random.random() < server.error_rate:
+                    self._send_json({"error": {"message": "mock server error", "type": "server_error"}}, status=500)
+                    return
+                messages = body.get("messages", [])
+                content = server.reply(messages, body.get("response_format"))
+                finish_reason = "stop"
+                max_tokens = body.get("max_tokens")
+                if max_tokens is not None and estimate_tokens(content) > max_tokens:
+                    while content and estimate_tokens(content) > max_tokens:
+                        content = content[:-1]
+                    finish_reason = "length"
+                usage = {
+                    "prompt_tokens": sum(estimate_tokens(message_text(m)) + 4 for m in messages),
+                    "completion_tokens": estimate_tokens(content),
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                model = body.get("model", "mock")
+
+                ttft = server.ttft
+                if server.outlier_rate and random.random() < server.outlier_rate:
+                    ttft += server.outlier_delay
+                time.sleep(ttft)
+                if body.get("stream"):
+                    self._stream(content, model, usage, body.get("stream_options") or {}, finish_reason)
+                else:
+                    server._delay(usage["completion_tokens"])
+                    self._send_json({
+                        "id": "mock",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "finish_reason": finish_reason,
+                            "message": {"role": "assistant", "content": content},
+                        }],
+                        "usage": usage,
+                    })
+
+            def _send_json(self, payload: Dict, status: int = 200):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_event(self, payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _chunk(self, model: str, delta: Dict, finish_reason: Optional[str] = None) -> str:
+                return json.dumps({
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }, ensure_ascii=False)
+
+            def _stream(self, content: str, model: str, usage: Dict, stream_options: Dict, finish_reason: str = "stop"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    pieces = []
+                    piece = ""
+                    for char in content:
+                        piece += char
+                        if estimate_tokens(piece) >= server.chunk_tokens:
+                            pieces.append(piece)
+                            piece = ""
+                    if piece:
+                        pieces.append(piece)
+                    for index, piece in enumerate(pieces):
+                        if index:
+                            server._delay(estimate_tokens(piece))
+                        delta = {"content": piece}
+                        if index == 0:
+                            delta["role"] = "assistant"
+                        self._write_event(self._chunk(model, delta))
+                    self._write_event(self._chunk(model, {}, finish_reason))
+                    if stream_options.get("include_usage"):
+                        self._write_event(json.dumps({
+                            "id": "mock",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [],
+                            "usage": usage,
+                        }))
+                    self._write_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前关闭了流（例如拿到情绪标签后立即断开）
+                    self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首token延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="输出速度，0表示不限速")
+    parser.add_argument("--chunk-tokens", type=int, default=4, help="流式输出每块的token数")
+    parser.add_argument("--outlier-rate", type=float, default=0.0, help="慢请求的比例")
+    parser.add_argument("--outlier-delay", type=float, default=3.0, help="慢请求额外的首token延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的请求比例")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        args.host, args.port, args.ttft, args.tokens_per_second, args.chunk_tokens,
+        args.outlier_rate, args.outlier_delay, args.error_rate,
+    )
+    print(f"mock server listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
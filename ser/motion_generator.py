@@ -1,10 +1,124 @@
 import json
 import re
-from typing import Dict, Optional, List
+import time
+from typing import Dict, Optional, List, Tuple, AsyncIterator, Iterator, Callable
 
-from ser.llm_client import LLMClient
+from ser.cache import ResponseCache
+from ser.command_matcher import CommandMatcher
+from ser.emotion_recognizer import EMOTION_MAP
+from ser.history_store import HistoryStore
+from ser.llm_client import LLMClient, AsyncLLMClient
+from ser.metrics import MetricsRegistry, stage, timed_parse
+from ser.resilience import DeadlineExceeded
+from ser.transport import HttpPoolConfig
 from ser.src.prompts import GAIT_PROMPT_CN
 
+# 各情感对应的典型步频变化，取GAIT_PROMPT_CN中各区间的中间值
+EMOTION_FREQ_OFFSET = {
+    "normal": 0.0,
+    "happy": 0.05,
+    "tired": -0.05,
+    "confident": 0.05,
+    "afraid": -0.05,
+    "shy": 0.0,
+}
+
+GAIT_KEYS = ("y_vel", "yaw_vel", "freq_offset")
+
+
+class GaitJsonScanner:
+    """
+    增量解析流式输出中的步态JSON对象
+
+    每个字段的值一写完就可以取出，不必等待整个对象闭合；对象闭合后done置为True。
+    不含任何步态字段的JSON对象会被跳过，继续寻找下一个对象。
+    """
+
+    def __init__(self, keys: Tuple[str, ...] = GAIT_KEYS):
+        self.keys = keys
+        self.buffer = ""
+        self.values: Dict[str, float] = {}
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._token = ""
+
+    def feed(self, delta: str) -> List[Tuple[str, float]]:
+        """
+        追加一段增量文本
+
+        Args:
+            delta: 模型输出的增量文本
+
+        Returns:
+            本次新解析完成的(字段名, 数值)列表
+        """
+        self.buffer += delta
+        fields = []
+        for ch in delta:
+            if self.done:
+                break
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._token += ch
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = self._token
+                        self._token = ""
+                else:
+                    self._token += ch
+                continue
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._expect_key = True
+                    self._key = None
+                    self._token = ""
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._token = ""
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(fields)
+                    # 不含步态字段的对象视为无关内容，继续寻找下一个对象
+                    self.done = bool(self.values)
+            elif self._depth > 1:
+                continue
+            elif ch == ':':
+                self._expect_key = False
+                self._token = ""
+            elif ch == ',':
+                self._finish_value(fields)
+            elif not self._expect_key:
+                self._token += ch
+        return fields
+
+    def _finish_value(self, fields: List[Tuple[str, float]]):
+        key, token = self._key, self._token.strip()
+        self._expect_key = True
+        self._key = None
+        self._token = ""
+        if key not in self.keys or key in self.values:
+            return
+        try:
+            value = float(token)
+        except ValueError:
+            return
+        self.values[key] = value
+        fields.append((key, value))
+
 
 class MotionGenerator:
     """机器人运动生成器，根据用户情感和文本输入生成运动参数（方向和速度）"""
@@ -18,6 +132,17 @@ class MotionGenerator:
         audio_config: Optional[Dict] = None,
         max_history: Optional[int] = 4,
         prompt: Optional[str] = GAIT_PROMPT_CN,
+        cache: Optional[ResponseCache] = None,
+        fast_path: bool = False,
+        fast_path_threshold: float = 0.8,
+        http_config: Optional[HttpPoolConfig] = None,
+        max_history_tokens: Optional[int] = None,
+        compaction: str = "drop_oldest",
+        compile_prompt: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+        backend=None,
+        history_store: Optional[HistoryStore] = None,
+        session_id: Optional[str] = None,
     ):
         """
         初始化运动生成器
@@ -30,6 +155,17 @@ class MotionGenerator:
             audio_config: 音频配置
             max_history: 最大历史消息条数
             prompt: 自定义prompt，如果不提供则使用默认的GAIT_PROMPT_CN
+            cache: 回复缓存，相同的输入和历史直接返回缓存的回复
+            fast_path: 是否启用本地规则快速通道，明确的方向指令直接由CommandMatcher给出结果，不调用LLM
+            fast_path_threshold: 快速通道的最低置信度，低于该值时仍调用LLM
+            http_config: HTTP连接池配置，相同base_url与配置的客户端在进程内共用一个连接池
+            max_history_tokens: 每次请求的prompt token预算，None表示只按条数限制
+            compaction: 历史超出token预算时的压缩策略，"drop_oldest"、"labels_only"或"summarize"
+            compile_prompt: 是否编译prompt（去掉缩进和Markdown装饰），减少每次请求的token数
+            metrics: 指标注册表，记录排队时间、首token延迟、总耗时、解析耗时和token用量，None表示不记录
+            backend: 替代chat.completions.create的后端，如ser.replay.RecordingBackend/ReplayBackend
+            history_store: 对话历史存储（见ser.history_store），None表示历史只保存在内存中
+            session_id: 会话在history_store中的标识
         """
         self.llm_client = LLMClient(
             api_key=api_key,
@@ -38,14 +174,78 @@ class MotionGenerator:
             modalities=modalities,
             audio_config=audio_config,
             max_history=max_history,
-            system_message=prompt
+            system_message=prompt,
+            cache=cache,
+            http_config=http_config,
+            max_history_tokens=max_history_tokens,
+            compaction=compaction,
+            compile_prompt=compile_prompt,
+            metrics=metrics,
+            backend=backend,
+            metrics_stage="motion",
+            history_store=history_store,
+            session_id=session_id,
         )
+        self._async_llm_client: Optional[AsyncLLMClient] = None
+        self.command_matcher: Optional[CommandMatcher] = CommandMatcher() if fast_path else None
+        self.fast_path_threshold = fast_path_threshold
+        self.metrics = metrics
+    
+    @property
+    def async_llm_client(self) -> AsyncLLMClient:
+        """与同步客户端共享对话历史的异步客户端，首次使用时创建"""
+        if self._async_llm_client is None:
+            self._async_llm_client = AsyncLLMClient.from_client(self.llm_client)
+        return self._async_llm_client
+    
+    def _build_content(self, text: str, emotion: Optional[int]) -> List[Dict]:
+        if emotion is None:
+            emotion = "normal"
+        input_text = f"{text} [EMOTION:{emotion}]"
+        
+        return [{"type": "text", "text": input_text}]
+    
+    def _fast_path(
+        self,
+        text: str,
+        emotion: Optional[int],
+        history: Optional[List[Dict]] = None,
+    ) -> Optional[Dict[str, float]]:
+        """
+        用本地规则匹配明确的方向指令，命中时按LLM调用的格式写入对话历史
+        
+        Returns:
+            命中时返回运动参数字典，否则返回None
+        """
+        if self.command_matcher is None:
+            return None
+        match = self.command_matcher.match(text)
+        if match is None or match["confidence"] < self.fast_path_threshold:
+            return None
+        
+        if emotion is None:
+            emotion = "normal"
+        emotion_name = EMOTION_MAP.get(emotion, "normal") if isinstance(emotion, int) else emotion
+        result = {
+            "y_vel": match["y_vel"],
+            "yaw_vel": match["yaw_vel"],
+            "freq_offset": EMOTION_FREQ_OFFSET.get(emotion_name, 0.0),
+        }
+        messages = self.llm_client.messages if history is None else history
+        messages.extend([
+            {"role": "user", "content": self._build_content(text, emotion)},
+            {"role": "assistant", "content": json.dumps(result)},
+        ])
+        return result
     
     def generate(
         self,
         text: str,
         emotion: Optional[int] = None,
         stream: bool = False,
+        on_field: Optional[Callable[[str, float], None]] = None,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
     ) -> Dict[str, float]:
         """
         根据文本和情感生成运动参数
@@ -54,6 +254,10 @@ class MotionGenerator:
             text: 用户输入的文本
             emotion: 情感标签
             stream: 是否使用流式输出，默认False
+            on_field: 单个参数解析完成后的回调，参数为(字段名, 数值)；流式输出时在该字段写完的瞬间触发
+            history: 外部对话历史列表，提供时使用并更新该列表而非生成器自身的历史
+            timeout: 本次生成的时间预算（秒），流式输出时超过预算仍未写完JSON对象则关闭HTTP流，
+                     抛出DeadlineExceeded，其partial为已解析的字段字典
         
         Returns:
             包含以下字段的字典：
@@ -61,28 +265,218 @@ class MotionGenerator:
             - yaw_vel: 转向速度 (-0.3 ~ 0.3)
             - freq_offset: 步频变化 (-0.1 ~ 0.1)
         """
-        if emotion is None:
-            emotion = "normal"
-        input_text = f"{text} [EMOTION:{emotion}]"
+        with stage(self.metrics, "motion"):
+            result = self._fast_path(text, emotion, history)
+            if result is not None:
+                if on_field is not None:
+                    for key, value in result.items():
+                        on_field(key, value)
+                return result
+        
+            content = self._build_content(text, emotion)
+        
+            if stream:
+                result = None
+                for event in self._iter_events(content, history=history, timeout=timeout):
+                    if event["type"] == "field" and on_field is not None:
+                        on_field(event["key"], event["value"])
+                    elif event["type"] == "done":
+                        result = event["result"]
+                return result
         
-        content = [{"type": "text", "text": input_text}]
-        
-        if stream:
-            completion = self.llm_client.chat(content, stream=True)
-            full_response = ""
-            for chunk in completion:
-                if hasattr(chunk, 'choices') and chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content:
-                        full_response += delta.content
-        else:
-            response = self.llm_client.chat(content, stream=False)
+            response = self.llm_client.chat(content, stream=False, history=history, timeout=timeout)
             if hasattr(response, 'choices') and response.choices:
                 full_response = response.choices[0].message.content
             else:
                 full_response = ""
         
-        return self._parse_response(full_response)
+            result = self._parse_response(full_response)
+            if on_field is not None:
+                for key, value in result.items():
+                    on_field(key, value)
+            return result
+    
+    def generate_events(
+        self,
+        text: str,
+        emotion: Optional[int] = None,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, any]]:
+        """
+        以事件流的形式流式生成运动参数，每个参数写完即产生field事件，JSON对象闭合后立即停止读取
+        
+        Args:
+            text: 用户输入的文本
+            emotion: 情感标签
+            history: 外部对话历史列表，提供时使用并更新该列表而非生成器自身的历史
+            timeout: 时间预算（秒），含义同generate
+        
+        Yields:
+            事件字典：
+            - {"type": "field", "key": str, "value": float}: 单个运动参数
+            - {"type": "done", "result": dict}: 最终结果，格式同generate
+        """
+        result = self._fast_path(text, emotion, history)
+        if result is not None:
+            for key, value in result.items():
+                yield {"type": "field", "key": key, "value": value}
+            yield {"type": "done", "result": result}
+            return
+        
+        content = self._build_content(text, emotion)
+        yield from self._iter_events(content, history=history, timeout=timeout)
+    
+    def _iter_events(
+        self,
+        content: List[Dict],
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, any]]:
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        completion = self.llm_client.chat(content, stream=True, history=history, timeout=timeout, partial=True)
+        scanner = GaitJsonScanner()
+        for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    for key, value in scanner.feed(delta.content):
+                        yield {"type": "field", "key": key, "value": value}
+                    if scanner.done:
+                        completion.mark_complete()
+                        completion.close()
+                        break
+            if deadline_at is not None and time.perf_counter() > deadline_at:
+                completion.close()
+                raise DeadlineExceeded("motion generation deadline exceeded", partial=dict(scanner.values))
+        
+        yield {"type": "done", "result": self._scanner_result(scanner)}
+    
+    async def agenerate(
+        self,
+        text: str,
+        emotion: Optional[int] = None,
+        stream: bool = False,
+        on_field: Optional[Callable[[str, float], None]] = None,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """
+        generate的异步版本，参数与返回值相同
+        """
+        with stage(self.metrics, "motion"):
+            result = self._fast_path(text, emotion, history)
+            if result is not None:
+                if on_field is not None:
+                    for key, value in result.items():
+                        on_field(key, value)
+                return result
+        
+            content = self._build_content(text, emotion)
+        
+            if stream:
+                result = None
+                async for event in self._aiter_events(content, history=history, timeout=timeout):
+                    if event["type"] == "field" and on_field is not None:
+                        on_field(event["key"], event["value"])
+                    elif event["type"] == "done":
+                        result = event["result"]
+                return result
+        
+            response = await self.async_llm_client.chat(content, stream=False, history=history, timeout=timeout)
+            if hasattr(response, 'choices') and response.choices:
+                full_response = response.choices[0].message.content
+            else:
+                full_response = ""
+        
+            result = self._parse_response(full_response)
+            if on_field is not None:
+                for key, value in result.items():
+                    on_field(key, value)
+            return result
+    
+    async def agenerate_events(
+        self,
+        text: str,
+        emotion: Optional[int] = None,
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, any]]:
+        """
+        generate_events的异步版本，参数与事件格式相同
+        """
+        result = self._fast_path(text, emotion, history)
+        if result is not None:
+            for key, value in result.items():
+                yield {"type": "field", "key": key, "value": value}
+            yield {"type": "done", "result": result}
+            return
+        
+        content = self._build_content(text, emotion)
+        async for event in self._aiter_events(content, history=history, timeout=timeout):
+            yield event
+    
+    async def _aiter_events(
+        self,
+        content: List[Dict],
+        history: Optional[List[Dict]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, any]]:
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        completion = await self.async_llm_client.chat(content, stream=True, history=history, timeout=timeout, partial=True)
+        scanner = GaitJsonScanner()
+        async for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    for key, value in scanner.feed(delta.content):
+                        yield {"type": "field", "key": key, "value": value}
+                    if scanner.done:
+                        completion.mark_complete()
+                        await completion.aclose()
+                        break
+            if deadline_at is not None and time.perf_counter() > deadline_at:
+                await completion.aclose()
+                raise DeadlineExceeded("motion generation deadline exceeded", partial=dict(scanner.values))
+        
+        yield {"type": "done", "result": self._scanner_result(scanner)}
+    
+    def _scanner_result(self, scanner: "GaitJsonScanner") -> Dict[str, float]:
+        if not scanner.values:
+            return self._parse_response(scanner.buffer)
+        return {key: scanner.values.get(key, 0.0) for key in GAIT_KEYS}
+    
+    async def astream(
+        self,
+        text: str,
+        emotion: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """
+        以异步迭代器形式流式输出模型回复的文本片段
+        
+        Args:
+            text: 用户输入的文本
+            emotion: 情感标签
+        
+        Yields:
+            模型回复的增量文本
+        """
+        result = self._fast_path(text, emotion)
+        if result is not None:
+            yield json.dumps(result)
+            return
+        
+        content = self._build_content(text, emotion)
+        async for delta in self._astream_content(content):
+            yield delta
+    
+    async def _astream_content(self, content: List[Dict]) -> AsyncIterator[str]:
+        completion = await self.async_llm_client.chat(content, stream=True)
+        async for chunk in completion:
+            if hasattr(chunk, 'choices') and chunk.choices:
+                delta = chunk.choices[0].delta
+                if hasattr(delta, 'content') and delta.content:
+                    yield delta.content
     
     def _parse_response(self, raw_response: str) -> Dict[str, float]:
         """
@@ -94,25 +488,29 @@ class MotionGenerator:
         Returns:
             包含y_vel、yaw_vel、freq_offset的字典
         """
-        json_pattern = r'\{[^{}]*"y_vel"[^{}]*"yaw_vel"[^{}]*"freq_offset"[^{}]*\}'
-        match = re.search(json_pattern, raw_response, re.DOTALL)
-        
-        if match:
-            json_str = match.group(0)
-            try:
-                gait_params = json.loads(json_str)
-                return {
-                    "y_vel": float(gait_params.get("y_vel", 0.0)),
-                    "yaw_vel": float(gait_params.get("yaw_vel", 0.0)),
-                    "freq_offset": float(gait_params.get("freq_offset", 0.0)),
-                }
-            except json.JSONDecodeError:
-                pass
-        return {
-            "y_vel": 0.0,
-            "yaw_vel": 0.0,
-            "freq_offset": 0.0,
-        }
+        with timed_parse():
+            json_pattern = r'\{[^{}]*"y_vel"[^{}]*"yaw_vel"[^{}]*"freq_offset"[^{}]*\}'
+            match = re.search(json_pattern, raw_response, re.DOTALL)
+        
+            if match:
+                json_str = match.group(0)
+                try:
+                    gait_params = json.loads(json_str)
+                    return {
+                        "y_vel": float(gait_params.get("y_vel", 0.0)),
+                        "yaw_vel": float(gait_params.get("yaw_vel", 0.0)),
+                        "freq_offset": float(gait_params.get("freq_offset", 0.0)),
+                    }
+                except json.JSONDecodeError:
+                    pass
+            # 只打印回复开头，长回复会刷屏
+            preview = raw_response[:80] + "..." if len(raw_response) > 80 else raw_response
+            print(f"failed to parse gait params, set to 0: {preview!r}")
+            return {
+                "y_vel": 0.0,
+                "yaw_vel": 0.0,
+                "freq_offset": 0.0,
+            }
     
     def reset_history(self):
         self.llm_client.reset_history()
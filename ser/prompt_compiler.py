@@ -0,0 +1,150 @@
+"""
+Prompt编译：去掉prompts.py中多行字符串的缩进和Markdown装饰，减少每次请求重复发送的token
+
+编译结果是输入的纯函数并做了缓存，同一个prompt每次得到完全相同的字节，
+系统消息作为请求的固定前缀可以命中服务端的prompt缓存。
+
+用法（打印各prompt编译前后的token数，加--ttft时对比首token延迟）：
+    python -m ser.prompt_compiler
+    python -m ser.prompt_compiler --ttft --rounds 5
+"""
+import argparse
+import re
+import statistics
+import textwrap
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from ser.history_budget import estimate_tokens
+
+_BOLD = re.compile(r"\*\*")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+@lru_cache(maxsize=64)
+def compile_prompt(prompt: str) -> str:
+    """
+    编译prompt：第一行之后的内容去除公共缩进，删除行尾空白和**加粗标记，连续空行合并为一行
+
+    Args:
+        prompt: 原始prompt
+
+    Returns:
+        编译后的prompt，相同输入总是返回相同的字符串
+    """
+    if not prompt:
+        return prompt
+    first, _, rest = prompt.partition("\n")
+    text = first.strip() + "\n" + textwrap.dedent(rest)
+    text = _BOLD.sub("", text)
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    text = _BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+
+def prompt_report(
+    prompts: Dict[str, str],
+    tokenizer: Callable[[str], int] = estimate_tokens,
+) -> List[Dict]:
+    """
+    统计各prompt编译前后的字符数与token数
+
+    Args:
+        prompts: 名称到prompt的字典
+        tokenizer: 计算文本token数的函数
+
+    Returns:
+        每个prompt一项，包含name、chars、compiled_chars、tokens、compiled_tokens、saved_ratio
+    """
+    rows = []
+    for name, prompt in prompts.items():
+        compiled = compile_prompt(prompt)
+        tokens = tokenizer(prompt)
+        compiled_tokens = tokenizer(compiled)
+        rows.append({
+            "name": name,
+            "chars": len(prompt),
+            "compiled_chars": len(compiled),
+            "tokens": tokens,
+            "compiled_tokens": compiled_tokens,
+            "saved_ratio": 1 - compiled_tokens / tokens if tokens else 0.0,
+        })
+    return rows
+
+
+def measure_ttft(
+    prompt: str,
+    text: str,
+    rounds: int,
+    api_key: Optional[str] = None,
+    base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1",
+    model: str = "qwen3-omni-flash",
+) -> List[float]:
+    """用流式调用测量首个内容token的延迟（秒），每轮都是无历史的单次调用；失败或没有内容的轮次不计入结果"""
+    from ser.llm_client import LLMClient
+
+    client = LLMClient(api_key=api_key, base_url=base_url, model=model, system_message=prompt)
+    content = [{"type": "text", "text": text}]
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        try:
+            completion = client.chat(content, stream=True, history=[])
+            for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    latencies.append(time.perf_counter() - start)
+                    break
+            completion.close()
+        except Exception as e:
+            print(f"TTFT measurement failed: {e!r}")
+    return latencies
+
+
+def _prompts() -> Dict[str, str]:
+    from ser.src import prompts
+
+    return {
+        name: value for name, value in vars(prompts).items()
+        if name.isupper() and isinstance(value, str)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比prompt编译前后的token数与首token延迟")
+    parser.add_argument("--ttft", action="store_true", help="调用模型测量首token延迟")
+    parser.add_argument("--rounds", type=int, default=5, help="每个prompt测量首token延迟的次数")
+    parser.add_argument("--text", default="快向左转！", help="测量首token延迟时的用户输入")
+    parser.add_argument("--base-url", default="https://dashscope.aliyuncs.com/compatible-mode/v1")
+    parser.add_argument("--model", default="qwen3-omni-flash")
+    parser.add_argument("--api-key", default=None)
+    args = parser.parse_args()
+
+    prompts = _prompts()
+    print(f"{'prompt':<24}{'chars':>8}{'->':>4}{'chars':>8}{'tokens':>8}{'->':>4}{'tokens':>8}{'saved':>8}")
+    for row in prompt_report(prompts):
+        print(
+            f"{row['name']:<24}{row['chars']:>8}{'':>4}{row['compiled_chars']:>8}"
+            f"{row['tokens']:>8}{'':>4}{row['compiled_tokens']:>8}{row['saved_ratio']:>8.1%}"
+        )
+
+    if args.ttft:
+        print(f"\n{'prompt':<24}{'mode':<10}{'mean(s)':>10}{'p50(s)':>10}")
+        for name, prompt in prompts.items():
+            for mode, system_message in (("raw", prompt), ("compiled", compile_prompt(prompt))):
+                latencies = measure_ttft(
+                    system_message, args.text, args.rounds,
+                    api_key=args.api_key, base_url=args.base_url, model=args.model,
+                )
+                if not latencies:
+                    # rounds为0或每轮都失败，没有可统计的样本
+                    print(f"{name:<24}{mode:<10}{'-':>10}{'-':>10}")
+                    continue
+                print(
+                    f"{name:<24}{mode:<10}"
+                    f"{statistics.mean(latencies):>10.3f}{statistics.median(latencies):>10.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+录制/回放后端：把真实的模型回复（包括流式输出的每个块及其时间）录制到cassette文件，之后离线回放
+
+cassette是JSON Lines文件，每行一次调用：
+    {"key": 请求摘要, "stream": true, "duration": 秒, "id": ..., "model": ..., "chunks": [[相对时间, 块], ...]}  # 流式
+    {"key": 请求摘要, "stream": false, "duration": 秒, "response": 完整响应}              # 非流式
+
+用法：
+    recorder = RecordingBackend("trace.jsonl")
+    generator = GaitGenerator(backend=recorder)          # 正常调用，同时录制
+    replayer = ReplayBackend("trace.jsonl", speed=0)     # speed=0表示不等待，全速回放
+    generator = GaitGenerator(api_key="replay", backend=replayer)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from ser.cache import build_chunks, build_completion
+
+
+def request_key(params: Dict) -> str:
+    """按模型和完整的消息列表计算请求摘要，与是否流式无关"""
+    payload = json.dumps([params.get("model"), params.get("messages")], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _dump(model) -> Dict:
+    return model.model_dump(exclude_none=True)
+
+
+# 流式块中每块都重复的字段，录制时只在记录里保存一次
+_CHUNK_HEADER = ("id", "object", "created", "model")
+
+
+def _dump_chunk(chunk) -> Dict:
+    data = _dump(chunk)
+    for name in _CHUNK_HEADER:
+        data.pop(name, None)
+    return data
+
+
+class RecordingBackend:
+    """
+    LLMClient的录制后端：照常发起请求，把响应和时间写入cassette文件
+
+    可以包装另一个后端（inner），不提供时使用LLMClient自身的OpenAI客户端。线程安全。
+    """
+
+    def __init__(self, path: str, inner=None):
+        """
+        初始化录制后端
+
+        Args:
+            path: cassette文件路径，追加写入
+            inner: 实际发起请求的后端，None表示直接使用LLMClient的OpenAI客户端
+        """
+        self.path = path
+        self.inner = inner
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def create(self, client, **params):
+        start = time.perf_counter()
+        if self.inner is not None:
+            response = self.inner.create(client, **params)
+        else:
+            response = client.chat.completions.create(**params)
+        if params.get("stream"):
+            return _RecordingStream(self, response, request_key(params), start)
+        self.write({
+            "key": request_key(params),
+            "stream": False,
+            "duration": round(time.perf_counter() - start, 4),
+            "response": _dump(response),
+        })
+        return response
+
+    async def acreate(self, client, **params):
+        start = time.perf_counter()
+        if self.inner is not None:
+            response = await self.inner.acreate(client, **params)
+        else:
+            response = await client.chat.completions.create(**params)
+        if params.get("stream"):
+            return _AsyncRecordingStream(self, response, request_key(params), start)
+        self.write({
+            "key": request_key(params),
+            "stream": False,
+            "duration": round(time.perf_counter() - start, 4),
+            "response": _dump(response),
+        })
+        return response
+
+    def write(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+
+class _RecordingStream:
+    """透传上游的流式块并记录到达时间，流结束或被关闭时写入一条记录"""
+
+    def __init__(self, recorder: RecordingBackend, stream, key: str, start: float):
+        self.recorder = recorder
+        self.stream = stream
+        self.key = key
+        self.start = start
+        self.chunks: List = []
+        self.header: Dict = {}
+        self._written = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                self._append(chunk)
+                yield chunk
+        finally:
+            self._finish()
+
+    def _append(self, chunk):
+        if not self.chunks:
+            self.header = {"id": chunk.id, "model": chunk.model}
+        self.chunks.append([round(time.perf_counter() - self.start, 4), _dump_chunk(chunk)])
+
+    def _finish(self):
+        if not self._written:
+            self._written = True
+            self.recorder.write({
+                "key": self.key,
+                "stream": True,
+                "duration": round(time.perf_counter() - self.start, 4),
+                **self.header,
+                "chunks": self.chunks,
+            })
+
+    def close(self):
+        if hasattr(self.stream, 'close'):
+            self.stream.close()
+        self._finish()
+
+
+class _AsyncRecordingStream(_RecordingStream):
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                self._append(chunk)
+                yield chunk
+        finally:
+            self._finish()
+
+    async def close(self):
+        if hasattr(self.stream, 'close'):
+            await self.stream.close()
+        self._finish()
+
+
+class ReplayBackend:
+    """
+    LLMClient的回放后端：从cassette文件中取出录制的响应，不访问网络
+
+    相同的请求按录制顺序依次回放，录制次数用完后重复最后一次。
+    流式/非流式与录制时不同也可以回放（按完整文本互相转换）。
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0, match: str = "exact"):
+        """
+        初始化回放后端
+
+        Args:
+            path: cassette文件路径
+            speed: 回放速度倍数，1.0为原始节奏，10表示快10倍，0或None表示不等待
+            match: "exact"按请求内容（模型与消息列表）匹配，找不到时抛出LookupError；
+                   "sequential"忽略请求内容，按录制顺序逐条回放，用于请求内容已改变的生产记录
+        """
+        if match not in ("exact", "sequential"):
+            raise ValueError(f"unknown match mode: {match}")
+        self.path = path
+        self.speed = speed
+        self.match = match
+        self._lock = threading.Lock()
+        self._entries: Dict[str, deque] = defaultdict(deque)
+        self._last: Dict[str, Dict] = {}
+        self._sequence: deque = deque()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+                    self._sequence.append(entry)
+        self.replayed = 0
+
+    def _next_entry(self, params: Dict) -> Dict:
+        with self._lock:
+            self.replayed += 1
+            if self.match == "sequential":
+                if not self._sequence:
+                    raise LookupError("cassette exhausted")
+                return self._sequence.popleft()
+            key = request_key(params)
+            queue = self._entries.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            if key not in self._last:
+                raise LookupError(f"no recorded response for request {key[:12]}")
+            return self._last[key]
+
+    def _scale(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed else 0.0
+
+    def _response(self, entry: Dict, model: str) -> ChatCompletion:
+        if not entry["stream"]:
+            return ChatCompletion.model_validate(entry["response"])
+        return build_completion(_chunks_text(entry["chunks"]), model)
+
+    def _timed_chunks(self, entry: Dict, model: str) -> List:
+        if entry["stream"]:
+            header = {
+                "id": entry.get("id", "replay"),
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": entry.get("model", model),
+            }
+            return [
+                (offset, ChatCompletionChunk.model_validate({**header, **chunk}))
+                for offset, chunk in entry["chunks"]
+            ]
+        content = entry["response"]["choices"][0]["message"].get("content") or ""
+        return [(entry["duration"], chunk) for chunk in build_chunks(content, model)]
+
+    def create(self, client, **params):
+        entry = self._next_entry(params)
+        if params.get("stream"):
+            return _ReplayStream(self._timed_chunks(entry, params.get("model")), self._scale)
+        time.sleep(self._scale(entry["duration"]))
+        return self._response(entry, params.get("model"))
+
+    async def acreate(self, client, **params):
+        entry = self._next_entry(params)
+        if params.get("stream"):
+            return _AsyncReplayStream(self._timed_chunks(entry, params.get("model")), self._scale)
+        await asyncio.sleep(self._scale(entry["duration"]))
+        return self._response(entry, params.get("model"))
+
+
+def _chunks_text(chunks: List) -> str:
+    parts = []
+    for _, chunk in chunks:
+        for choice in chunk.get("choices", []):
+            parts.append(choice.get("delta", {}).get("content") or "")
+    return "".join(parts)
+
+
+class _ReplayStream:
+    """按录制的相对时间依次产出块，可以提前关闭"""
+
+    def __init__(self, timed_chunks: List, scale):
+        self.timed_chunks = timed_chunks
+        self.scale = scale
+        self._closed = False
+
+    def __iter__(self):
+        start = time.perf_counter()
+        for offset, chunk in self.timed_chunks:
+            if self._closed:
+                break
+            wait = self.scale(offset) - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+            yield chunk
+
+    def close(self):
+        self._closed = True
+
+
+class _AsyncReplayStream(_ReplayStream):
+
+    async def __aiter__(self):
+        start = time.perf_counter()
+        for offset, chunk in self.timed_chunks:
+            if self._closed:
+                break
+            wait = self.scale(offset) - (time.perf_counter() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield chunk
+
+    async def close(self):
+        self._closed = True
@@ -0,0 +1,209 @@
+"""
+截止时间、带退避的重试与熔断
+
+ResilientBackend作为LLMClient的后端使用，在请求的timeout预算内重试暂时性错误
+（连接失败、超时、限流、服务端错误），连续失败达到阈值后熔断，之后的请求立即失败，
+调用方（例如设置了deadline的GaitGenerator）可以马上降级而不是等待超时：
+
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    generator = GaitGenerator(deadline=1.5, backend=ResilientBackend(retries=2, breaker=breaker))
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+# APITimeoutError是APIConnectionError的子类
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    在截止时间前没有得到完整结果
+
+    partial保存截止时已经收到的部分结果，具体内容由抛出方决定，没有时为None。
+    """
+
+    def __init__(self, message: str = "deadline exceeded", partial=None):
+        super().__init__(message)
+        self.partial = partial
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，请求没有发出"""
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续failure_threshold次失败后打开，reset_timeout秒后放行一个试探请求，
+    试探成功则关闭，失败则重新打开。线程安全。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold: 打开熔断器所需的连续失败次数
+            reset_timeout: 打开后等待多久（秒）放行试探请求
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._stats = {"rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        """熔断器状态：closed、open或half_open"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self):
+        """请求发出前调用，熔断器打开时抛出CircuitOpenError"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return
+            self._stats["rejected"] += 1
+        raise CircuitOpenError("circuit breaker is open")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._stats["opened"] += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict[str, float]:
+        """
+        获取熔断统计
+
+        Returns:
+            包含state、failures（当前连续失败次数）、opened（打开次数）、rejected（被拒绝的请求数）的字典
+        """
+        state = self.state
+        with self._lock:
+            return {"state": state, "failures": self._failures, **self._stats}
+
+
+class ResilientBackend:
+    """
+    LLMClient的重试/熔断后端
+
+    只重试暂时性错误，退避时间按指数增长并带随机抖动。请求带timeout参数时，
+    timeout视为包括重试在内的总预算，每次重试只使用剩余的时间，剩余时间不够退避时不再重试。
+    流式调用只在建立连接阶段重试，已经开始输出的流不会重试。
+    """
+
+    def __init__(
+        self,
+        inner=None,
+        retries: int = 2,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        初始化重试/熔断后端
+
+        Args:
+            inner: 实际发起请求的后端，None表示直接使用LLMClient的OpenAI客户端
+            retries: 最大重试次数
+            backoff: 第一次重试前的退避时间（秒），之后每次翻倍
+            max_backoff: 退避时间上限（秒）
+            breaker: 熔断器，可以在多个后端之间共用，None表示不熔断
+        """
+        self.inner = inner
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+
+    def _delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _next_attempt(self, attempt: int, deadline_at: Optional[float], params: Dict) -> Optional[float]:
+        """返回重试前的退避时间，不再重试时返回None"""
+        if attempt >= self.retries:
+            return None
+        delay = self._delay(attempt)
+        if deadline_at is not None:
+            remaining = deadline_at - time.perf_counter() - delay
+            if remaining <= 0:
+                return None
+            params["timeout"] = remaining
+        return delay
+
+    def _record(self, error: Optional[BaseException]):
+        if self.breaker is None:
+            return
+        # 非暂时性错误（如参数错误）说明服务可以访问，不计入熔断
+        if isinstance(error, RETRYABLE_ERRORS):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def create(self, client, **params):
+        timeout = params.get("timeout")
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                if self.inner is not None:
+                    response = self.inner.create(client, **params)
+                else:
+                    response = client.chat.completions.create(**params)
+            except Exception as e:
+                self._record(e)
+                delay = self._next_attempt(attempt, deadline_at, params) if isinstance(e, RETRYABLE_ERRORS) else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._record(None)
+            return response
+
+    async def acreate(self, client, **params):
+        timeout = params.get("timeout")
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                if self.inner is not None:
+                    response = await self.inner.acreate(client, **params)
+                else:
+                    response = await client.chat.completions.create(**params)
+            except Exception as e:
+                self._record(e)
+                delay = self._next_attempt(attempt, deadline_at, params) if isinstance(e, RETRYABLE_ERRORS) else None
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._record(None)
+            return response
@@ -0,0 +1,414 @@
+"""
+多端点路由：在多个OpenAI兼容端点（不同地域的DashScope、自建副本等）之间按延迟选择
+
+每个端点分别维护流式调用的首token延迟、非流式调用的完整响应耗时和错误率的指数滑动平均，每次调用发往当前得分最好
+（延迟低、错误少、权重高）且未满并发上限的健康端点；失败时按得分依次改用其他端点。
+连续失败达到阈值的端点冷却一段时间后再参与选择。作为LLMClient的后端使用：
+
+    router = EndpointRouter([
+        Endpoint("https://dashscope.aliyuncs.com/compatible-mode/v1", max_concurrency=32),
+        Endpoint("https://dashscope-intl.aliyuncs.com/compatible-mode/v1", weight=0.5),
+        Endpoint("http://10.0.0.5:8000/v1", model="qwen2.5-7b-instruct", api_key="local", max_concurrency=8),
+    ])
+    generator = GaitGenerator(backend=router)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from openai import AsyncOpenAI, OpenAI
+
+from ser.resilience import RETRYABLE_ERRORS
+from ser.transport import HttpPoolConfig, TransportRegistry, default_registry
+
+
+class Endpoint(NamedTuple):
+    """
+    一个OpenAI兼容端点
+
+    model为None时使用LLMClient请求中的模型，api_key为None时从环境变量DASHSCOPE_API_KEY读取。
+    weight越大越优先（得分为延迟除以权重），max_concurrency为发往该端点的同时请求数上限。
+    """
+    base_url: str
+    model: Optional[str] = None
+    api_key: Optional[str] = None
+    weight: float = 1.0
+    max_concurrency: int = 16
+    name: Optional[str] = None
+
+
+class NoEndpointAvailable(RuntimeError):
+    """所有端点都已尝试失败，或在timeout内等不到空闲的并发名额"""
+
+
+class _EndpointState:
+
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.name = endpoint.name or endpoint.base_url
+        # 流式调用的首token延迟与非流式调用的完整响应耗时差别很大，分别统计
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.stats = {"requests": 0, "errors": 0, "fallbacks": 0}
+        self.client: Optional[OpenAI] = None
+        self.async_clients: Dict[int, AsyncOpenAI] = {}
+
+
+class EndpointRouter:
+    """
+    LLMClient的多端点路由后端
+
+    得分 = EWMA延迟 × (1 + error_penalty × EWMA错误率) / weight，越小越好，流式调用使用首token延迟，
+    非流式调用使用完整响应耗时；还没有对应延迟样本的端点得分为0，
+    保证每个端点都会被尝试（只失败过的端点排在最后）。另有explore的概率按权重随机选择，使较慢端点的延迟估计保持更新。
+    只有暂时性错误（连接失败、超时、限流、服务端错误）会改用其他端点，参数错误等直接抛出。
+    所有端点都在冷却时仍选择最早结束冷却的端点，而不是直接失败。线程安全。
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        alpha: float = 0.2,
+        error_penalty: float = 4.0,
+        failure_threshold: int = 3,
+        cooldown: float = 10.0,
+        explore: float = 0.05,
+        max_attempts: Optional[int] = None,
+        http_config: Optional[HttpPoolConfig] = None,
+        share_http_pool: bool = True,
+    ):
+        """
+        初始化路由
+
+        Args:
+            endpoints: 端点列表
+            alpha: EWMA的平滑系数，越大越看重最近的请求
+            error_penalty: 错误率对得分的惩罚系数
+            failure_threshold: 连续失败多少次后进入冷却
+            cooldown: 冷却时间（秒），期间不选择该端点（除非所有端点都在冷却）
+            explore: 按权重随机选择端点的概率
+            max_attempts: 一次调用最多尝试的端点数，None表示所有端点
+            http_config: HTTP连接池配置
+            share_http_pool: 是否与进程内其他客户端按base_url共享连接池
+        """
+        if not endpoints:
+            raise ValueError("EndpointRouter requires at least one endpoint")
+        self.states = [_EndpointState(endpoint) for endpoint in endpoints]
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.explore = explore
+        self.max_attempts = max_attempts or len(self.states)
+        self.http_config = http_config
+        self.transport = default_registry if share_http_pool else TransportRegistry()
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        # 等待并发名额的异步调用：(事件循环, future)
+        self._async_waiters: deque = deque()
+
+    def score(self, state: _EndpointState, stream: bool = False) -> float:
+        latency = state.ttft if stream else state.latency
+        if latency is None:
+            # 这种调用方式从未成功过的端点：没有出过错时优先尝试，出过错时排在最后
+            return 0.0 if state.error_rate == 0 else float("inf")
+        return latency * (1 + self.error_penalty * state.error_rate) / max(state.endpoint.weight, 1e-6)
+
+    def _choose(self, tried: List[_EndpointState], stream: bool) -> Optional[_EndpointState]:
+        """选择端点并占用一个并发名额，所有未尝试的端点都满时返回None，调用方需持有_lock"""
+        now = time.monotonic()
+        for state in self.states:
+            if state.cooldown_until and state.cooldown_until <= now:
+                # 冷却结束：重新累计连续失败次数，而不是一次失败就再次进入冷却
+                state.cooldown_until = 0.0
+                state.failures = 0
+        candidates = [
+            state for state in self.states
+            if state not in tried and state.in_flight < state.endpoint.max_concurrency
+        ]
+        if not candidates:
+            return None
+        healthy = [state for state in candidates if state.cooldown_until <= now]
+        if healthy:
+            if len(healthy) > 1 and random.random() < self.explore:
+                chosen = random.choices(healthy, weights=[state.endpoint.weight for state in healthy])[0]
+            else:
+                chosen = min(healthy, key=lambda state: self.score(state, stream))
+        else:
+            chosen = min(candidates, key=lambda state: state.cooldown_until)
+        chosen.in_flight += 1
+        chosen.stats["requests"] += 1
+        if tried:
+            chosen.stats["fallbacks"] += 1
+        return chosen
+
+    def _exhausted(self, tried: List[_EndpointState]) -> bool:
+        return len(tried) >= self.max_attempts or len(tried) >= len(self.states)
+
+    def _acquire(self, tried: List[_EndpointState], deadline_at: Optional[float], stream: bool) -> _EndpointState:
+        with self._slot_freed:
+            while True:
+                state = self._choose(tried, stream)
+                if state is not None:
+                    return state
+                remaining = deadline_at - time.perf_counter() if deadline_at is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise NoEndpointAvailable("no endpoint has a free slot before the timeout")
+                self._slot_freed.wait(remaining)
+
+    async def _aacquire(self, tried: List[_EndpointState], deadline_at: Optional[float], stream: bool) -> _EndpointState:
+        loop = asyncio.get_running_loop()
+        while True:
+            remaining = deadline_at - time.perf_counter() if deadline_at is not None else None
+            with self._lock:
+                state = self._choose(tried, stream)
+                if state is not None:
+                    return state
+                if remaining is not None and remaining <= 0:
+                    raise NoEndpointAvailable("no endpoint has a free slot before the timeout")
+                entry = (loop, loop.create_future())
+                self._async_waiters.append(entry)
+            try:
+                await asyncio.wait_for(entry[1], remaining)
+            except asyncio.TimeoutError:
+                self._forget_waiter(entry)
+                raise NoEndpointAvailable("no endpoint has a free slot before the timeout")
+            except asyncio.CancelledError:
+                self._forget_waiter(entry)
+                raise
+
+    def _forget_waiter(self, entry):
+        """超时或被取消的等待者不再需要唤醒，从队列中移除"""
+        with self._lock:
+            try:
+                self._async_waiters.remove(entry)
+            except ValueError:
+                # 已经被_release取走
+                pass
+
+    def _release(
+        self,
+        state: _EndpointState,
+        latency: Optional[float],
+        error: Optional[BaseException],
+        stream: bool = False,
+    ):
+        """释放并发名额并更新延迟和错误率，latency和error都为None时只释放名额；stream表示latency为首token延迟"""
+        with self._lock:
+            state.in_flight -= 1
+            self._observe(state, latency, error, stream)
+            self._slot_freed.notify_all()
+            waiters, self._async_waiters = self._async_waiters, deque()
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def _observe(self, state: _EndpointState, latency: Optional[float], error: Optional[BaseException], stream: bool):
+        """调用方需持有_lock"""
+        if error is not None:
+            state.stats["errors"] += 1
+            state.error_rate += self.alpha * (1.0 - state.error_rate)
+            state.failures += 1
+            if state.failures >= self.failure_threshold:
+                state.cooldown_until = time.monotonic() + self.cooldown
+        elif latency is not None:
+            state.error_rate -= self.alpha * state.error_rate
+            state.failures = 0
+            state.cooldown_until = 0.0
+            if stream:
+                state.ttft = latency if state.ttft is None else state.ttft + self.alpha * (latency - state.ttft)
+            else:
+                state.latency = latency if state.latency is None else state.latency + self.alpha * (latency - state.latency)
+
+    def stats(self) -> List[Dict]:
+        """
+        获取每个端点的统计
+
+        Returns:
+            每个端点一项：name、ttft（流式调用首token延迟的EWMA，秒）、latency（非流式调用完整响应耗时的EWMA，秒）、
+            error_rate（EWMA）、in_flight、healthy、
+            requests、errors、fallbacks（作为改用的端点被选中的次数）
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": state.name,
+                    "ttft": state.ttft,
+                    "latency": state.latency,
+                    "error_rate": state.error_rate,
+                    "in_flight": state.in_flight,
+                    "healthy": state.cooldown_until <= now,
+                    **state.stats,
+                }
+                for state in self.states
+            ]
+
+    def _params(self, state: _EndpointState, params: Dict, deadline_at: Optional[float]) -> Dict:
+        params = dict(params)
+        if state.endpoint.model is not None:
+            params["model"] = state.endpoint.model
+        if deadline_at is not None:
+            params["timeout"] = max(deadline_at - time.perf_counter(), 0.001)
+        return params
+
+    def _client_options(self, state: _EndpointState) -> Dict:
+        options = {
+            "api_key": state.endpoint.api_key or os.getenv("DASHSCOPE_API_KEY"),
+            "base_url": state.endpoint.base_url,
+        }
+        # 有多个端点时由路由负责改用其他端点，SDK内置的重试只会在同一个慢端点上多等
+        if len(self.states) > 1:
+            options["max_retries"] = 0
+        return options
+
+    def _client(self, state: _EndpointState) -> OpenAI:
+        if state.client is None:
+            state.client = OpenAI(
+                http_client=self.transport.get_client(state.endpoint.base_url, self.http_config),
+                **self._client_options(state),
+            )
+        return state.client
+
+    def _async_client(self, state: _EndpointState) -> AsyncOpenAI:
+        loop_id = id(asyncio.get_running_loop())
+        client = state.async_clients.get(loop_id)
+        if client is None:
+            client = state.async_clients[loop_id] = AsyncOpenAI(
+                http_client=self.transport.get_async_client(state.endpoint.base_url, self.http_config),
+                **self._client_options(state),
+            )
+        return client
+
+    def create(self, client, **params):
+        timeout = params.get("timeout")
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        stream = bool(params.get("stream"))
+        tried: List[_EndpointState] = []
+        while True:
+            state = self._acquire(tried, deadline_at, stream)
+            tried.append(state)
+            start = time.perf_counter()
+            try:
+                response = self._client(state).chat.completions.create(**self._params(state, params, deadline_at))
+            except Exception as e:
+                retryable = isinstance(e, RETRYABLE_ERRORS)
+                self._release(state, None, e if retryable else None)
+                if not retryable or self._exhausted(tried):
+                    raise
+                continue
+            except BaseException:
+                self._release(state, None, None)
+                raise
+            if stream:
+                return _RoutedStream(self, state, response, start)
+            self._release(state, time.perf_counter() - start, None)
+            return response
+
+    async def acreate(self, client, **params):
+        timeout = params.get("timeout")
+        deadline_at = time.perf_counter() + timeout if timeout is not None else None
+        stream = bool(params.get("stream"))
+        tried: List[_EndpointState] = []
+        while True:
+            state = await self._aacquire(tried, deadline_at, stream)
+            tried.append(state)
+            start = time.perf_counter()
+            try:
+                response = await self._async_client(state).chat.completions.create(
+                    **self._params(state, params, deadline_at)
+                )
+            except Exception as e:
+                retryable = isinstance(e, RETRYABLE_ERRORS)
+                self._release(state, None, e if retryable else None)
+                if not retryable or self._exhausted(tried):
+                    raise
+                continue
+            except BaseException:
+                # 调用被取消时同样要归还并发名额
+                self._release(state, None, None)
+                raise
+            if stream:
+                return _AsyncRoutedStream(self, state, response, start)
+            self._release(state, time.perf_counter() - start, None)
+            return response
+
+
+def _wake(waiter: "asyncio.Future"):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _has_content(chunk) -> bool:
+    if not getattr(chunk, 'choices', None):
+        return False
+    return bool(getattr(chunk.choices[0].delta, 'content', None))
+
+
+class _RoutedStream:
+    """流式输出：收到第一个有内容的块时记录首token延迟（只带role的首块不算），流结束或关闭时释放并发名额"""
+
+    def __init__(self, router: EndpointRouter, state: _EndpointState, stream, start: float):
+        self.router = router
+        self.state = state
+        self.stream = stream
+        self.start = start
+        self.latency: Optional[float] = None
+        self._released = False
+
+    def _finish(self, error: Optional[BaseException] = None):
+        if not self._released:
+            self._released = True
+            latency = self.latency if error is None else None
+            self.router._release(
+                self.state, latency, error if isinstance(error, RETRYABLE_ERRORS) else None, stream=True
+            )
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                if self.latency is None and _has_content(chunk):
+                    self.latency = time.perf_counter() - self.start
+                yield chunk
+            if self.latency is None:
+                # 没有任何文本内容的回复：以读完整个流的耗时计
+                self.latency = time.perf_counter() - self.start
+        except Exception as e:
+            self._finish(e)
+            raise
+        finally:
+            self._finish()
+
+    def close(self):
+        if hasattr(self.stream, 'close'):
+            self.stream.close()
+        self._finish()
+
+
+class _AsyncRoutedStream(_RoutedStream):
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                if self.latency is None and _has_content(chunk):
+                    self.latency = time.perf_counter() - self.start
+                yield chunk
+            if self.latency is None:
+                self.latency = time.perf_counter() - self.start
+        except Exception as e:
+            self._finish(e)
+            raise
+        finally:
+            self._finish()
+
+    async def close(self):
+        if hasattr(self.stream, 'close'):
+            await self.stream.close()
+        self._finish()
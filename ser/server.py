@@ -0,0 +1,485 @@
+"""
+本地推理服务：基于asyncio的HTTP/JSON服务，提供 /emotion、/motion、/gait 接口，按session_id维护对话历史
+
+    ser serve --port 8080 --workers 4 --history-db sessions.db
+    curl -X POST http://127.0.0.1:8080/gait -d '{"session_id": "robot-1", "text": "快向左转！"}'
+
+请求先进入有界队列，由固定数量的协程依次处理；队列已满时立即返回503（带Retry-After），而不是无限排队。
+多进程模式下各进程共用一个监听套接字，会话历史通过SQLiteHistoryStore(shared=True)在进程之间共享。
+收到SIGTERM/SIGINT后停止接受新请求，处理完已接受的请求再退出。
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import multiprocessing.connection
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+from ser.history_store import SQLiteHistoryStore
+from ser.metrics import MetricsRegistry
+from ser.resilience import DeadlineExceeded
+from ser.session import SessionManager
+
+# 请求头和请求体的大小上限（字节）
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+
+# 工作进程重启：启动后不到WORKER_MIN_UPTIME秒就退出视为启动失败，重启间隔从RESTART_DELAY开始翻倍，
+# 最长MAX_RESTART_DELAY秒；连续MAX_STARTUP_FAILURES次启动失败时停止服务
+WORKER_MIN_UPTIME = 5.0
+RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 30.0
+MAX_STARTUP_FAILURES = 5
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _text_field(request: Dict) -> str:
+    text = request.get("text")
+    if not isinstance(text, str) or not text:
+        raise _HTTPError(400, "text is required")
+    return text
+
+
+class InferenceServer:
+    """
+    单进程的HTTP/JSON推理服务
+
+    接口（请求体均为JSON，session_id缺省为"default"）：
+    - POST /emotion {"session_id", "text", "stream"} -> {"emotion": [编号, 名称], "response": str}
+    - POST /motion  {"session_id", "text", "emotion", "stream"} -> {"y_vel", "yaw_vel", "freq_offset"}
+    - POST /gait    {"session_id", "text", "stream", "deadline"} -> GaitGenerator.generate的返回值
+    - POST /reset   {"session_id"} -> {"reset": session_id}
+    - GET  /health、GET /stats、GET /metrics（Prometheus文本格式，需要metrics）
+    """
+
+    def __init__(
+        self,
+        manager: SessionManager,
+        concurrency: int = 32,
+        max_queue: int = 256,
+        shutdown_timeout: float = 10.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        初始化推理服务
+
+        Args:
+            manager: 会话管理器，所有请求共用
+            concurrency: 同时处理的请求数（同时进行的LLM调用数）
+            max_queue: 等待处理的请求数上限，超过时返回503
+            shutdown_timeout: 优雅退出时等待已接受请求完成的最长时间（秒）
+            metrics: 指标注册表，提供时GET /metrics导出Prometheus格式的指标
+        """
+        self.manager = manager
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.shutdown_timeout = shutdown_timeout
+        self.metrics = metrics
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        # 正在等待下一个请求的keep-alive连接，退出时直接关闭
+        self._idle = set()
+        self._closing = False
+        self._stopped: Optional[asyncio.Event] = None
+        self._in_flight = 0
+        self._stats = {"requests": 0, "completed": 0, "rejected": 0, "errors": 0}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, sock: Optional[socket.socket] = None):
+        """
+        开始监听
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            sock: 已绑定的监听套接字（多进程模式），提供时忽略host和port
+        """
+        self._queue = asyncio.Queue(self.max_queue)
+        self._stopped = asyncio.Event()
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=sock, limit=MAX_HEADER_SIZE)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_SIZE)
+        return self
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """运行直到shutdown完成；在主线程中调用时SIGTERM/SIGINT触发优雅退出"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.shutdown()))
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows或非主线程不支持信号处理
+                pass
+        await self._stopped.wait()
+
+    async def shutdown(self):
+        """停止接受新请求，等待已接受的请求处理完（最多shutdown_timeout秒）后退出，可以重复调用"""
+        if self._closing:
+            return
+        self._closing = True
+        self._server.close()
+        for writer in list(self._idle):
+            writer.close()
+        try:
+            await asyncio.wait_for(self._queue.join(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            print(f"server shutdown: {self._queue.qsize() + self._in_flight} requests not finished")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self.manager.history_store is not None:
+            self.manager.history_store.close()
+        self._stopped.set()
+
+    def stats(self) -> Dict:
+        """
+        获取服务统计
+
+        Returns:
+            包含requests、completed、rejected（队列已满被拒绝）、errors、in_flight、queued、sessions的字典
+        """
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sessions": len(self.manager),
+            "closing": self._closing,
+        }
+
+    async def _work(self):
+        while True:
+            job, future = await self._queue.get()
+            self._in_flight += 1
+            try:
+                result = await job()
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not self._closing:
+                self._idle.add(writer)
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, {"error": "request header too large"}, keep_alive=False)
+                    break
+                finally:
+                    self._idle.discard(writer)
+
+                try:
+                    method, path, headers, keep_alive = self._parse_head(head)
+                    try:
+                        length = int(headers.get("content-length") or 0)
+                    except ValueError:
+                        raise _HTTPError(400, "invalid Content-Length")
+                    if length > MAX_BODY_SIZE:
+                        raise _HTTPError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload, extra_headers = await self._dispatch(method, path, body)
+                except _HTTPError as e:
+                    status, payload, extra_headers, keep_alive = e.status, {"error": str(e)}, {}, False
+                except asyncio.IncompleteReadError:
+                    break
+                keep_alive = keep_alive and not self._closing
+                await self._respond(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> Tuple[str, str, Dict[str, str], bool]:
+        request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+        try:
+            method, target, version = request_line.split(" ", 2)
+        except ValueError:
+            raise _HTTPError(400, "malformed request line")
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        return method, target.split("?", 1)[0], headers, keep_alive
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload,
+        keep_alive: bool,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        lines = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, object, Dict[str, str]]:
+        if method == "GET":
+            if path == "/health":
+                return 200, {"status": "draining" if self._closing else "ok"}, {}
+            if path == "/stats":
+                return 200, {"server": self.stats(), "sessions": self.manager.stats()}, {}
+            if path == "/metrics" and self.metrics is not None:
+                return 200, self.metrics.export_prometheus(), {}
+        handler = {"/emotion": self._emotion, "/motion": self._motion, "/gait": self._gait, "/reset": self._reset}.get(path)
+        if handler is None:
+            return 404, {"error": f"unknown path: {path}"}, {}
+        if method != "POST":
+            return 405, {"error": "use POST"}, {}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "request body is not valid JSON"}, {}
+        if not isinstance(request, dict):
+            return 400, {"error": "request body must be a JSON object"}, {}
+        request.setdefault("session_id", "default")
+        if path == "/reset":
+            return 200, await handler(request), {}
+
+        self._stats["requests"] += 1
+        if self._closing:
+            self._stats["rejected"] += 1
+            return 503, {"error": "server is shutting down"}, {}
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((lambda: handler(request), future))
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            return 503, {"error": "server is busy"}, {"Retry-After": "1"}
+
+        try:
+            result = await future
+        except _HTTPError as e:
+            return e.status, {"error": str(e)}, {}
+        except DeadlineExceeded as e:
+            self._stats["errors"] += 1
+            return 504, {"error": str(e)}, {}
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"{path} failed: {e!r}")
+            return 502, {"error": repr(e)}, {}
+        self._stats["completed"] += 1
+        return 200, result, {}
+
+    async def _emotion(self, request: Dict) -> Dict:
+        result = await self.manager.arecognize(
+            str(request["session_id"]), _text_field(request), stream=bool(request.get("stream", False))
+        )
+        return {"emotion": list(result["emotion"]), "response": result["response"]}
+
+    async def _motion(self, request: Dict) -> Dict:
+        return await self.manager.amotion(
+            str(request["session_id"]),
+            _text_field(request),
+            emotion=request.get("emotion"),
+            stream=bool(request.get("stream", False)),
+        )
+
+    async def _gait(self, request: Dict) -> Dict:
+        deadline = request.get("deadline")
+        return await self.manager.agenerate(
+            str(request["session_id"]),
+            _text_field(request),
+            stream=bool(request.get("stream", False)),
+            deadline=float(deadline) if deadline is not None else None,
+        )
+
+    async def _reset(self, request: Dict) -> Dict:
+        # 清空存储中的历史是同步I/O，放到线程池中执行
+        await asyncio.get_running_loop().run_in_executor(None, self.manager.reset_history, str(request["session_id"]))
+        return {"reset": request["session_id"]}
+
+
+def build_manager(args: argparse.Namespace, shared: bool = False) -> Tuple[SessionManager, Optional[MetricsRegistry]]:
+    """根据命令行参数创建会话管理器，每个工作进程各自调用"""
+    from ser.gait_generator import GaitGenerator
+
+    metrics = MetricsRegistry() if args.metrics else None
+    store = SQLiteHistoryStore(args.history_db, shared=shared) if args.history_db else None
+    generator = GaitGenerator(
+        api_key=args.api_key,
+        base_url=args.base_url,
+        model=args.model,
+        max_history=args.max_history,
+        fused=args.fused,
+        fast_path=args.fast_path,
+        deadline=args.deadline,
+        label_mode=args.label_mode,
+        metrics=metrics,
+    )
+    manager = SessionManager(
+        generator=generator,
+        max_history=args.max_history,
+        idle_timeout=args.idle_timeout,
+        history_store=store,
+    )
+    return manager, metrics
+
+
+async def _serve(args: argparse.Namespace, sock: Optional[socket.socket] = None, shared: bool = False):
+    manager, metrics = build_manager(args, shared=shared)
+    server = InferenceServer(
+        manager,
+        concurrency=args.concurrency,
+        max_queue=args.max_queue,
+        shutdown_timeout=args.shutdown_timeout,
+        metrics=metrics,
+    )
+    await server.start(args.host, args.port, sock=sock)
+    if sock is None:
+        print(f"ser server listening on http://{args.host}:{server.port}")
+    await server.serve_forever()
+
+
+def _worker_main(args: argparse.Namespace, sock: socket.socket):
+    asyncio.run(_serve(args, sock=sock, shared=True))
+
+
+def serve(args: argparse.Namespace):
+    """
+    运行服务直到收到SIGTERM/SIGINT
+
+    workers大于1时主进程只负责绑定套接字和管理工作进程：工作进程继承同一个监听套接字，由内核分配连接，
+    意外退出的工作进程会被重新启动（启动即失败的按指数退避重启，连续失败MAX_STARTUP_FAILURES次后停止服务）；
+    收到信号后转发给所有工作进程并等待它们优雅退出。
+    """
+    if args.workers <= 1:
+        asyncio.run(_serve(args))
+        return
+    if args.history_db is None:
+        print("warning: without --history-db each worker keeps its own session history")
+
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.setblocking(False)
+    print(f"ser server listening on http://{args.host}:{sock.getsockname()[1]} with {args.workers} workers")
+    context = multiprocessing.get_context("fork")
+    stopping = False
+
+    def spawn() -> multiprocessing.Process:
+        process = context.Process(target=_worker_main, args=(args, sock), daemon=False)
+        process.start()
+        return process
+
+    workers = [spawn() for _ in range(args.workers)]
+    started = [time.monotonic()] * args.workers
+    failures = [0] * args.workers
+    # 等待重启的工作进程位置及其重启时间
+    restart_at: Dict[int, float] = {}
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    failed = False
+    while not stopping:
+        timeout = max(0.0, min(restart_at.values()) - time.monotonic()) if restart_at else None
+        multiprocessing.connection.wait([process.sentinel for process in workers if process is not None], timeout)
+        if stopping:
+            break
+        now = time.monotonic()
+        for index, process in enumerate(workers):
+            if process is not None and process.exitcode is not None:
+                failures[index] = failures[index] + 1 if now - started[index] < WORKER_MIN_UPTIME else 0
+                if failures[index] >= MAX_STARTUP_FAILURES:
+                    print(f"worker {process.pid} failed to start {failures[index]} times in a row, stopping server")
+                    failed = True
+                    stop(None, None)
+                    break
+                delay = min(RESTART_DELAY * 2 ** max(failures[index] - 1, 0), MAX_RESTART_DELAY)
+                print(f"worker {process.pid} exited with code {process.exitcode}, restarting in {delay:.1f}s")
+                workers[index] = None
+                restart_at[index] = now + delay
+            elif process is None and restart_at.get(index, now + 1) <= now:
+                del restart_at[index]
+                workers[index] = spawn()
+                started[index] = now
+    for process in workers:
+        if process is not None:
+            process.join()
+    sock.close()
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="ser", description="SER命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_serve = subparsers.add_parser("serve", help="启动HTTP/JSON推理服务")
+    parser_serve.add_argument("--host", default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8080)
+    parser_serve.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser_serve.add_argument("--concurrency", type=int, default=32, help="每个进程同时处理的请求数")
+    parser_serve.add_argument("--max-queue", type=int, default=256, help="每个进程等待处理的请求数上限，超过时返回503")
+    parser_serve.add_argument("--shutdown-timeout", type=float, default=10.0, help="优雅退出的最长等待时间（秒）")
+    parser_serve.add_argument("--base-url", default="https://dashscope.aliyuncs.com/compatible-mode/v1")
+    parser_serve.add_argument("--api-key", default=None, help="默认从环境变量DASHSCOPE_API_KEY读取")
+    parser_serve.add_argument("--model", default="qwen3-omni-flash")
+    parser_serve.add_argument("--max-history", type=int, default=4)
+    parser_serve.add_argument("--idle-timeout", type=float, default=1800.0, help="会话空闲多少秒后从内存中淘汰")
+    parser_serve.add_argument("--history-db", default=None, help="SQLite历史数据库路径，多进程共享会话或重启后保留历史")
+    parser_serve.add_argument("--fused", action="store_true", help="步态生成使用融合模式")
+    parser_serve.add_argument("--fast-path", action="store_true", help="运动生成启用本地规则快速通道")
+    parser_serve.add_argument("--label-mode", action="store_true", help="情感识别使用标签模式")
+    parser_serve.add_argument("--deadline", type=float, default=None, help="步态生成的默认截止时间（秒）")
+    parser_serve.add_argument("--metrics", action="store_true", help="记录指标并通过GET /metrics导出")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+from ser.cache import ResponseCache
+from ser.gait_generator import GaitGenerator
+from ser.history_store import HistoryStore
+from ser.metrics import MetricsRegistry, queued_since
+from ser.transport import HttpPoolConfig
+
+
+class Message:
+    """
+    紧凑的对话消息记录，只保留角色和文本
+
+    用户消息中的非文本内容（如音频）不会保存在会话历史里。
+    """
+
+    __slots__ = ("role", "text")
+
+    def __init__(self, role: str, text: str):
+        self.role = role
+        self.text = text
+
+    @classmethod
+    def from_dict(cls, message: Dict) -> "Message":
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(
+                item.get("text", "") for item in content
+                if isinstance(item, dict) and item.get("type") == "text"
+            )
+        return cls(message.get("role", "user"), content or "")
+
+    def to_dict(self) -> Dict:
+        if self.role == "user":
+            return {"role": "user", "content": [{"type": "text", "text": self.text}]}
+        return {"role": self.role, "content": self.text}
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.text)
+
+
+class _SessionState:
+    __slots__ = ("session_id", "records", "last_access", "nbytes", "lock", "alock", "loaded", "handed_out", "users")
+
+    def __init__(self, session_id: str, max_history: Optional[int], stages: Sequence[str]):
+        self.session_id = session_id
+        self.records: Dict[str, deque] = {stage: deque(maxlen=max_history) for stage in stages}
+        self.last_access = time.monotonic()
+        self.nbytes = sys.getsizeof(self)
+        self.lock = threading.Lock()
+        self.alock: Optional[asyncio.Lock] = None
+        self.loaded = False
+        # 交给本次调用的历史消息，_commit据此判断调用只追加了消息还是改写了历史
+        self.handed_out: Dict[str, List[Dict]] = {}
+        # 正在使用（包括等待锁）的调用数，大于0时不会被淘汰
+        self.users = 0
+
+    def history(self) -> Dict[str, List[Dict]]:
+        return {stage: [message.to_dict() for message in records] for stage, records in self.records.items()}
+
+    def absorb(self, history: Dict[str, List[Dict]]) -> int:
+        """用一次调用后的历史替换紧凑历史（调用中历史可能按token预算被压缩过），返回占用字节数的变化"""
+        old_nbytes = self.nbytes
+        for stage, records in self.records.items():
+            records.clear()
+            records.extend(Message.from_dict(message) for message in history.get(stage, []))
+        self.nbytes = sys.getsizeof(self) + sum(
+            message.nbytes() for records in self.records.values() for message in records
+        )
+        return self.nbytes - old_nbytes
+
+
+class SessionHandle:
+    """轻量的会话句柄，所有状态都保存在SessionManager中，句柄本身可以随意创建和丢弃"""
+
+    __slots__ = ("manager", "session_id")
+
+    def __init__(self, manager: "SessionManager", session_id: str):
+        self.manager = manager
+        self.session_id = session_id
+
+    def recognize(self, text: str, stream: bool = False) -> Dict[str, any]:
+        return self.manager.recognize(self.session_id, text, stream=stream)
+
+    def motion(self, text: str, emotion: Optional[str] = None, stream: bool = False) -> Dict[str, float]:
+        return self.manager.motion(self.session_id, text, emotion=emotion, stream=stream)
+
+    def generate(self, text: str, stream: bool = False, deadline: Optional[float] = None) -> Dict[str, any]:
+        return self.manager.generate(self.session_id, text, stream=stream, deadline=deadline)
+
+    async def arecognize(self, text: str, stream: bool = False) -> Dict[str, any]:
+        return await self.manager.arecognize(self.session_id, text, stream=stream)
+
+    async def amotion(self, text: str, emotion: Optional[str] = None, stream: bool = False) -> Dict[str, float]:
+        return await self.manager.amotion(self.session_id, text, emotion=emotion, stream=stream)
+
+    async def agenerate(self, text: str, stream: bool = False, deadline: Optional[float] = None) -> Dict[str, any]:
+        return await self.manager.agenerate(self.session_id, text, stream=stream, deadline=deadline)
+
+    def get_history(self) -> Dict[str, List[Dict]]:
+        return self.manager.get_history(self.session_id)
+
+    def reset_history(self):
+        self.manager.reset_history(self.session_id)
+
+
+class SessionManager:
+    """
+    多会话管理器，所有会话共用一个GaitGenerator（及其连接池），每个会话只保存紧凑的对话历史
+
+    线程安全：不同会话可以并发调用，同一会话的多次调用按顺序执行。
+    会话按最近使用顺序淘汰，空闲超时、会话数上限和内存上限任意一个触发都会淘汰最久未使用的会话；
+    正在调用（或等待同一会话前一次调用）的会话不会被淘汰，会话数和内存可能暂时超过上限。
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        model: str = "qwen3-omni-flash",
+        max_history: Optional[int] = 4,
+        idle_timeout: Optional[float] = 1800.0,
+        max_sessions: Optional[int] = 100000,
+        max_memory_bytes: Optional[int] = 256 * 1024 * 1024,
+        cache: Optional[ResponseCache] = None,
+        http_config: Optional[HttpPoolConfig] = None,
+        generator: Optional[GaitGenerator] = None,
+        max_history_tokens: Optional[int] = None,
+        compaction: str = "drop_oldest",
+        compile_prompt: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+        backend=None,
+        history_store: Optional[HistoryStore] = None,
+    ):
+        """
+        初始化会话管理器
+
+        Args:
+            api_key: API密钥，如果不提供则从环境变量DASHSCOPE_API_KEY读取
+            base_url: API基础URL
+            model: 模型名称
+            max_history: 每个会话每个阶段保留的最大历史消息条数
+            idle_timeout: 会话空闲多少秒后被淘汰，None表示不按空闲时间淘汰
+            max_sessions: 最多保留的会话数，None表示不限制
+            max_memory_bytes: 所有会话历史占用内存的上限（估算值），None表示不限制
+            cache: 回复缓存
+            http_config: HTTP连接池配置
+            generator: 自定义的共享GaitGenerator，提供时忽略上面的模型相关参数
+            max_history_tokens: 每个会话每个阶段每次请求的prompt token预算，None表示只按条数限制
+            compaction: 历史超出token预算时的压缩策略，"drop_oldest"、"labels_only"或"summarize"
+            compile_prompt: 是否编译prompt（去掉缩进和Markdown装饰），减少每次请求的token数
+            metrics: 指标注册表，分阶段（emotion、motion、gait）记录耗时与token用量，None表示不记录
+            backend: 替代chat.completions.create的后端，如ser.replay.RecordingBackend/ReplayBackend
+            history_store: 对话历史存储（见ser.history_store），会话首次使用时从存储加载，每次调用后写回，
+                           被淘汰的会话下次使用时重新加载；历史的键为"<session_id>/<阶段>"（emotion、motion，融合模式还有fused），
+                           与GaitGenerator(history_store=..., session_id=...)一致
+        """
+        self.generator = generator or GaitGenerator(
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+            max_history=max_history,
+            cache=cache,
+            http_config=http_config,
+            max_history_tokens=max_history_tokens,
+            compaction=compaction,
+            compile_prompt=compile_prompt,
+            metrics=metrics,
+            backend=backend,
+        )
+        self.max_history = max_history
+        # 每个会话保存的历史阶段与共享生成器一致（融合模式多一个"fused"）
+        self.stages = self.generator.stages
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = max_memory_bytes
+        self.history_store = history_store
+
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._memory_bytes = 0
+        self._evictions = 0
+        self._last_sweep = time.monotonic()
+
+    def session(self, session_id: str) -> SessionHandle:
+        """获取会话句柄，会话状态在第一次调用时才创建"""
+        return SessionHandle(self, session_id)
+
+    @contextmanager
+    def _using(self, session_id: str):
+        """取得会话状态并在调用期间占用，调用中的会话不会被淘汰，同一会话的调用共用同一把锁"""
+        state = self._acquire(session_id)
+        try:
+            yield state
+        finally:
+            with self._lock:
+                state.users -= 1
+
+    def _acquire(self, session_id: str) -> _SessionState:
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = _SessionState(session_id, self.max_history, self.stages)
+                self._sessions[session_id] = state
+                self._memory_bytes += state.nbytes
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_access = now
+            state.users += 1
+            if self.idle_timeout is not None and now - self._last_sweep > min(self.idle_timeout, 60.0):
+                self._evict_idle(now)
+            self._enforce_limits(keep=session_id)
+            return state
+
+    def _history(self, state: _SessionState) -> Dict[str, List[Dict]]:
+        """取出会话历史，使用存储时首次访问（共享存储时每次访问）先从存储加载"""
+        store = self.history_store
+        if store is not None and (not state.loaded or store.shared):
+            stored = {stage: store.load(f"{state.session_id}/{stage}") for stage in self.stages}
+            with self._lock:
+                delta = state.absorb(stored)
+                if self._sessions.get(state.session_id) is state:
+                    self._memory_bytes += delta
+            state.loaded = True
+        history = state.history()
+        state.handed_out = {stage: list(messages) for stage, messages in history.items()}
+        return history
+
+    def _commit(self, state: _SessionState, history: Dict[str, List[Dict]]):
+        with self._lock:
+            delta = state.absorb(history)
+            if self._sessions.get(state.session_id) is state:
+                self._memory_bytes += delta
+            self._enforce_limits(keep=state.session_id)
+        if self.history_store is None:
+            return
+        for stage, records in state.records.items():
+            key = f"{state.session_id}/{stage}"
+            before, after = state.handed_out.get(stage, []), history.get(stage, [])
+            if len(after) >= len(before) and all(a is b for a, b in zip(before, after)):
+                # 通常每轮只在末尾追加用户消息和回复，只写入新增的消息
+                if len(after) > len(before):
+                    self.history_store.append(key, [Message.from_dict(message).to_dict() for message in after[len(before):]])
+            else:
+                # 历史按token预算压缩过或被清空，整体替换
+                self.history_store.replace(key, [message.to_dict() for message in records])
+
+    async def _ahistory(self, state: _SessionState) -> Dict[str, List[Dict]]:
+        """_history的异步版本：使用存储时在线程池中读写，不阻塞事件循环"""
+        if self.history_store is None:
+            return self._history(state)
+        return await asyncio.get_running_loop().run_in_executor(None, self._history, state)
+
+    async def _acommit(self, state: _SessionState, history: Dict[str, List[Dict]]):
+        if self.history_store is None:
+            self._commit(state, history)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._commit, state, history)
+
+    def _evict_idle(self, now: float):
+        self._last_sweep = now
+        for session_id, state in list(self._sessions.items()):
+            if now - state.last_access <= self.idle_timeout:
+                break
+            if not state.users:
+                self._remove(session_id)
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        # 按最近使用顺序淘汰，跳过正在使用的会话
+        for session_id, state in list(self._sessions.items()):
+            over_count = self.max_sessions is not None and len(self._sessions) > self.max_sessions
+            over_memory = self.max_memory_bytes is not None and self._memory_bytes > self.max_memory_bytes
+            if not (over_count or over_memory):
+                break
+            if state.users or session_id == keep:
+                continue
+            self._remove(session_id)
+
+    def _remove(self, session_id: str, evicted: bool = True):
+        state = self._sessions.pop(session_id)
+        self._memory_bytes -= state.nbytes
+        if evicted:
+            self._evictions += 1
+
+    def recognize(self, session_id: str, text: str, stream: bool = False) -> Dict[str, any]:
+        """
+        在指定会话中识别文本情感，返回值同TextEmotionRecognizer.recognize
+        """
+        with self._using(session_id) as state, queued_since(time.perf_counter()), state.lock:
+            history = self._history(state)
+            result = self.generator.emotion_recognizer.recognize(
+                text, stream=stream, history=history["emotion"]
+            )
+            self._commit(state, history)
+        return result
+
+    def motion(
+        self,
+        session_id: str,
+        text: str,
+        emotion: Optional[str] = None,
+        stream: bool = False,
+    ) -> Dict[str, float]:
+        """
+        在指定会话中根据文本和给定的情感生成运动参数，返回值同MotionGenerator.generate
+        """
+        with self._using(session_id) as state, queued_since(time.perf_counter()), state.lock:
+            history = self._history(state)
+            result = self.generator.motion_generator.generate(
+                text, emotion=emotion, stream=stream, history=history["motion"]
+            )
+            self._commit(state, history)
+        return result
+
+    def generate(
+        self,
+        session_id: str,
+        text: str,
+        stream: bool = False,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, any]:
+        """
+        在指定会话中生成步态参数，参数与返回值同GaitGenerator.generate
+        """
+        with self._using(session_id) as state, queued_since(time.perf_counter()), state.lock:
+            history = self._history(state)
+            result = self.generator.generate(text, stream=stream, history=history, deadline=deadline)
+            self._commit(state, history)
+        return result
+
+    def _async_lock(self, state: _SessionState) -> asyncio.Lock:
+        if state.alock is None:
+            state.alock = asyncio.Lock()
+        return state.alock
+
+    async def arecognize(self, session_id: str, text: str, stream: bool = False) -> Dict[str, any]:
+        """recognize的异步版本"""
+        with self._using(session_id) as state, queued_since(time.perf_counter()):
+            async with self._async_lock(state):
+                history = await self._ahistory(state)
+                result = await self.generator.emotion_recognizer.arecognize(
+                    text, stream=stream, history=history["emotion"]
+                )
+                await self._acommit(state, history)
+        return result
+
+    async def amotion(
+        self,
+        session_id: str,
+        text: str,
+        emotion: Optional[str] = None,
+        stream: bool = False,
+    ) -> Dict[str, float]:
+        """motion的异步版本"""
+        with self._using(session_id) as state, queued_since(time.perf_counter()):
+            async with self._async_lock(state):
+                history = await self._ahistory(state)
+                result = await self.generator.motion_generator.agenerate(
+                    text, emotion=emotion, stream=stream, history=history["motion"]
+                )
+                await self._acommit(state, history)
+        return result
+
+    async def agenerate(
+        self,
+        session_id: str,
+        text: str,
+        stream: bool = False,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, any]:
+        """generate的异步版本"""
+        with self._using(session_id) as state, queued_since(time.perf_counter()):
+            async with self._async_lock(state):
+                history = await self._ahistory(state)
+                result = await self.generator.agenerate(text, stream=stream, history=history, deadline=deadline)
+                await self._acommit(state, history)
+        return result
+
+    def get_history(self, session_id: str) -> Dict[str, List[Dict]]:
+        with self._lock:
+            state = self._sessions.get(session_id)
+        if state is None:
+            if self.history_store is not None:
+                # 存储中只追加，可能比max_history多，与加载到会话时一样只取最近的消息
+                return {
+                    stage: list(deque(self.history_store.load(f"{session_id}/{stage}"), maxlen=self.max_history))
+                    for stage in self.stages
+                }
+            return {stage: [] for stage in self.stages}
+        return state.history()
+
+    def reset_history(self, session_id: str):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and state.users:
+                # 正在使用的会话保留状态（和锁），只清空历史
+                self._memory_bytes += state.absorb({})
+            elif state is not None:
+                self._remove(session_id, evicted=False)
+        if self.history_store is not None:
+            for stage in self.stages:
+                self.history_store.clear(f"{session_id}/{stage}")
+
+    def evict_idle(self):
+        """立即淘汰所有空闲超时的会话"""
+        if self.idle_timeout is None:
+            return
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取会话统计
+
+        Returns:
+            包含sessions（当前会话数）、memory_bytes（历史占用内存估算）、evictions（累计淘汰数）的字典
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._memory_bytes,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,373 @@
+"""
+请求合并（singleflight）：相同的请求同时在途时只向上游发起一次，结果分发给所有等待者
+
+多个机器人听到同一条广播指令、界面重试等场景下，相同prompt和历史的请求会几乎同时到达。
+请求参数（模型、完整消息列表、是否流式等，不含timeout）完全相同即视为相同请求；
+每个等待者按自己的timeout等待响应和流式的下一个块，超时抛出DeadlineExceeded，不影响其他等待者。
+流式请求的所有等待者按相同顺序收到同一组块，后加入的等待者先收到已经到达的块。
+上游请求结束后立即从在途表中移除，之后的相同请求会重新发起（需要复用结果时使用ResponseCache）。
+作为LLMClient的后端使用，多个客户端共用同一个实例时可以在客户端之间合并：
+
+    backend = CoalescingBackend()
+    generators = [GaitGenerator(backend=backend) for _ in range(8)]
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional
+
+from ser.resilience import DeadlineExceeded
+
+
+def coalesce_key(params: Dict) -> str:
+    """请求摘要，timeout只影响等待时间，不参与比较"""
+    payload = {name: value for name, value in params.items() if name != "timeout"}
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _timeout_of(params: Dict) -> Optional[float]:
+    """等待者自己的timeout（秒），没有或不是数值（如httpx.Timeout）时为None"""
+    timeout = params.get("timeout")
+    return timeout if isinstance(timeout, (int, float)) else None
+
+
+class _Flight:
+    """一次在途的上游请求，流式时保存已读到的块，供所有等待者按顺序读取"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.ready = threading.Event()
+        self.response = None
+        self.error: Optional[BaseException] = None
+        self.chunks: List = []
+        self.done = False
+        self.readers = 0
+        self.iterator = None
+        self.pump_lock = threading.Lock()
+
+
+class _AsyncFlight:
+
+    def __init__(self, key: str, task: "asyncio.Task"):
+        self.key = key
+        self.task = task
+        self.waiters = 0
+        self.chunks: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self.iterator = None
+        # 正在从上游读取下一个块的任务，所有等待者共用，单个等待者超时不会中断读取
+        self.reading: Optional["asyncio.Task"] = None
+
+
+class CoalescingBackend:
+    """
+    LLMClient的请求合并后端
+
+    第一个到达的请求（leader）实际发起调用，之后到达的相同请求等待并共享结果，调用失败时所有等待者收到同一个异常。
+    流式输出由读得最快的等待者从上游拉取，其他等待者读取缓冲；所有等待者都提前关闭时关闭上游的HTTP流。
+    同步调用与异步调用分别合并，线程安全。
+    同步调用中正在从上游拉取的等待者受leader请求的timeout约束（openai的timeout对每次读取生效），
+    其他等待者按自己的timeout等待；异步调用的读取在共享任务中进行，每个等待者都按自己的timeout等待。
+    """
+
+    def __init__(self, inner=None):
+        """
+        初始化请求合并后端
+
+        Args:
+            inner: 实际发起请求的后端，None表示直接使用LLMClient的OpenAI客户端
+        """
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[tuple, _AsyncFlight] = {}
+        self._stats = {"requests": 0, "upstream": 0, "coalesced": 0}
+
+    def stats(self) -> Dict[str, float]:
+        """
+        获取合并统计
+
+        Returns:
+            包含requests（收到的请求数）、upstream（实际发起的上游调用数）、coalesced（节省的调用数）、
+            in_flight（当前在途的上游调用数）、coalesce_rate的字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights) + len(self._async_flights)
+        stats["coalesce_rate"] = stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def _count(self, leader: bool):
+        self._stats["requests"] += 1
+        self._stats["upstream" if leader else "coalesced"] += 1
+
+    def _retire(self, flights: Dict, key, flight):
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def create(self, client, **params):
+        key = coalesce_key(params)
+        stream = bool(params.get("stream"))
+        timeout = _timeout_of(params)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(key)
+            if stream:
+                flight.readers += 1
+            self._count(leader)
+
+        if leader:
+            try:
+                if self.inner is not None:
+                    response = self.inner.create(client, **params)
+                else:
+                    response = client.chat.completions.create(**params)
+                if stream:
+                    flight.response = response
+                    flight.iterator = iter(response)
+                else:
+                    flight.response = response
+                    flight.done = True
+            except BaseException as e:
+                flight.error = e
+                flight.done = True
+            if flight.done:
+                self._retire(self._flights, key, flight)
+            flight.ready.set()
+        elif not flight.ready.wait(timeout):
+            if stream:
+                self._release(flight)
+            raise DeadlineExceeded("coalesced request timed out")
+
+        if flight.iterator is None:
+            if flight.error is not None:
+                if stream:
+                    self._release(flight)
+                raise flight.error
+            return flight.response
+        return _SharedStream(self, flight, timeout)
+
+    def _pump(self, flight: _Flight, index: int, timeout: Optional[float] = None):
+        """读取上游的下一个块；其他等待者正在读取时最多等待timeout秒"""
+        if not flight.pump_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise DeadlineExceeded("coalesced stream timed out")
+        try:
+            if index < len(flight.chunks) or flight.done:
+                return
+            try:
+                chunk = next(flight.iterator)
+            except StopIteration:
+                chunk, flight.done = None, True
+            except BaseException as e:
+                chunk, flight.done, flight.error = None, True, e
+            if chunk is not None:
+                flight.chunks.append(chunk)
+            if flight.done:
+                self._retire(self._flights, flight.key, flight)
+        finally:
+            flight.pump_lock.release()
+
+    def _release(self, flight: _Flight):
+        """等待者读完或提前关闭；没有等待者且上游未读完时关闭上游的HTTP流"""
+        with self._lock:
+            flight.readers -= 1
+            abandoned = flight.readers == 0 and not flight.done
+            if abandoned:
+                flight.done = True
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+        if abandoned:
+            _close(flight.response)
+
+    async def acreate(self, client, **params):
+        loop = asyncio.get_running_loop()
+        key = (id(loop), coalesce_key(params))
+        stream = bool(params.get("stream"))
+        timeout = _timeout_of(params)
+        with self._lock:
+            flight = self._async_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._async_flights[key] = _AsyncFlight(key, loop.create_task(self._acall(client, params)))
+                flight.task.add_done_callback(lambda task: self._settle(flight, stream))
+            flight.waiters += 1
+            if stream:
+                flight.readers += 1
+            self._count(leader)
+
+        try:
+            # shield：一个等待者被取消或超时不影响其他等待者，全部离开时才取消上游请求
+            response = await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+        except asyncio.CancelledError:
+            self._aleave(flight, stream)
+            raise
+        except asyncio.TimeoutError:
+            if not flight.task.done():
+                self._aleave(flight, stream)
+                raise DeadlineExceeded("coalesced request timed out")
+            # 超时的同时上游请求刚好结束
+            response = flight.task.result()
+        if not stream:
+            return response
+        if flight.iterator is None:
+            flight.iterator = response.__aiter__()
+        return _AsyncSharedStream(self, flight, timeout)
+
+    def _aleave(self, flight: _AsyncFlight, stream: bool):
+        """等待者在拿到结果前离开
+
+        计数总是要减掉。上游请求未结束时，最后一个等待者离开就取消上游请求；
+        已经结束的流式请求如果没有读者了，关闭上游的流。
+        """
+        with self._lock:
+            flight.waiters -= 1
+            if stream:
+                flight.readers -= 1
+            if not flight.task.done():
+                abandoned = flight.waiters == 0
+            else:
+                abandoned = (stream and flight.readers == 0 and not flight.done
+                             and not flight.task.cancelled() and flight.task.exception() is None)
+                if abandoned:
+                    flight.done = True
+            if abandoned and self._async_flights.get(flight.key) is flight:
+                del self._async_flights[flight.key]
+        if not abandoned:
+            return
+        if not flight.task.done():
+            flight.task.cancel()
+        else:
+            # 等待者可能正被取消，不能在这里await，交给事件循环关闭
+            asyncio.ensure_future(_aclose(flight.task.result()))
+
+    def _settle(self, flight: _AsyncFlight, stream: bool):
+        """上游调用结束：非流式或失败时立即移出在途表，流式的要等流读完"""
+        if not stream or flight.task.cancelled() or flight.task.exception() is not None:
+            self._retire(self._async_flights, flight.key, flight)
+
+    async def _acall(self, client, params: Dict):
+        if self.inner is not None:
+            return await self.inner.acreate(client, **params)
+        return await client.chat.completions.create(**params)
+
+    async def _apump(self, flight: _AsyncFlight, index: int, timeout: Optional[float] = None):
+        """等待共享的读取任务读到下一个块，最多等待timeout秒"""
+        if index < len(flight.chunks) or flight.done:
+            return
+        if flight.reading is None:
+            flight.reading = asyncio.ensure_future(self._aread(flight))
+        try:
+            await asyncio.wait_for(asyncio.shield(flight.reading), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("coalesced stream timed out")
+
+    async def _aread(self, flight: _AsyncFlight):
+        try:
+            flight.chunks.append(await flight.iterator.__anext__())
+        except StopAsyncIteration:
+            flight.done = True
+        except BaseException as e:
+            flight.done, flight.error = True, e
+        finally:
+            flight.reading = None
+        if flight.done:
+            self._retire(self._async_flights, flight.key, flight)
+
+    async def _arelease(self, flight: _AsyncFlight):
+        with self._lock:
+            flight.readers -= 1
+            abandoned = flight.readers == 0 and not flight.done
+            if abandoned:
+                flight.done = True
+                if self._async_flights.get(flight.key) is flight:
+                    del self._async_flights[flight.key]
+        if abandoned:
+            if flight.reading is not None:
+                flight.reading.cancel()
+            await _aclose(flight.task.result())
+
+
+def _close(stream):
+    try:
+        if hasattr(stream, 'close'):
+            stream.close()
+    except Exception:
+        pass
+
+
+async def _aclose(stream):
+    try:
+        if hasattr(stream, 'close'):
+            await stream.close()
+    except Exception:
+        pass
+
+
+class _SharedStream:
+    """一个等待者看到的流：从缓冲的第一个块开始按顺序读取，读到缓冲末尾时从上游拉取"""
+
+    def __init__(self, backend: CoalescingBackend, flight: _Flight, timeout: Optional[float] = None):
+        self.backend = backend
+        self.flight = flight
+        self.timeout = timeout
+        self._closed = False
+
+    def __iter__(self):
+        flight = self.flight
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                self.backend._pump(flight, index, self.timeout)
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.backend._release(self.flight)
+
+
+class _AsyncSharedStream:
+
+    def __init__(self, backend: CoalescingBackend, flight: _AsyncFlight, timeout: Optional[float] = None):
+        self.backend = backend
+        self.flight = flight
+        self.timeout = timeout
+        self._closed = False
+
+    async def __aiter__(self):
+        flight = self.flight
+        index = 0
+        try:
+            while True:
+                if index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await self.backend._apump(flight, index, self.timeout)
+        finally:
+            await self.close()
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            await self.backend._arelease(self.flight)
@@ -26,6 +26,40 @@ EMOTION_PROMPT_CN = """你是一个专业的情感识别助手。请严格按照
                     → 包含"不好意思"等害羞表达 → [EMOTION:5]
                     """
 
+EMOTION_LABEL_PROMPT_CN = """你是一个情感分类器。判断用户输入的情感状态，只输出情绪标签，不要输出任何对话内容。
+
+                    **情绪编号：**
+                    - normal (0)：中性、平静、常规对话，无明显情绪色彩
+                    - happy (1)：包含积极词汇、兴奋、愉悦、满足的表达
+                    - tired (2)：提及疲劳、压力、困难、需要休息的内容
+                    - confident (3)：展现自信、肯定、自我鼓励的表达
+                    - afraid (4)：表现担忧、恐惧、不安、紧张的情绪
+                    - shy (5)：包含害羞、谦虚、不好意思、腼腆的表达
+
+                    **输出格式：**[EMOTION:编号]
+
+                    **示例：**
+                    用户说："这个项目很难，但我相信我一定可以的！" → [EMOTION:3]
+                    用户说："谢谢你的夸奖哦，我都有点不好意思了" → [EMOTION:5]
+                    """
+
+EMOTION_LABEL_JSON_PROMPT_CN = """你是一个情感分类器。判断用户输入的情感状态，只输出JSON，不要输出任何对话内容。
+
+                    **情绪编号：**
+                    - normal (0)：中性、平静、常规对话，无明显情绪色彩
+                    - happy (1)：包含积极词汇、兴奋、愉悦、满足的表达
+                    - tired (2)：提及疲劳、压力、困难、需要休息的内容
+                    - confident (3)：展现自信、肯定、自我鼓励的表达
+                    - afraid (4)：表现担忧、恐惧、不安、紧张的情绪
+                    - shy (5)：包含害羞、谦虚、不好意思、腼腆的表达
+
+                    **输出格式：**{"emotion": 编号}
+
+                    **示例：**
+                    用户说："这个项目很难，但我相信我一定可以的！" → {"emotion": 3}
+                    用户说："谢谢你的夸奖哦，我都有点不好意思了" → {"emotion": 5}
+                    """
+
 EMOTION_PROMPT_EN = """You are a professional emotion recognition assistant. Please strictly follow these rules:
 
                     **Core Tasks:**
@@ -152,4 +186,54 @@ GAIT_PROMPT_EN = """You are a robot gait generator. Based on the user's current
 
                 User input: "I really want to rest[EMOTION:tired]"
                 Output: {"y_vel": 0.0, "yaw_vel": 0.0, "freq_offset": -0.1}
-                """
\ No newline at end of file
+                """
+
+GAIT_EMOTION_PROMPT_CN = """你是一个机器人情感识别与步态生成器。请在一次回复中同时完成情感识别和步态参数生成。
+
+                **核心任务：**
+                1. 分析用户文本内容，判断用户当前的情感状态
+                2. 根据情感和文本中的指令，生成机器人步态参数
+                3. 不要输出任何对话内容，只输出下面规定的两行
+
+                **情感判断规则：**
+                - normal (0)：中性、平静、常规对话，无明显情绪色彩
+                - happy (1)：包含积极词汇、兴奋、愉悦、满足的表达
+                - tired (2)：提及疲劳、压力、困难、需要休息的内容
+                - confident (3)：展现自信、肯定、自我鼓励的表达
+                - afraid (4)：表现担忧、恐惧、不安、紧张的情绪
+                - shy (5)：包含害羞、谦虚、不好意思、腼腆的表达
+
+                **步态参数范围：**
+                - `y_vel`（平移速度）：-0.3 ~ 0.3，默认0.0
+                - `yaw_vel`（转向速度）：-0.3 ~ 0.3，默认0.0
+                - `freq_offset`（步频变化）：-0.1 ~ 0.1，默认0.0
+
+                **步态生成规则：**
+                - 用户明确说"向左跨/移动/走"时 y_vel 为正值（0.1-0.3），"向右跨/移动/走"时为负值（-0.3至-0.1）
+                - 用户明确说"向左转"时 yaw_vel 为正值（0.1-0.3），"向右转"时为负值（-0.3至-0.1）
+                - 急切程度：强烈词汇（快、赶紧、迅速）→ 较大绝对值；普通表达 → 较小绝对值
+                - 正面情绪（happy/confident）：freq_offset 为正值（0.02-0.1）
+                - 负面情绪（tired/afraid）：freq_offset 为负值（-0.1至-0.02）
+                - 中性情绪（normal/shy）：freq_offset 接近0（-0.01-0.01）
+                - 无明确指令时，对应参数保持为0.0
+
+                **输出格式（严格两行）：**
+                [EMOTION:编号]
+                {"y_vel": 0.0, "yaw_vel": 0.0, "freq_offset": 0.0}
+
+                **示例：**
+                用户输入："快向左转！"
+                输出：
+                [EMOTION:0]
+                {"y_vel": 0.0, "yaw_vel": 0.2, "freq_offset": 0.0}
+
+                用户输入："这个项目很难，但我相信我一定可以的！"
+                输出：
+                [EMOTION:3]
+                {"y_vel": 0.0, "yaw_vel": 0.0, "freq_offset": 0.05}
+
+                用户输入："好想休息一下"
+                输出：
+                [EMOTION:2]
+                {"y_vel": 0.0, "yaw_vel": 0.0, "freq_offset": -0.1}
+                """
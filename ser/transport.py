@@ -0,0 +1,171 @@
+import asyncio
+import threading
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+class HttpPoolConfig(NamedTuple):
+    """
+    HTTP连接池配置，相同base_url与相同配置的客户端共用一个连接池
+
+    http2=True需要额外安装h2：pip install "httpx[http2]"
+    """
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 60.0
+    read_timeout: float = 60.0
+    http2: bool = False
+
+
+class _PoolStats:
+    """统计请求数与新建连接数，通过httpcore的trace扩展得知每次请求是否建立了新的TCP连接"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def on_request(self, request: httpx.Request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def aon_request(self, request: httpx.Request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.atrace
+
+    def trace(self, event_name: str, info: Dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    async def atrace(self, event_name: str, info: Dict):
+        self.trace(event_name, info)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            requests, opened = self.requests, self.connections_opened
+        reused = max(requests - opened, 0)
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_rate": reused / requests if requests else 0.0,
+        }
+
+
+def _origin(base_url: str) -> str:
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class TransportRegistry:
+    """
+    进程级的HTTP客户端注册表，按base_url的origin共享keep-alive连接
+
+    同步客户端在整个进程内共享；异步客户端与事件循环绑定，每个事件循环各自一份。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[tuple, httpx.Client] = {}
+        self._async_clients: Dict[tuple, tuple] = {}
+        self._stats: Dict[str, _PoolStats] = {}
+
+    def _build_kwargs(self, config: HttpPoolConfig) -> Dict:
+        return {
+            "trust_env": False,
+            "http2": config.http2,
+            "timeout": httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        }
+
+    def _pool_stats(self, origin: str) -> _PoolStats:
+        if origin not in self._stats:
+            self._stats[origin] = _PoolStats()
+        return self._stats[origin]
+
+    def get_client(self, base_url: str, config: Optional[HttpPoolConfig] = None) -> httpx.Client:
+        """
+        获取指定base_url共享的同步HTTP客户端
+
+        Args:
+            base_url: API基础URL
+            config: 连接池配置，默认使用HttpPoolConfig()
+
+        Returns:
+            共享的httpx.Client
+        """
+        config = config or HttpPoolConfig()
+        origin = _origin(base_url)
+        key = (origin, config)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None or client.is_closed:
+                stats = self._pool_stats(origin)
+                client = httpx.Client(
+                    event_hooks={"request": [stats.on_request]},
+                    **self._build_kwargs(config),
+                )
+                self._clients[key] = client
+            return client
+
+    def get_async_client(self, base_url: str, config: Optional[HttpPoolConfig] = None) -> httpx.AsyncClient:
+        """
+        获取当前事件循环中指定base_url共享的异步HTTP客户端，必须在事件循环内调用
+
+        Args:
+            base_url: API基础URL
+            config: 连接池配置，默认使用HttpPoolConfig()
+
+        Returns:
+            共享的httpx.AsyncClient
+        """
+        config = config or HttpPoolConfig()
+        origin = _origin(base_url)
+        loop = asyncio.get_running_loop()
+        key = (origin, config, id(loop))
+        with self._lock:
+            # 事件循环关闭后，绑定在上面的连接不能再用
+            for stale_key, (stale_loop, _) in list(self._async_clients.items()):
+                if stale_loop.is_closed():
+                    del self._async_clients[stale_key]
+            entry = self._async_clients.get(key)
+            if entry is None or entry[0] is not loop or entry[1].is_closed:
+                stats = self._pool_stats(origin)
+                client = httpx.AsyncClient(
+                    event_hooks={"request": [stats.aon_request]},
+                    **self._build_kwargs(config),
+                )
+                entry = (loop, client)
+                self._async_clients[key] = entry
+            return entry[1]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        获取各origin的连接复用统计
+
+        Returns:
+            以origin为键的字典，每项包含requests、connections_opened、connections_reused、reuse_rate
+        """
+        with self._lock:
+            return {origin: stats.snapshot() for origin, stats in self._stats.items()}
+
+    def close(self):
+        """关闭所有共享的同步客户端；异步客户端随事件循环一起丢弃"""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._async_clients.clear()
+
+
+default_registry = TransportRegistry()
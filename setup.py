@@ -1,5 +1,4 @@
-from setuptools import find_packages
-from distutils.core import setup
+from setuptools import find_packages, setup
 
 setup(
     name='ser',
@@ -12,5 +11,9 @@ setup(
     install_requires=[
         'openai',
         'httpx',
-    ]
+        'numpy',
+    ],
+    entry_points={
+        'console_scripts': ['ser=ser.server:main'],
+    },
 )